@@ -0,0 +1,144 @@
+# app/artifacts.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# joblib (and with it scikit-learn) is only imported when a model set is
+# first requested, so processes that never score a model never pay for it.
+MODEL_DIR = os.getenv("MODEL_DIR", "./trained_models")
+MAX_RESIDENT_SETS = int(os.getenv("MAX_RESIDENT_MODEL_SETS", "2"))
+MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r") or None
+# "stand-in" scores every model set with seeded stand-ins instead of the
+# trained pickles (replay mode, see replay.py)
+MODEL_SOURCE = os.getenv("MODEL_SOURCE", "files")
+
+MODEL_SETS = {
+    "SetA": {"rf": "rf_model.pkl", "gb": "gb_model.pkl"},
+    "SetB": {"rf": "rf1_model.pkl", "gb": "gb1_model.pkl"}
+}
+
+
+def _estimate_nbytes(model) -> int:
+    """Approximate resident size of a (tree ensemble) estimator's arrays."""
+    total = 0
+    tree = getattr(model, "tree_", None)
+    if tree is not None:
+        from sklearn.tree._tree import NODE_DTYPE
+        total += tree.node_count * NODE_DTYPE.itemsize + tree.value.nbytes
+    estimators = getattr(model, "estimators_", None)
+    if estimators is not None:
+        flat = estimators.ravel() if hasattr(estimators, "ravel") else estimators
+        total += sum(_estimate_nbytes(est) for est in flat)
+    return total
+
+
+class ArtifactManager:
+    """
+    Loads ML artifact sets on first use and keeps at most `max_resident`
+    of them in memory, evicting the least recently used set.
+
+    Arrays stored as plain ndarrays in the pickles are memory-mapped
+    (joblib `mmap_mode`), and sets loaded before a prefork worker pool forks
+    are shared copy-on-write by every child.
+    """
+
+    def __init__(self, model_sets: dict = MODEL_SETS, model_dir: str = MODEL_DIR,
+                 max_resident: int = MAX_RESIDENT_SETS, mmap_mode: str | None = MMAP_MODE,
+                 stand_ins: bool = MODEL_SOURCE == "stand-in"):
+        self.model_sets = model_sets
+        self.model_dir = model_dir
+        self.max_resident = max_resident
+        self.mmap_mode = mmap_mode
+        self.stand_ins = stand_ins
+        self._resident = OrderedDict()
+        self._load_seconds = {}
+        self._resident_bytes = {}
+        self.loads = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def is_available(self, set_name: str) -> bool:
+        files = self.model_sets.get(set_name)
+        return bool(files) and (self.stand_ins or all(os.path.exists(os.path.join(self.model_dir, f)) for f in files.values()))
+
+    def get(self, set_name: str) -> dict | None:
+        """Returns {"RandomForest": ..., "GradientBoosting": ...} or None if unavailable."""
+        with self._lock:
+            if set_name in self._resident:
+                self._resident.move_to_end(set_name)
+                return self._resident[set_name]
+
+            if set_name not in self.model_sets:
+                return None
+            try:
+                artifacts = self._load(set_name)
+            except FileNotFoundError as e:
+                print(f"❌ Could not load artifact set '{set_name}'. It will be unavailable. Error: {e}")
+                return None
+
+            self._resident[set_name] = artifacts
+            while len(self._resident) > self.max_resident:
+                evicted, _ = self._resident.popitem(last=False)
+                self._resident_bytes.pop(evicted, None)
+                self.evictions += 1
+                print(f"Evicted ML artifact set '{evicted}'.")
+            return artifacts
+
+    def register(self, set_name: str, artifacts: dict):
+        """Makes an already-built artifact set resident (e.g. recorded stand-ins)."""
+        with self._lock:
+            self._resident[set_name] = artifacts
+            self._resident_bytes[set_name] = sum(_estimate_nbytes(m) for m in artifacts.values())
+            self._resident.move_to_end(set_name)
+
+    def preload(self, set_names=None):
+        for set_name in set_names or self.model_sets:
+            self.get(set_name)
+
+    def stats(self) -> dict:
+        return {
+            "resident_sets": list(self._resident),
+            "max_resident": self.max_resident,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "load_seconds": dict(self._load_seconds),
+            "resident_bytes": dict(self._resident_bytes),
+        }
+
+    def _load(self, set_name: str) -> dict:
+        started = time.perf_counter()
+        if self.stand_ins:
+            from .replay import stand_in_artifacts
+            artifacts = stand_in_artifacts()
+        else:
+            artifacts = self._load_files(set_name)
+        elapsed = time.perf_counter() - started
+
+        self.loads += 1
+        self._load_seconds[set_name] = round(elapsed, 4)
+        self._resident_bytes[set_name] = sum(_estimate_nbytes(m) for m in artifacts.values())
+        print(f"✅ ML artifact set '{set_name}' loaded in {elapsed:.2f}s{' (stand-ins)' if self.stand_ins else ''}.")
+        return artifacts
+
+    def _load_files(self, set_name: str) -> dict:
+        import joblib
+
+        files = self.model_sets[set_name]
+        return {
+            "RandomForest": joblib.load(os.path.join(self.model_dir, files['rf']), mmap_mode=self.mmap_mode),
+            "GradientBoosting": joblib.load(os.path.join(self.model_dir, files['gb']), mmap_mode=self.mmap_mode)
+        }
+
+
+# --- Shared Manager ---
+_manager = None
+
+
+def get_artifact_manager() -> ArtifactManager:
+    global _manager
+    if _manager is None:
+        _manager = ArtifactManager()
+    return _manager
@@ -1,17 +1,26 @@
 # app/auth.py
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from dataclasses import dataclass
+import os
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, database
+from .lru import LRUCache
 
 # --- Configuration ---
 SECRET_KEY = "YOUR_SUPER_SECRET_KEY" # Keep this secret!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Resolved users are cached per token subject, so authenticated requests skip the database
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -22,15 +31,49 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt is deliberately slow, so request handlers run it in the threadpool
+async def verify_password_async(plain_password, hashed_password):
+    return await run_in_threadpool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await run_in_threadpool(get_password_hash, password)
+
+# --- Principal Cache ---
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers (detached from any session)."""
+    id: int
+    username: str
+    email: str
+
+    @classmethod
+    def from_user(cls, user: models.User):
+        return cls(id=user.id, username=user.username, email=user.email)
+
+# TTL + LRU cache of principals keyed by username (the token subject)
+principal_cache = LRUCache(PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+# Any change to a user row made through the ORM drops its cached principal
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    principal_cache.invalidate(target.username)
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        principal_cache.invalidate(old_username)
+
 # --- User Creation ---
-def create_user(db: Session, user: models.UserCreate):
-    hashed_password = get_password_hash(user.password)
+async def create_user(db: AsyncSession, user: models.UserCreate):
+    hashed_password = await get_password_hash_async(user.password)
     db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
 # --- JWT Token Creation ---
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -40,7 +83,7 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 # --- Dependency to get current user ---
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -53,7 +96,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    # Only a cache miss opens a database session
+    async with database.AsyncSessionLocal() as db:
+        user = await get_user_by_username(db, username)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    principal = Principal.from_user(user)
+    principal_cache.put(principal.username, principal)
+    return principal
\ No newline at end of file
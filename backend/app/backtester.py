@@ -1,180 +1,148 @@
 import pandas as pd
 import numpy as np
 import pandas_ta as ta
-import yfinance as yf
-import joblib
 import warnings
-from . import strategies
-
-# --- Artifact Registry for Multiple Model Sets ---
-print("Loading all ML artifact sets...")
-ARTIFACT_REGISTRY = {}
-MODEL_SETS = {
-    "SetA": {"rf": "rf_model.pkl", "gb": "gb_model.pkl"},
-    "SetB": {"rf": "rf1_model.pkl", "gb": "gb1_model.pkl"}
-}
-
-for set_name, files in MODEL_SETS.items():
-    try:
-        ARTIFACT_REGISTRY[set_name] = {
-            "RandomForest": joblib.load(f"./trained_models/{files['rf']}"),
-            "GradientBoosting": joblib.load(f"./trained_models/{files['gb']}")
-        }
-        print(f"✅ ML artifact set '{set_name}' loaded successfully.")
-    except FileNotFoundError as e:
-        print(f"❌ Could not load artifact set '{set_name}'. It will be unavailable. Error: {e}")
-
+from . import engine, inference
+from .barstore import BarStore
+from .execution import ExecutionConfig, ledger_summary, simulate_execution
+from .results import CANDLE_DTYPE, RESULT_FORMAT, ROLLING_KEY, TRADES_KEY, encode_arrays, encode_trades
+from .rules import CUSTOM_STRATEGY, compile_rules, compute_rule_signals
+from .signals import compute_signals
+from .market_data import get_market_data_store
+# The metric functions moved to metrics.py; they are still importable from here
+from .metrics import (calculate_performance_metrics, calculate_performance_metrics_batch, encode_rolling_metrics,
+                      format_key_metrics, trade_metrics)
+from .timeframes import normalize_interval
 
 def get_ml_predictions(model_set_name: str, model_name: str, data: pd.DataFrame):
-    if model_set_name not in ARTIFACT_REGISTRY:
-        warnings.warn(f"Model set '{model_set_name}' not available. Skipping ML predictions.")
-        return pd.Series(0, index=data.index)
-
-    artifacts = ARTIFACT_REGISTRY[model_set_name]
-    
-    # THIS IS A CRITICAL PLACEHOLDER
-    # You must replace this with the *exact* same feature engineering steps used in your training notebook.
-    feature_columns = ['Open', 'High', 'Low', 'Close', 'Volume'] # Placeholder - REPLACE ME
-    features = data[feature_columns].copy()
-    features.dropna(inplace=True)
-
-    if features.empty:
-        return pd.Series(0, index=data.index)
-
-    if model_name == "Ensemble":
-        pred_rf = artifacts["RandomForest"].predict(features)
-        pred_gb = artifacts["GradientBoosting"].predict(features)
-        predictions = (pred_rf + pred_gb) / 2
-    elif model_name in artifacts:
-        model = artifacts[model_name]
-        predictions = model.predict(features)
-    else:
-        return pd.Series(0, index=data.index)
-
-    return pd.Series(predictions, index=features.index)
+    return get_ml_predictions_many(model_set_name, model_name, {None: data})[None]
+
+def get_ml_predictions_many(model_set_name: str, model_name: str, frames: dict):
+    """
+    Scores several frames (e.g. one per ticker) in one batched, cached pass.
+    Returns {key: prediction Series}; unavailable models yield zeros.
+    """
+    features = {key: inference.build_features(data) for key, data in frames.items()}
+    predictions = inference.predict_many(model_set_name, model_name, features)
+    if predictions is None:
+        warnings.warn(f"Model '{model_name}' from set '{model_set_name}' not available. Skipping ML predictions.")
+        return {key: pd.Series(0, index=data.index) for key, data in frames.items()}
 
-def calculate_performance_metrics(equity_curve: pd.Series):
-    """Calculates key performance metrics from an equity curve."""
-    if equity_curve.empty or equity_curve.iloc[0] == 0:
-        return {
-            "total_return_pct": 0,
-            "annualized_return_pct": 0,
-            "sharpe_ratio": 0,
-            "max_drawdown_pct": 0
-        }
-
-    total_return_pct = (equity_curve.iloc[-1] / equity_curve.iloc[0] - 1) * 100
-    
-    # Calculate annualized return
-    days = (equity_curve.index[-1] - equity_curve.index[0]).days
-    if days > 0:
-        annualized_return_pct = ((1 + total_return_pct / 100) ** (365.0 / days) - 1) * 100
-    else:
-        annualized_return_pct = 0
+    return {
+        key: pd.Series(predictions[key], index=features[key].index) if key in predictions else pd.Series(0, index=data.index)
+        for key, data in frames.items()
+    }
 
-    # Calculate Sharpe Ratio
-    daily_returns = equity_curve.pct_change().dropna()
-    if daily_returns.std() > 0:
-        # Assuming risk-free rate is 0
-        sharpe_ratio = (daily_returns.mean() / daily_returns.std()) * np.sqrt(252)
-    else:
-        sharpe_ratio = 0
+def ml_confirmation(ml_preds: pd.Series, index: pd.Index) -> np.ndarray:
+    """Boolean mask of the bars in `index` the ML model confirms (missing predictions do not confirm)."""
+    # --- Signal Combination Logic ---
+    # Here we decide how to combine the technical signal and the ML signal.
+    # Let's use the ML prediction as a confirmation filter.
+    # 1 means ML confirms, 0 means ML does not.
+    # A threshold of 0.5 is common for binary classifiers.
+    return ml_preds.reindex(index).fillna(0).to_numpy() > 0.5
+
+def apply_ml_confirmation(data: pd.DataFrame, ml_model_set: str, ml_model_name: str, ml_preds: pd.Series | None = None) -> pd.DataFrame:
+    if ml_preds is None:
+        print(f"Generating predictions with {ml_model_name} from {ml_model_set}...")
+        ml_preds = get_ml_predictions(ml_model_set, ml_model_name, data)
+    # For selling, we might not need ML confirmation, or we could use a different logic.
+    # Here, we'll stick to the technical sell signal.
+    return data.assign(buy_signal=data['buy_signal'].to_numpy(dtype=bool) & ml_confirmation(ml_preds, data.index))
 
-    # Calculate Max Drawdown
-    rolling_max = equity_curve.cummax()
-    drawdown = (equity_curve - rolling_max) / rolling_max
-    max_drawdown_pct = drawdown.min() * 100
+def no_progress(stage: str, percent: float | None = None, **details):
+    pass
 
-    return {
-        "total_return_pct": round(total_return_pct, 2),
-        "annualized_return_pct": round(annualized_return_pct, 2),
-        "sharpe_ratio": round(sharpe_ratio, 2),
-        "max_drawdown_pct": round(max_drawdown_pct, 2)
-    }
+def no_checkpoint(build):
+    """Default `checkpoint` callback; `build()` would return the report of the work done so far."""
+    pass
 
-def run_simulation(strategy_json: dict, ticker: str, start_date: str, end_date: str):
+def strategy_signals(bars: BarStore, strategy_json: dict):
+    """(buy, sell, start) of a built-in strategy, or of the compiled (and cached) plan of a Custom strategy's rules."""
+    strategy_type = strategy_json.get("strategyType")
+    if strategy_type == CUSTOM_STRATEGY:
+        return compute_rule_signals(bars, strategy_json.get("rules"))
+    return compute_signals(bars.series('Close'), strategy_type)
+
+def execution_config(strategy_json: dict) -> ExecutionConfig:
+    """The strategy's execution settings; a Custom strategy's stop-loss/take-profit rules fill in exits left unset."""
+    settings = dict(strategy_json.get("execution") or {})
+    if strategy_json.get("strategyType") == CUSTOM_STRATEGY:
+        for name, value in compile_rules(strategy_json.get("rules")).exits.items():
+            if settings.get(name) is None:
+                settings[name] = value
+    return ExecutionConfig.from_json(settings)
+
+def run_simulation(strategy_json: dict, ticker: str, start_date: str, end_date: str, vectorized: bool = True, progress=no_progress):
     strategy_type = strategy_json.get("strategyType")
     ml_model_set = strategy_json.get("ml_model_set")
     ml_model_name = strategy_json.get("ml_model")
+    execution = execution_config(strategy_json)
+    interval = normalize_interval(strategy_json.get("interval"))
     
-    # 1. Fetch and prepare data
-    data = yf.download(ticker, start=start_date, end=end_date, progress=False)
+    # 1. Fetch and prepare data (coarser intervals are resampled from cached finer bars)
+    data = get_market_data_store().get_bars(ticker, start_date, end_date, interval)
     if data.empty: raise ValueError("No data fetched.")
     
     # Ensure OHLC data is present
     ohlc_columns = ['Open', 'High', 'Low', 'Close']
     if not all(col in data.columns for col in ohlc_columns):
-        raise ValueError("OHLC data not found in yfinance download.")
-
-    # 2. Get signals from the base technical strategy
-    if strategy_type == "TrendFollowing":
-        data = strategies.momentum_strategy(data)
-    elif strategy_type == "MeanReversion":
-        data = strategies.mean_reversion_strategy(data)
-    elif strategy_type == "Volatility":
-        data = strategies.volatility_strategy(data)
-    else:
-        raise ValueError(f"Unknown strategy type: {strategy_type}")
+        raise ValueError("OHLC data not found in market data.")
+    # The bar store holds views of the fetched columns; later stages add to it instead of copying
+    bars = BarStore.from_frame(data).dropna()
+    del data
+    progress("data_fetched", 20, bars=len(bars))
+
+    # 2. Get signals from the base technical strategy (indicators are freed as soon as the signals exist)
+    buy, sell, start = strategy_signals(bars, strategy_json)
+    if start >= len(bars):
+        raise ValueError(f"Not enough data for {strategy_type}: only {len(bars)} bars.")
+    bars = bars.slice(start)
+    bars.add('buy_signal', buy[start:])
+    bars.add('sell_signal', sell[start:])
+    del buy, sell
+    progress("signals_computed", 50)
 
     # 3. Get ML predictions if a model is selected
     if ml_model_set and ml_model_name:
         print(f"Generating predictions with {ml_model_name} from {ml_model_set}...")
-        ml_preds = get_ml_predictions(ml_model_set, ml_model_name, data)
-        data = data.join(ml_preds.rename('ml_prediction')).fillna(0)
-        # --- Signal Combination Logic ---
-        # Here we decide how to combine the technical signal and the ML signal.
-        # Let's use the ML prediction as a confirmation filter.
-        # 1 means ML confirms, 0 means ML does not.
-        # A threshold of 0.5 is common for binary classifiers.
-        ml_confirmation = (data['ml_prediction'] > 0.5).astype(int)
-        data['buy_signal'] = data['buy_signal'] & ml_confirmation
-        # For selling, we might not need ML confirmation, or we could use a different logic.
-        # Here, we'll stick to the technical sell signal.
-        data['sell_signal'] = data['sell_signal']
+        ml_preds = get_ml_predictions(ml_model_set, ml_model_name, bars.frame(inference.FEATURE_COLUMNS))
+        bars['buy_signal'][:] &= ml_confirmation(ml_preds, bars.index)
+        del ml_preds
+        progress("predictions_ready", 65)
     
-    # 4. Core Simulation Loop
-    initial_cash = 100000
-    cash = initial_cash
-    shares = 0
-    equity = []
-
-    for date, row in data.iterrows():
-        current_price = row['Close']
-        
-        # Sell Logic
-        if row['sell_signal'] and shares > 0:
-            cash = shares * current_price
-            shares = 0
-            # print(f"{date}: Sold at {current_price:.2f}, New Cash: {cash:.2f}")
-        
-        # Buy Logic
-        elif row['buy_signal'] and cash > 0:
-            shares_to_buy = cash / current_price
-            shares = shares_to_buy
-            cash = 0
-            # print(f"{date}: Bought at {current_price:.2f}, Shares: {shares:.2f}")
-
-        portfolio_value = cash + shares * current_price
-        equity.append({'date': date, 'portfolio_value': portfolio_value})
-
-    equity_df = pd.DataFrame(equity).set_index('date')
+    # 4. Core Simulation (the default execution settings reproduce the frictionless engine exactly)
+    if vectorized:
+        equity, ledger = simulate_execution(bars['Open'], bars['High'], bars['Low'], bars['Close'],
+                                            bars['buy_signal'], bars['sell_signal'], execution)
+    else:
+        if not execution.frictionless:
+            raise ValueError("The reference engine only supports frictionless execution.")
+        equity, ledger = engine.simulate_reference(bars['Close'], bars['buy_signal'], bars['sell_signal']), None
+    bars.drop('buy_signal', 'sell_signal')
+    progress("simulated", 85, bars=len(equity))
     
-    # 5. Calculate Performance & Format Output
-    metrics = calculate_performance_metrics(equity_df['portfolio_value'])
+    # 5. Calculate Performance & Format Output (alpha and beta are measured against holding the ticker)
+    metrics = calculate_performance_metrics(pd.Series(equity, index=bars.index, copy=False), benchmark=bars['Close'])
+    if ledger is not None:
+        metrics.update(trade_metrics(ledger, equity, bars.index))
+    progress("metrics_ready", 95, metrics=metrics)
     
-    # Prepare candlestick data
-    candlestick_data = data[ohlc_columns].reset_index().to_dict(orient='records')
-
+    # Time series are stored as compact packed columns (see results.py)
     results = {
-        "keyMetrics": [
-            {"label": "Final Portfolio Value", "value": f"₹{equity_df['portfolio_value'].iloc[-1]:,.2f}"},
-            {"label": "Total Return", "value": f"{metrics['total_return_pct']}%", "positive": metrics['total_return_pct'] > 0},
-            {"label": "Annualized Return", "value": f"{metrics['annualized_return_pct']}%"},
-            {"label": "Sharpe Ratio", "value": f"{metrics['sharpe_ratio']}"},
-            {"label": "Max Drawdown", "value": f"{metrics['max_drawdown_pct']}%", "positive": metrics['max_drawdown_pct'] > -15},
-        ],
-        "performanceData": equity_df.reset_index().to_dict(orient='records'),
-        "candlestickData": candlestick_data
+        "format": RESULT_FORMAT,
+        "keyMetrics": format_key_metrics(metrics, equity[-1]),
+        "metrics": metrics,
+        "performanceData": encode_arrays(bars.index, {'portfolio_value': equity}, 'date'),
     }
+    rolling = encode_rolling_metrics(equity, bars.index)
+    if rolling is not None:
+        results[ROLLING_KEY] = rolling
+    del equity
+    if ledger is not None:
+        results["execution"] = execution.to_json()
+        results["tradeSummary"] = ledger_summary(ledger)
+        results[TRADES_KEY] = encode_trades(bars.index, ledger)
+    results["candlestickData"] = encode_arrays(bars.index, {col: bars[col] for col in ohlc_columns}, 'Date', dtype=CANDLE_DTYPE)
     print("Simulation finished.")
     return results
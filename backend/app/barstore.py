@@ -0,0 +1,85 @@
+# app/barstore.py
+
+import numpy as np
+import pandas as pd
+
+# --- Columnar Bar Store ---
+# One backtest's working set: a shared date index plus named 1-D arrays.
+# Fetched OHLCV columns are held as views of the market data frame, signals
+# are added as bool columns, and slicing returns views of every column, so
+# the pipeline never copies the bars between its stages.
+
+
+class BarStore:
+    def __init__(self, index: pd.DatetimeIndex, columns: dict):
+        self.index = index
+        self._columns = {}
+        for name, values in columns.items():
+            self.add(name, values)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, columns: list | None = None) -> "BarStore":
+        """Wraps the columns of `frame` without copying them (float columns stay views)."""
+        names = list(frame.columns) if columns is None else columns
+        return cls(frame.index, {name: frame[name].to_numpy() for name in names})
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self._columns.values())
+
+    def add(self, name: str, values, dtype=None):
+        """Adds (or replaces) a column; e.g. `dtype=bool` for signals or `np.float32` for plotted indicators."""
+        values = np.asarray(values, dtype=dtype)
+        if values.shape != (len(self.index),):
+            raise ValueError(f"Column '{name}' has shape {values.shape}; expected ({len(self.index)},).")
+        self._columns[name] = values
+
+    def drop(self, *names: str):
+        for name in names:
+            self._columns.pop(name, None)
+
+    def slice(self, start: int | None = None, stop: int | None = None) -> "BarStore":
+        """Rows [start, stop) of every column, as views."""
+        return BarStore(self.index[start:stop], {name: values[start:stop] for name, values in self._columns.items()})
+
+    def take(self, rows) -> "BarStore":
+        """Rows at the increasing positions (or slice) `rows`; views when they form one contiguous run."""
+        if isinstance(rows, slice):
+            return self.slice(rows.start, rows.stop)
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+            return self.slice(int(rows[0]), int(rows[-1]) + 1)
+        return BarStore(self.index[rows], {name: values[rows] for name, values in self._columns.items()})
+
+    def dropna(self, columns: list | None = None) -> "BarStore":
+        """Drops rows with a NaN in any of `columns` (default: every float column); copies only if some exist."""
+        names = self.columns if columns is None else columns
+        missing = np.zeros(len(self), dtype=bool)
+        for name in names:
+            if self._columns[name].dtype.kind == 'f':
+                missing |= np.isnan(self._columns[name])
+        if not missing.any():
+            return self
+        keep = ~missing
+        return BarStore(self.index[keep], {name: values[keep] for name, values in self._columns.items()})
+
+    def series(self, name: str) -> pd.Series:
+        return pd.Series(self._columns[name], index=self.index, name=name, copy=False)
+
+    def frame(self, columns: list | None = None) -> pd.DataFrame:
+        """A DataFrame over the stored arrays (no copy) for pandas-based consumers."""
+        names = self.columns if columns is None else columns
+        return pd.DataFrame({name: self._columns[name] for name in names}, index=self.index, copy=False)
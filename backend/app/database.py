@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -11,18 +13,123 @@ load_dotenv()
 # --- Database Configuration ---
 # Get the database URL from the environment variable.
 # This is much more secure than writing the password directly in the code.
+# Replay runs (MARKET_DATA_SOURCE other than "yfinance", see replay.py) may
+# leave it unset and use a local SQLite file; any other deployment has to
+# set it, since API and workers would otherwise each write their own file.
+REPLAY_DATABASE_URL = "sqlite:///./algosphere.db"
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
-    raise ValueError("No DATABASE_URL found. Please set it in your .env file.")
+    if os.getenv("MARKET_DATA_SOURCE", "yfinance") == "yfinance":
+        raise ValueError("No DATABASE_URL found. Please set it in your .env file "
+                         "(sqlite:///... for a local database).")
+    print(f"No DATABASE_URL found; replay mode uses {REPLAY_DATABASE_URL}.")
+    DATABASE_URL = REPLAY_DATABASE_URL
 
-# The connect_args is important for cloud databases like Neon that may pool connections.
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"options": "-c timezone=utc"} # Recommended for consistency
-)
+# --- Connection Pool Configuration ---
+# The API's async pool serves many concurrent requests; the sync pool is only
+# used by Celery tasks (one job at a time per worker process), so it stays small.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds; below typical cloud idle timeouts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "False")
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", "2"))
+DB_SYNC_MAX_OVERFLOW = int(os.getenv("DB_SYNC_MAX_OVERFLOW", "3"))
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def _pool_options(url, pool_size: int, max_overflow: int) -> dict:
+    if _is_sqlite(url):
+        return {}  # SQLite uses its own single-file pools
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def sync_engine_options(database_url: str) -> tuple:
+    url = make_url(database_url)
+    if url.drivername == "postgres":
+        url = url.set(drivername="postgresql")
+    if _is_sqlite(url):
+        connect_args = {"check_same_thread": False}
+    else:
+        # The connect_args is important for cloud databases like Neon that may pool connections.
+        connect_args = {"options": "-c timezone=utc"} # Recommended for consistency
+    return url, {"connect_args": connect_args, **_pool_options(url, DB_SYNC_POOL_SIZE, DB_SYNC_MAX_OVERFLOW)}
+
+
+def async_engine_options(database_url: str) -> tuple:
+    """
+    Translates a sync database URL to its async driver. asyncpg does not
+    understand libpq query parameters such as `sslmode`, so those are moved
+    into `connect_args`.
+    """
+    url = make_url(database_url)
+    backend = url.drivername.split("+")[0]
+    if "+" not in url.drivername and backend in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+
+    connect_args = {}
+    if url.drivername == "postgresql+asyncpg":
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode:
+            connect_args["ssl"] = sslmode  # asyncpg accepts the libpq sslmode names
+        connect_args["server_settings"] = {"timezone": "utc"}
+        url = url.set(query=query)
+    return url, {"connect_args": connect_args, **_pool_options(url, DB_POOL_SIZE, DB_MAX_OVERFLOW)}
+
+
+# --- Sync Engine (Celery tasks) ---
+_sync_url, _sync_options = sync_engine_options(DATABASE_URL)
+engine = create_engine(_sync_url, **_sync_options)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- Async Engine (FastAPI request handlers) ---
+_async_url, _async_options = async_engine_options(DATABASE_URL)
+async_engine = create_async_engine(_async_url, **_async_options)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# --- SQLite Concurrency ---
+# With SQLite, workers write results while the API reads them: WAL lets
+# readers proceed during a write, and the busy timeout makes concurrent
+# writers wait for the lock instead of failing.
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
+if _is_sqlite(_sync_url) and _sync_url.database not in (None, "", ":memory:"):
+    event.listen(engine, "connect", _configure_sqlite)
+    event.listen(async_engine.sync_engine, "connect", _configure_sqlite)
+
 Base = declarative_base()
 
+
+# --- Session Dependencies ---
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
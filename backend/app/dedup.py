@@ -0,0 +1,197 @@
+# app/dedup.py
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .market_data import get_market_data_store
+
+# --- Configuration ---
+# "memory://" keeps the registry in-process (tests, single-process runs).
+DEDUP_URL = os.getenv("DEDUP_URL", "redis://localhost:6379/3")
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+# An in-flight claim lapses unless its running job refreshes it (every third
+# of the TTL), so a job lost with its worker stops absorbing identical
+# requests. The TTL also bounds how long a job may wait in the queue before
+# an identical request starts another one.
+CLAIM_TTL_SECONDS = int(os.getenv("DEDUP_CLAIM_TTL_SECONDS", "300"))
+KEY_PREFIX = "backtest-job:"
+
+# Fields that label a request but do not change its result
+IGNORED_FIELDS = {"strategyName"}
+
+
+def job_key(kind: str, strategy_json: dict, ticker: str | None, start_date: str, end_date: str) -> str:
+    """Content address of a request: canonicalized strategy JSON plus the run window."""
+    strategy = {k: v for k, v in strategy_json.items() if k not in IGNORED_FIELDS}
+    canonical = json.dumps(
+        {"kind": kind, "strategy": strategy, "ticker": ticker, "start": start_date, "end": end_date},
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def data_version(tickers: list, interval: str = "1d") -> float | None:
+    """Latest market-data cache update across `tickers` (None if any is uncached)."""
+    store = get_market_data_store()
+    versions = [store.data_version(t, interval) for t in tickers]
+    if not versions or any(v is None for v in versions):
+        return None
+    return max(versions)
+
+
+# --- Registries ---
+# Each key maps to {"job_id": ..., "data_version": ...}. The data version is
+# filled in when the job completes; until then the entry marks an in-flight job.
+# `refresh` extends an in-flight entry of the given job and nothing else.
+
+class MemoryRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry and entry[1] < time.time():
+            del self._entries[key]
+            return None
+        return entry
+
+    def claim(self, key: str, value: dict, ttl: int) -> bool:
+        with self._lock:
+            if self._live(key):
+                return False
+            self._entries[key] = (value, time.time() + ttl)
+            return True
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: dict, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+
+    def refresh(self, key: str, job_id: str, ttl: int) -> bool:
+        with self._lock:
+            entry = self._live(key)
+            if not entry or entry[0]["job_id"] != job_id or entry[0].get("data_version") is not None:
+                return False
+            self._entries[key] = (entry[0], time.time() + ttl)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisRegistry:
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def claim(self, key: str, value: dict, ttl: int) -> bool:
+        return bool(self._client.set(KEY_PREFIX + key, json.dumps(value), nx=True, ex=ttl))
+
+    def get(self, key: str) -> dict | None:
+        raw = self._client.get(KEY_PREFIX + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: dict, ttl: int):
+        self._client.set(KEY_PREFIX + key, json.dumps(value), ex=ttl)
+
+    def refresh(self, key: str, job_id: str, ttl: int) -> bool:
+        entry = self.get(key)
+        if not entry or entry["job_id"] != job_id or entry.get("data_version") is not None:
+            return False
+        return bool(self._client.expire(KEY_PREFIX + key, ttl))
+
+    def delete(self, key: str):
+        self._client.delete(KEY_PREFIX + key)
+
+
+_registry = None
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = MemoryRegistry() if DEDUP_URL.startswith("memory://") else RedisRegistry(DEDUP_URL)
+    return _registry
+
+
+# --- Job Coalescing ---
+
+def claim_job(key: str, job_id: str, tickers: list, is_failed, interval: str = "1d") -> tuple:
+    """
+    Returns (job_id, is_new). Identical in-flight or completed requests share
+    the existing job; completed ones are reused only while the market data
+    they ran on (the `interval` bars of `tickers`) is still the latest.
+    `is_failed(job_id)` lets the caller report jobs that failed or were lost.
+    """
+    registry = get_registry()
+    entry = {"job_id": job_id, "data_version": None}
+    if registry.claim(key, entry, CLAIM_TTL_SECONDS):
+        return job_id, True
+
+    existing = registry.get(key)
+    if existing is not None:
+        completed_version = existing.get("data_version")
+        stale = completed_version is not None and data_version(tickers, interval) != completed_version
+        if not stale and not is_failed(existing["job_id"]):
+            return existing["job_id"], False
+
+    registry.set(key, entry, CLAIM_TTL_SECONDS)
+    return job_id, True
+
+
+@contextlib.contextmanager
+def keep_claimed(key: str | None, job_id: str):
+    """Refreshes the in-flight claim of `job_id` from a background thread while the block runs."""
+    if not key:
+        yield
+        return
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(CLAIM_TTL_SECONDS / 3):
+            try:
+                if not get_registry().refresh(key, job_id, CLAIM_TTL_SECONDS):
+                    return  # Completed, released or taken over
+            except Exception as e:
+                print(f"Could not refresh the claim of job {job_id}: {e}")
+
+    thread = threading.Thread(target=heartbeat, name=f"claim-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def mark_completed(key: str, job_id: str, tickers: list, interval: str = "1d"):
+    """
+    Records the market-data version a finished job ran against. Without one
+    (a ticker's bars were evicted meanwhile) the result could never be told
+    stale, and the entry would pass for an in-flight job, so it is released.
+    """
+    registry = get_registry()
+    existing = registry.get(key)
+    if existing is None or existing["job_id"] == job_id:
+        version = data_version(tickers, interval)
+        if version is None:
+            release_job(key, job_id)
+            return
+        registry.set(key, {"job_id": job_id, "data_version": version}, RESULT_CACHE_TTL_SECONDS)
+
+
+def release_job(key: str, job_id: str):
+    """Drops a failed job so the next identical request starts fresh."""
+    registry = get_registry()
+    existing = registry.get(key)
+    if existing is not None and existing["job_id"] == job_id:
+        registry.delete(key)
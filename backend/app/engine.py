@@ -0,0 +1,136 @@
+# app/engine.py
+
+import numpy as np
+import pandas as pd
+
+# --- Simulation Engine ---
+# Turns the buy/sell signal columns produced by `strategies.py` into a
+# long/flat equity curve. The vectorized path only walks the bars where a
+# signal fires; everything between two events is filled with array ops.
+
+INITIAL_CASH = 100000
+
+
+def simulate_reference(close: np.ndarray, buy: np.ndarray, sell: np.ndarray, initial_cash: float = INITIAL_CASH) -> np.ndarray:
+    """
+    Reference bar-by-bar loop. Kept for parity testing against the
+    vectorized engine; do not use it on the hot path.
+    """
+    cash = initial_cash
+    shares = 0
+    equity = np.empty(len(close), dtype=np.float64)
+
+    for i in range(len(close)):
+        current_price = close[i]
+
+        # Sell Logic
+        if sell[i] and shares > 0:
+            cash = shares * current_price
+            shares = 0
+
+        # Buy Logic
+        elif buy[i] and cash > 0:
+            shares = cash / current_price
+            cash = 0
+
+        equity[i] = cash + shares * current_price
+
+    return equity
+
+
+def simulate_vectorized(close: np.ndarray, buy: np.ndarray, sell: np.ndarray, initial_cash: float = INITIAL_CASH) -> np.ndarray:
+    """
+    Vectorized equivalent of `simulate_reference`.
+    The state machine is only stepped on bars with a buy or sell signal, and
+    the cash/share holdings are forward-filled between them. The arithmetic
+    mirrors the reference loop exactly, so both curves are bit-identical.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    buy = np.asarray(buy, dtype=bool)
+    sell = np.asarray(sell, dtype=bool)
+    n = len(close)
+
+    events = np.flatnonzero(buy | sell)
+    trade_bars = []
+    trade_cash = []
+    trade_shares = []
+
+    cash = initial_cash
+    shares = 0
+    for i in events:
+        if sell[i] and shares > 0:
+            cash = shares * close[i]
+            shares = 0
+        elif buy[i] and cash > 0:
+            shares = cash / close[i]
+            cash = 0
+        else:
+            continue
+        trade_bars.append(i)
+        trade_cash.append(cash)
+        trade_shares.append(shares)
+
+    # Index of the most recent trade at or before each bar (-1 = none yet)
+    last_trade = np.full(n, -1, dtype=np.int64)
+    if trade_bars:
+        last_trade[trade_bars] = np.arange(len(trade_bars))
+        np.maximum.accumulate(last_trade, out=last_trade)
+
+    cash_held = np.append(np.asarray(trade_cash, dtype=np.float64), initial_cash)[last_trade]
+    shares_held = np.append(np.asarray(trade_shares, dtype=np.float64), 0.0)[last_trade]
+
+    return cash_held + shares_held * close
+
+
+def simulate(data: pd.DataFrame, initial_cash: float = INITIAL_CASH, vectorized: bool = True) -> pd.DataFrame:
+    """
+    Runs the long/flat simulation over a frame with `Close`, `buy_signal`
+    and `sell_signal` columns and returns the equity curve as a DataFrame
+    indexed by date with a single `portfolio_value` column.
+    Pass `vectorized=False` to use the reference loop.
+    """
+    close = data['Close'].to_numpy(dtype=np.float64)
+    buy = data['buy_signal'].to_numpy(dtype=bool)
+    sell = data['sell_signal'].to_numpy(dtype=bool)
+
+    engine = simulate_vectorized if vectorized else simulate_reference
+    equity = engine(close, buy, sell, initial_cash)
+
+    index = data.index.rename('date')
+    return pd.DataFrame({'portfolio_value': equity}, index=index)
+
+
+def simulate_matrix(close: np.ndarray, buy: np.ndarray, sell: np.ndarray, initial_cash: float = INITIAL_CASH) -> np.ndarray:
+    """
+    Long/flat simulation for many signal columns at once.
+    `buy` and `sell` are (bars, combinations) boolean matrices sharing one
+    `close` series; returns the (bars, combinations) equity matrix.
+
+    Positions are forward-filled from the signal events and equity is the
+    compounded bar-to-bar return while long, so values match
+    `simulate_vectorized` up to floating-point rounding. Columns where a
+    buy and a sell fire on the same bar toggle the position and are
+    delegated to `simulate_vectorized`.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n, k = buy.shape
+
+    # 1 = go long, 0 = go flat, NaN = keep the previous state
+    target = np.full((n, k), np.nan)
+    target[buy & ~sell] = 1.0
+    target[sell & ~buy] = 0.0
+
+    last_event = np.where(np.isnan(target), -1, np.arange(n)[:, None])
+    np.maximum.accumulate(last_event, axis=0, out=last_event)
+    position = np.where(last_event >= 0, np.take_along_axis(target, np.maximum(last_event, 0), axis=0), 0.0)
+
+    bar_returns = np.ones(n)
+    bar_returns[1:] = close[1:] / close[:-1]
+    growth = np.ones((n, k))
+    growth[1:] = np.where(position[:-1] > 0, bar_returns[1:, None], 1.0)
+    equity = initial_cash * np.cumprod(growth, axis=0)
+
+    for col in np.flatnonzero((buy & sell).any(axis=0)):
+        equity[:, col] = simulate_vectorized(close, buy[:, col], sell[:, col], initial_cash)
+
+    return equity
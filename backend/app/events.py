@@ -0,0 +1,162 @@
+# app/events.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# "memory://" selects the in-process broker (tests, single-process runs).
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "redis://localhost:6379/2")
+EVENT_TTL_SECONDS = int(os.getenv("EVENT_TTL_SECONDS", "3600"))
+# A stream without any event for this long is closed; clients reconnect
+# (EventSource does so on its own) and find the stored result if there is one.
+EVENT_IDLE_TIMEOUT_SECONDS = float(os.getenv("EVENT_IDLE_TIMEOUT_SECONDS", "300"))
+CHANNEL_PREFIX = "backtest-events:"
+
+TERMINAL_STAGES = {"completed", "failed"}
+
+
+def make_event(job_id: str, stage: str, percent: float | None = None, **details) -> dict:
+    return {"job_id": job_id, "stage": stage, "percent": percent, "time": time.time(), **details}
+
+
+# --- Brokers ---
+# Both brokers keep the latest event per job for EVENT_TTL_SECONDS, so a
+# subscriber that connects after the job has started immediately receives
+# the current state. Subscriptions end after the final event or after
+# EVENT_IDLE_TIMEOUT_SECONDS without one.
+
+class LocalBroker:
+    """In-process pub/sub stand-in for Redis."""
+
+    def __init__(self):
+        self._last = OrderedDict()  # job id -> (event, expiry), oldest publish first
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._last and next(iter(self._last.values()))[1] < now:
+            self._last.popitem(last=False)
+
+    def publish(self, job_id: str, event: dict):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._last.pop(job_id, None)
+            self._last[job_id] = (event, now + EVENT_TTL_SECONDS)
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def subscribe(self, job_id: str):
+        loop, queue = asyncio.get_running_loop(), asyncio.Queue()
+        entry = (loop, queue)
+        with self._lock:
+            self._expire(time.time())
+            self._subscribers.setdefault(job_id, []).append(entry)
+            last = self._last.get(job_id, (None, None))[0]
+        try:
+            if last is not None:
+                yield last
+                if last["stage"] in TERMINAL_STAGES:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_IDLE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    return
+                if event is last:
+                    continue
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[job_id]
+                subscribers.remove(entry)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+
+class RedisBroker:
+    """Redis pub/sub broker shared by the API and the Celery workers."""
+
+    def __init__(self, url: str):
+        import redis
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._async_client = None  # (event loop, client); subscribers share its connection pool
+
+    def _subscriber_client(self):
+        import redis.asyncio as aioredis
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client[0] is not loop:
+            self._async_client = (loop, aioredis.Redis.from_url(self.url))
+        return self._async_client[1]
+
+    def publish(self, job_id: str, event: dict):
+        payload = json.dumps(event)
+        pipe = self._client.pipeline()
+        pipe.set(f"{CHANNEL_PREFIX}{job_id}:last", payload, ex=EVENT_TTL_SECONDS)
+        pipe.publish(f"{CHANNEL_PREFIX}{job_id}", payload)
+        pipe.execute()
+
+    async def subscribe(self, job_id: str):
+        client = self._subscriber_client()
+        pubsub = client.pubsub()
+        loop = asyncio.get_running_loop()
+        try:
+            # Subscribe before reading the last event so nothing is missed in between
+            await pubsub.subscribe(f"{CHANNEL_PREFIX}{job_id}")
+            last = await client.get(f"{CHANNEL_PREFIX}{job_id}:last")
+            if last is not None:
+                event = json.loads(last)
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+            deadline = loop.time() + EVENT_IDLE_TIMEOUT_SECONDS
+            while (remaining := deadline - loop.time()) > 0:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+                if message is None or message["type"] != "message":
+                    continue
+                event = json.loads(message["data"])
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+                deadline = loop.time() + EVENT_IDLE_TIMEOUT_SECONDS
+        finally:
+            await pubsub.aclose()  # Returns its connection to the shared pool
+
+
+# --- Shared Broker ---
+_broker = None
+
+
+def get_event_broker():
+    global _broker
+    if _broker is None:
+        _broker = LocalBroker() if EVENT_BROKER_URL.startswith("memory://") else RedisBroker(EVENT_BROKER_URL)
+    return _broker
+
+
+def set_event_broker(broker):
+    global _broker
+    _broker = broker
+
+
+def publish_progress(job_id: str, stage: str, percent: float | None = None, **details):
+    """Publishes a progress event; failures never interrupt the backtest itself."""
+    try:
+        get_event_broker().publish(job_id, make_event(job_id, stage, percent, **details))
+    except Exception as e:
+        print(f"Could not publish progress for job {job_id}: {e}")
+
+
+def progress_reporter(job_id: str):
+    """Returns a `progress(stage, percent, **details)` callback bound to one job."""
+    def progress(stage: str, percent: float | None = None, **details):
+        publish_progress(job_id, stage, percent, **details)
+    return progress
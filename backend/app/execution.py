@@ -0,0 +1,609 @@
+# app/execution.py
+
+import math
+from bisect import bisect_left
+from dataclasses import asdict, dataclass, fields
+
+import numpy as np
+import pandas as pd
+from .engine import INITIAL_CASH
+
+# --- Execution Model ---
+# Turns buy/sell signals into fills with commission, slippage, position
+# sizing, protective exits and an optional short side. Like the vectorized
+# engine, it only works on the bars where something can happen (signals and
+# stop/target triggers) and forward-fills the holdings between fills.
+
+FILL_MODES = ("close", "next_open")
+SIZING_MODES = ("fractional", "integer")
+SLIPPAGE_MODELS = ("fixed", "volatility")
+
+# Ledger codes; rendered as names by the results endpoint
+SIDES = {1: "long", -1: "short"}
+EXIT_REASONS = {0: "signal", 1: "stop_loss", 2: "take_profit", 3: "open"}
+_SIGNAL, _STOP_LOSS, _TAKE_PROFIT, _OPEN = 0, 1, 2, 3
+_BOTH = 2  # Event target when a buy and a sell fire on the same bar
+
+
+@dataclass(frozen=True)
+class ExecutionConfig:
+    """
+    Fill and cost assumptions for one backtest. The defaults are the
+    frictionless model: all-in/all-out at the signal bar's close, no costs,
+    long only.
+    """
+    commission_bps: float = 0.0  # Of traded notional
+    commission_per_trade: float = 0.0  # Fixed amount per order
+    slippage_bps: float = 0.0
+    slippage_model: str = "fixed"  # "volatility" adds a multiple of the recent return volatility
+    slippage_vol_multiplier: float = 0.0
+    slippage_window: int = 20
+    fill: str = "close"  # Or "next_open": signals on a bar's close fill at the next bar's open
+    sizing: str = "fractional"  # Or "integer" shares
+    position_pct: float = 1.0  # Fraction of equity committed per entry
+    stop_loss_pct: float | None = None
+    take_profit_pct: float | None = None
+    allow_short: bool = False
+
+    def __post_init__(self):
+        if self.fill not in FILL_MODES:
+            raise ValueError(f"Unknown fill mode: {self.fill}")
+        if self.sizing not in SIZING_MODES:
+            raise ValueError(f"Unknown sizing mode: {self.sizing}")
+        if self.slippage_model not in SLIPPAGE_MODELS:
+            raise ValueError(f"Unknown slippage model: {self.slippage_model}")
+        if not 0 < self.position_pct <= 1:
+            raise ValueError("position_pct must be in (0, 1].")
+
+    @classmethod
+    def from_json(cls, settings: dict | None) -> "ExecutionConfig":
+        """Builds the config from a strategy's `execution` settings; unset (None) fields keep their default."""
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (settings or {}).items() if k in names and v is not None})
+
+    @property
+    def frictionless(self) -> bool:
+        return self == ExecutionConfig()
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+def slippage_fractions(close: np.ndarray, config: ExecutionConfig) -> np.ndarray | float:
+    """Adverse price move per fill as a fraction of the price, per bar (volatility model) or constant."""
+    fixed = config.slippage_bps / 10_000
+    if config.slippage_model != "volatility" or not config.slippage_vol_multiplier:
+        return fixed
+    returns = pd.Series(close).pct_change()
+    volatility = returns.rolling(config.slippage_window, min_periods=2).std().fillna(0.0).to_numpy()
+    return fixed + config.slippage_vol_multiplier * volatility
+
+
+# --- Simulation ---
+# Without protective exits or bars carrying both signals, the position
+# after a signal is that signal's target (1 long, -1 short, 0 flat), so
+# trades open and close only on the events where the target changes. The
+# trades, their stop/target triggers and the re-entries after a triggered
+# exit are all found with array operations (see `_schedule`); only the cash
+# bookkeeping steps through the trades one by one. Bars with both signals,
+# whose outcome depends on the current position, and entries that cannot
+# be funded fall back to stepping through the signal events in order.
+
+TRIGGER_CHUNK = 1 << 16  # Bars searched per batch of stop/target scans
+
+
+def simulate_execution(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                       buy: np.ndarray, sell: np.ndarray, config: ExecutionConfig = ExecutionConfig(),
+                       initial_cash: float = INITIAL_CASH):
+    """
+    Simulates `config` over one series of bars. Returns the equity curve
+    (marked at each close) and the trade ledger as a dict of arrays (see
+    `LEDGER_COLUMNS`). With the default config the equity curve is
+    bit-identical to `engine.simulate_vectorized`.
+
+    A buy opens a long (covering any short); a sell closes a long and, with
+    `allow_short`, opens a short. Stops are checked intrabar before the
+    signal on the same bar; if both levels are touched on one bar the stop
+    is assumed to fill first. Stop exits are market orders (slipped, filled
+    at the open when the bar gaps through the level); take-profits are
+    limit orders filled at the level or a better open.
+    """
+    bars = _Bars(open_, high, low, close, config)
+    buy = np.asarray(buy, dtype=bool)
+    sell = np.asarray(sell, dtype=bool)
+
+    events = np.flatnonzero(buy | sell)
+    both = buy[events] & sell[events]
+    targets = np.where(both, _BOTH, np.where(buy[events], 1, -1 if config.allow_short else 0))
+
+    settled = None
+    if not both.any():
+        settled = _settle(_schedule(bars, events, targets), bars, initial_cash)
+    if settled is None:
+        settled = _simulate_events(bars, events, targets, initial_cash)
+    fill_bars, fill_cash, fill_shares, ledger = settled
+
+    # Index of the most recent fill at or before each bar (-1 = none yet)
+    last_fill = np.full(bars.n, -1, dtype=np.int64)
+    if len(fill_bars):
+        last_fill[fill_bars] = np.arange(len(fill_bars))
+        np.maximum.accumulate(last_fill, out=last_fill)
+    cash_held = np.append(np.asarray(fill_cash, dtype=np.float64), float(initial_cash))[last_fill]
+    shares_held = np.append(np.asarray(fill_shares, dtype=np.float64), 0.0)[last_fill]
+
+    return cash_held + shares_held * bars.close, ledger
+
+
+class _Bars:
+    """Price arrays and per-bar cost assumptions shared by the simulation steps."""
+
+    def __init__(self, open_, high, low, close, config: ExecutionConfig):
+        self.open = np.asarray(open_, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.n = len(self.close)
+        self.config = config
+        self.slip = slippage_fractions(self.close, config)
+        self.next_open = config.fill == "next_open"
+        self.has_exits = config.stop_loss_pct is not None or config.take_profit_pct is not None
+        self.commission_rate = config.commission_bps / 10_000
+        self.fixed_commission = config.commission_per_trade
+        # Without costs or partial sizing the arithmetic mirrors the reference loop exactly
+        self.exact = (self.commission_rate == 0 and self.fixed_commission == 0
+                      and config.position_pct == 1 and config.sizing == "fractional")
+
+    def signal_fill(self, event_bars):
+        """(fill bar, unslipped price) of signals on `event_bars`."""
+        if self.next_open:
+            fill_bars = event_bars + 1
+            return fill_bars, self.open[np.minimum(fill_bars, self.n - 1)]
+        return event_bars, self.close[event_bars]
+
+    def slipped(self, fill_bars, base, direction):
+        slip = self.slip[fill_bars] if isinstance(self.slip, np.ndarray) else self.slip
+        return base * (1 + direction * slip)
+
+    def levels(self, side, price):
+        """Stop-loss and take-profit prices (None when off) of positions entered at `price`."""
+        config = self.config
+        stop = price * (1 - side * config.stop_loss_pct / 100) if config.stop_loss_pct is not None else None
+        target = price * (1 + side * config.take_profit_pct / 100) if config.take_profit_pct is not None else None
+        return stop, target
+
+
+def _schedule(bars: _Bars, events: np.ndarray, targets: np.ndarray) -> dict:
+    """
+    Every trade's entry and exit as arrays, sorted by entry. Requires
+    events without the both-signals target.
+
+    A trade entered on an event is held until the next event whose target
+    differs (its natural exit) unless a stop or target fires first. After a
+    triggered exit the position is flat until the next event with a
+    non-flat target; when that comes before the natural exit, it re-enters
+    at a new price and is searched again in the next round.
+    """
+    n, event_bars = bars.n, events
+    n_events = len(events)
+    previous = np.concatenate(([0], targets[:-1]))
+    changes = np.flatnonzero(targets != previous)
+    # Next target change after each event, and next non-flat event at or after it
+    next_change = np.append(changes, n_events)[np.searchsorted(changes, np.arange(n_events), side='right')]
+    non_flat = np.flatnonzero(targets != 0)
+
+    entries = changes[targets[changes] != 0]
+    exits = next_change[entries]
+    rounds = []
+    while len(entries):
+        side = targets[entries]
+        fill_bars, base = bars.signal_fill(event_bars[entries])
+        filled = fill_bars < n
+        entries, exits, side, fill_bars, base = entries[filled], exits[filled], side[filled], fill_bars[filled], base[filled]
+        price = bars.slipped(fill_bars, base, side)
+        # A trade can only be cut short up to the bar of its exit signal
+        last_bar = np.append(event_bars, n - 1)[exits]
+        trade = {"entry_bar": fill_bars, "side": side, "entry_base": base, "entry_price": price,
+                 "exit_event": exits}
+        triggered = np.zeros(len(entries), dtype=bool)
+        if bars.has_exits:
+            # After a fill at the open the rest of that bar can already trigger the exit
+            scan_from = fill_bars if bars.next_open else fill_bars + 1
+            trigger_bar, reason, level = _first_triggers(bars, side, price, scan_from, last_bar + 1)
+            triggered = trigger_bar <= last_bar
+            trade.update(trigger_bar=trigger_bar, trigger_reason=reason, trigger_level=level)
+        trade["triggered"] = triggered
+        rounds.append(trade)
+
+        # Re-enter on the next non-flat event (at or after the exit bar) before the natural exit
+        stopped = np.flatnonzero(triggered)
+        if not len(stopped) or not len(non_flat):
+            break
+        following = np.searchsorted(event_bars, trade["trigger_bar"][stopped])
+        resume = np.searchsorted(non_flat, following)
+        found = resume < len(non_flat)
+        resume_event = non_flat[np.minimum(resume, len(non_flat) - 1)]
+        keep = found & (resume_event < exits[stopped])
+        entries, exits = resume_event[keep], exits[stopped][keep]
+
+    trades = {key: np.concatenate([r[key] for r in rounds]) if rounds else np.empty(0)
+              for key in ("entry_bar", "side", "entry_base", "entry_price", "exit_event", "triggered")}
+    for key in ("entry_bar", "side", "exit_event"):
+        trades[key] = trades[key].astype(np.int64)
+    trades["triggered"] = trades["triggered"].astype(bool)
+    order = np.argsort(trades["entry_bar"], kind='stable')
+    trades = {key: values[order] for key, values in trades.items()}
+
+    # Natural exits fill like the signal that causes them; without one the position stays open
+    exit_events = np.minimum(trades["exit_event"], max(n_events - 1, 0))
+    exit_bar, exit_base = bars.signal_fill(event_bars[exit_events] if n_events else exit_events)
+    exit_reason = np.where((trades["exit_event"] < n_events) & (exit_bar < n), _SIGNAL, _OPEN)
+    exit_bar = np.where(exit_reason == _OPEN, n - 1, exit_bar)
+    exit_base = np.where(exit_reason == _OPEN, bars.close[-1] if n else 0.0, exit_base)
+
+    if bars.has_exits and rounds:
+        trigger_bar = np.concatenate([r["trigger_bar"] for r in rounds])[order]
+        trigger_reason = np.concatenate([r["trigger_reason"] for r in rounds])[order]
+        trigger_level = np.concatenate([r["trigger_level"] for r in rounds])[order]
+        hit = trades["triggered"]
+        at_open = bars.open[np.minimum(trigger_bar, n - 1)]
+        # A gap through the level fills at the open
+        take_lower = (trigger_reason == _STOP_LOSS) == (trades["side"] == 1)
+        gap_fill = np.where(take_lower, np.minimum(at_open, trigger_level), np.maximum(at_open, trigger_level))
+        exit_bar = np.where(hit, trigger_bar, exit_bar)
+        exit_base = np.where(hit, gap_fill, exit_base)
+        exit_reason = np.where(hit, trigger_reason, exit_reason)
+
+    # Take-profits are limit orders and fill without slippage; open positions are marked at the last close
+    slipped = bars.slipped(exit_bar, exit_base, -trades["side"])
+    exit_price = np.where((exit_reason == _TAKE_PROFIT) | (exit_reason == _OPEN), exit_base, slipped)
+    return {**trades, "exit_bar": exit_bar, "exit_base": exit_base, "exit_price": exit_price,
+            "exit_reason": exit_reason}
+
+
+def _first_triggers(bars: _Bars, side, price, scan_from, scan_to):
+    """
+    First bar in each [scan_from, scan_to) touching its trade's stop or
+    target: (bar, reason, level), with bar `bars.n` where none is touched.
+    Short spans are searched together in chunks of `TRIGGER_CHUNK` bars;
+    longer ones on their own in growing windows.
+    """
+    count = len(side)
+    trigger_bar = np.full(count, bars.n, dtype=np.int64)
+    reason = np.full(count, _SIGNAL, dtype=np.int8)
+    level = np.zeros(count)
+    stop, target = bars.levels(side, price)
+    lengths = np.maximum(scan_to - scan_from, 0)
+
+    def touched(rows, positions, levels, below_long):
+        """Whether each scanned bar reaches its trade's level: from above for longs if `below_long`."""
+        level_at = levels[rows]
+        sides = side[rows]
+        if (sides == 1).all() or (sides == -1).all():
+            below = below_long == (sides[0] == 1)
+            return bars.low[positions] <= level_at if below else bars.high[positions] >= level_at
+        below = sides == 1 if below_long else sides == -1
+        return np.where(below, bars.low[positions] <= level_at, bars.high[positions] >= level_at)
+
+    def scan(rows, positions):
+        # rows: trade of each scanned bar; positions: the bar itself
+        hit_stop = touched(rows, positions, stop, True) if stop is not None else None
+        hit_target = touched(rows, positions, target, False) if target is not None else None
+        hits = hit_stop if hit_target is None else hit_target if hit_stop is None else hit_stop | hit_target
+        at = np.flatnonzero(hits)
+        # The first hit of each trade; on a bar touching both levels the stop is assumed to fill first
+        first_rows, first = np.unique(rows[at], return_index=True)
+        at = at[first]
+        is_stop = hit_stop[at] if hit_stop is not None else np.zeros(len(at), dtype=bool)
+        trigger_bar[first_rows] = positions[at]
+        reason[first_rows] = np.where(is_stop, _STOP_LOSS, _TAKE_PROFIT)
+        level[first_rows] = stop[first_rows] if target is None else target[first_rows] if stop is None else \
+            np.where(is_stop, stop[first_rows], target[first_rows])
+
+    short_spans = np.flatnonzero((lengths > 0) & (lengths <= TRIGGER_CHUNK))
+    if len(short_spans):
+        ends = np.cumsum(lengths[short_spans])
+        chunk_of = (ends - 1) // TRIGGER_CHUNK
+        for chunk in np.split(short_spans, np.flatnonzero(np.diff(chunk_of)) + 1):
+            spans = lengths[chunk]
+            rows = np.repeat(chunk, spans)
+            offsets = np.cumsum(spans) - spans
+            positions = np.arange(len(rows)) + np.repeat(scan_from[chunk] - offsets, spans)
+            scan(rows, positions)
+    for t in np.flatnonzero(lengths > TRIGGER_CHUNK).tolist():
+        lo, width = int(scan_from[t]), TRIGGER_CHUNK
+        while lo < scan_to[t] and trigger_bar[t] == bars.n:
+            hi = min(int(scan_to[t]), lo + width)
+            scan(np.full(hi - lo, t), np.arange(lo, hi))
+            lo, width = hi, width * 4
+    return trigger_bar, reason, level
+
+
+def _settle(trades: dict, bars: _Bars, initial_cash: float):
+    """
+    Sizes and costs the scheduled trades in order. Returns (fill bars, cash
+    and shares after each fill, ledger), or None when an entry cannot be
+    funded (the schedule assumed every entry fills).
+    """
+    config = bars.config
+    if config.sizing == "fractional" and bars.fixed_commission == 0 and not bars.exact:
+        sized = _size_proportional(trades, bars, initial_cash)
+    else:
+        sized = _size_sequential(trades, bars, initial_cash)
+    if sized is None:
+        return None
+    quantity, entry_commission, exit_commission, fill_cash, fill_shares = sized
+
+    # Fills in time order; of several fills on one bar the holdings after the last count
+    fill_bars = np.column_stack((trades["entry_bar"], trades["exit_bar"])).ravel()[:len(fill_cash)]
+    last_on_bar = np.append(fill_bars[1:] != fill_bars[:-1], True)[:len(fill_bars)]
+    fill_cash = np.asarray(fill_cash, dtype=np.float64)[last_on_bar]
+    fill_shares = np.asarray(fill_shares, dtype=np.float64)[last_on_bar]
+
+    side = trades["side"]
+    commission = entry_commission + exit_commission
+    slippage = (np.abs(trades["entry_price"] - trades["entry_base"])
+                + np.abs(trades["exit_price"] - trades["exit_base"])) * quantity
+    ledger = {
+        "entry_bar": trades["entry_bar"], "exit_bar": trades["exit_bar"], "side": side, "quantity": quantity,
+        "entry_price": trades["entry_price"], "exit_price": trades["exit_price"], "commission": commission,
+        "slippage": slippage, "pnl": side * (trades["exit_price"] - trades["entry_price"]) * quantity - commission,
+        "exit_reason": trades["exit_reason"],
+    }
+    return fill_bars[last_on_bar], fill_cash, fill_shares, _ledger_arrays(ledger)
+
+
+def _size_proportional(trades: dict, bars: _Bars, initial_cash: float):
+    """
+    Sizing with fractional shares and costs proportional to the notional:
+    every round trip scales cash by a factor known from its prices alone,
+    so the cash before each entry is a cumulative product.
+    """
+    side, price, exit_price = trades["side"], trades["entry_price"], trades["exit_price"]
+    rate, pct = bars.commission_rate, bars.config.position_pct
+    growth = 1 - pct * (side + rate) / (1 + rate) + pct * exit_price * (side - rate) / (price * (1 + rate))
+    cash = initial_cash * np.cumprod(np.concatenate(([1.0], growth[:-1])))
+    if (cash <= 0).any():
+        return None
+
+    quantity = cash * pct / (price * (1 + rate))
+    entry_commission = quantity * price * rate
+    still_open = trades["exit_reason"] == _OPEN
+    exit_commission = np.where(still_open, 0.0, quantity * exit_price * rate)
+    after_entry = cash - (side * quantity * price + entry_commission)
+    after_exit = after_entry + side * quantity * exit_price - exit_commission
+    fill_cash = np.column_stack((after_entry, after_exit)).ravel()
+    fill_shares = np.column_stack((side * quantity, np.zeros(len(side)))).ravel()
+    if len(side) and still_open[-1]:
+        fill_cash, fill_shares = fill_cash[:-1], fill_shares[:-1]
+    return quantity, entry_commission, exit_commission, fill_cash, fill_shares
+
+
+def _size_sequential(trades: dict, bars: _Bars, initial_cash: float):
+    """Sizing one trade at a time, for integer shares, fixed commissions and the exact default."""
+    config = bars.config
+    commission_rate, fixed_commission = bars.commission_rate, bars.fixed_commission
+    position_pct, integer, exact = config.position_pct, config.sizing == "integer", bars.exact
+    entry_prices, exit_prices = trades["entry_price"].tolist(), trades["exit_price"].tolist()
+    open_position = (trades["exit_reason"] == _OPEN).tolist()
+
+    cash = float(initial_cash)
+    quantities, entry_commissions, exit_commissions = [], [], []
+    fill_cash, fill_shares = [], []
+    for side, price, exit_price, still_open in zip(trades["side"].tolist(), entry_prices, exit_prices, open_position):
+        if exact and side == 1:
+            quantity, commission = cash / price, 0.0
+        else:
+            budget = cash * position_pct - fixed_commission
+            quantity = budget / (price * (1 + commission_rate)) if budget > 0 else 0.0
+            if integer:
+                quantity = math.floor(quantity)
+            commission = quantity * price * commission_rate + fixed_commission
+        if quantity <= 0:
+            return None
+        if exact and side == 1:
+            cash = 0
+        else:
+            cash -= side * quantity * price + commission
+        shares = side * quantity
+        quantities.append(quantity)
+        entry_commissions.append(commission)
+        fill_cash.append(cash)
+        fill_shares.append(shares)
+        if still_open:
+            exit_commissions.append(0.0)
+            break
+        commission = quantity * exit_price * commission_rate + fixed_commission
+        if exact and side == 1:
+            cash = shares * exit_price
+        else:
+            cash += side * quantity * exit_price - commission
+        exit_commissions.append(commission)
+        fill_cash.append(cash)
+        fill_shares.append(0.0)
+    return (np.asarray(quantities, dtype=np.float64), np.asarray(entry_commissions, dtype=np.float64),
+            np.asarray(exit_commissions, dtype=np.float64), fill_cash, fill_shares)
+
+
+def _simulate_events(bars: _Bars, events: np.ndarray, targets: np.ndarray, initial_cash: float):
+    """Steps through the signal events one by one; handles every config and signal combination."""
+    config, n = bars.config, bars.n
+    open_, high, low, close = bars.open, bars.high, bars.low, bars.close
+    slip = bars.slip
+    per_bar_slip = isinstance(slip, np.ndarray)
+    commission_rate, fixed_commission = bars.commission_rate, bars.fixed_commission
+    next_open, has_exits, exact = bars.next_open, bars.has_exits, bars.exact
+    integer = config.sizing == "integer"
+    position_pct = config.position_pct
+
+    cash, shares = float(initial_cash), 0.0
+    fill_bars, fill_cash, fill_shares = [], [], []
+    trades = []
+    position = None  # (side, entry_bar, entry_price, quantity, commission, slippage)
+    exit_bar, exit_reason, exit_level = n, None, None  # Pending protective exit of the open position
+
+    def first_trigger(side, price, scan_from):
+        """First bar from `scan_from` touching the stop or target, searched in growing windows."""
+        stop, target = bars.levels(side, price)
+        lo, width = scan_from, 64
+        while lo < n:
+            hi = min(n, lo + width)
+            hit_stop = hit_target = None
+            if stop is not None:
+                hit_stop = low[lo:hi] <= stop if side == 1 else high[lo:hi] >= stop
+            if target is not None:
+                hit_target = high[lo:hi] >= target if side == 1 else low[lo:hi] <= target
+            hits = hit_stop if hit_target is None else hit_target if hit_stop is None else hit_stop | hit_target
+            j = int(hits.argmax())
+            if hits[j]:
+                # On a bar touching both levels the stop is assumed to fill first
+                if hit_stop is not None and hit_stop[j]:
+                    return lo + j, _STOP_LOSS, stop
+                return lo + j, _TAKE_PROFIT, target
+            lo, width = hi, width * 4
+        return n, None, None
+
+    def enter(bar, base, side):
+        nonlocal cash, shares, position, exit_bar, exit_reason, exit_level
+        price = base * (1 + side * (float(slip[bar]) if per_bar_slip else slip))
+        if exact and side == 1:
+            quantity, commission = cash / price, 0.0
+        else:
+            budget = cash * position_pct - fixed_commission
+            quantity = budget / (price * (1 + commission_rate)) if budget > 0 else 0.0
+            if integer:
+                quantity = math.floor(quantity)
+            commission = quantity * price * commission_rate + fixed_commission
+        if quantity <= 0:
+            return
+        if exact and side == 1:
+            cash = 0
+        else:
+            cash -= side * quantity * price + commission
+        shares = side * quantity
+        position = (side, bar, price, quantity, commission, abs(price - base) * quantity)
+        if has_exits:
+            # After a fill at the open the rest of that bar can already trigger the exit
+            exit_bar, exit_reason, exit_level = first_trigger(side, price, bar if next_open else bar + 1)
+
+    def close_position(bar, base, reason):
+        nonlocal cash, shares, position, exit_bar
+        side, entry_bar, entry_price, quantity, entry_commission, entry_slippage = position
+        # Take-profits are limit orders and fill without slippage
+        if reason == _TAKE_PROFIT:
+            price = base
+        else:
+            price = base * (1 - side * (float(slip[bar]) if per_bar_slip else slip))
+        commission = quantity * price * commission_rate + fixed_commission
+        if exact and side == 1:
+            cash = shares * price
+        else:
+            cash += side * quantity * price - commission
+        shares = 0.0
+        total_commission = entry_commission + commission
+        pnl = side * (price - entry_price) * quantity - total_commission
+        trades.append((entry_bar, bar, side, quantity, entry_price, price, total_commission,
+                       entry_slippage + abs(price - base) * quantity, pnl, reason))
+        position, exit_bar = None, n
+
+    def record(bar):
+        if fill_bars and fill_bars[-1] == bar:
+            fill_cash[-1], fill_shares[-1] = cash, shares
+        else:
+            fill_bars.append(bar)
+            fill_cash.append(cash)
+            fill_shares.append(shares)
+
+    # Only events whose target differs from the previous event's can trade,
+    # plus those with both signals. After a protective exit or a failed
+    # entry the position is flat, and the loop jumps to the next event with
+    # a non-flat target.
+    previous = np.concatenate(([0], targets[:-1]))
+    candidates = np.flatnonzero((targets != previous) | (targets == _BOTH) | (previous == _BOTH)).tolist()
+    non_flat = np.flatnonzero(targets != 0).tolist()
+    event_bars, event_targets = events.tolist(), targets.tolist()
+    short_side = -1 if config.allow_short else 0
+
+    def next_non_flat(first_event):
+        j = bisect_left(non_flat, first_event)
+        return non_flat[j] if j < len(non_flat) else None
+
+    c, n_candidates = 0, len(candidates)
+    k = candidates[0] if candidates else None
+    while True:
+        if exit_bar < n and (k is None or exit_bar <= event_bars[k]):
+            # Protective exit; a gap through the level fills at the open
+            bar, side = exit_bar, position[0]
+            if (exit_reason == _STOP_LOSS) == (side == 1):
+                base = min(float(open_[bar]), exit_level)
+            else:
+                base = max(float(open_[bar]), exit_level)
+            close_position(bar, base, exit_reason)
+            record(bar)
+            resume = next_non_flat(bisect_left(event_bars, bar))
+            if resume is not None and (k is None or resume < k):
+                k = resume
+            continue
+        if k is None:
+            break
+
+        i, target = event_bars[k], event_targets[k]
+        side = 0 if position is None else position[0]
+        if target == _BOTH:
+            target_side = short_side if side == 1 else 1
+        else:
+            target_side = target
+        bar = i + 1 if next_open else i
+        if target_side != side and bar < n:
+            base = float(open_[bar] if next_open else close[i])
+            if position is not None:
+                close_position(bar, base, _SIGNAL)
+            if target_side:
+                enter(bar, base, target_side)
+            record(bar)
+
+        # Advance to the next candidate, or retry sooner if the position is not where the signal wanted it
+        while c < n_candidates and candidates[c] <= k:
+            c += 1
+        following = candidates[c] if c < n_candidates else None
+        if position is None and target_side != 0:
+            retry = next_non_flat(k + 1)
+            if retry is not None and (following is None or retry < following):
+                following = retry
+        k = following
+
+    if position is not None:
+        side, entry_bar, entry_price, quantity, commission, slippage = position
+        pnl = side * (close[-1] - entry_price) * quantity - commission
+        trades.append((entry_bar, n - 1, side, quantity, entry_price, close[-1], commission, slippage, pnl, _OPEN))
+    return fill_bars, fill_cash, fill_shares, _ledger(trades)
+
+
+# --- Trade Ledger ---
+
+LEDGER_COLUMNS = {
+    "entry_bar": np.int64, "exit_bar": np.int64, "side": np.int8, "quantity": np.float64,
+    "entry_price": np.float64, "exit_price": np.float64, "commission": np.float64,
+    "slippage": np.float64, "pnl": np.float64, "exit_reason": np.int8,
+}
+
+
+def _ledger_arrays(columns: dict) -> dict:
+    return {name: np.asarray(columns[name], dtype=dtype) for name, dtype in LEDGER_COLUMNS.items()}
+
+
+def _ledger(trades: list) -> dict:
+    """Ledger from a list of row tuples in `LEDGER_COLUMNS` order."""
+    columns = zip(*trades) if trades else [[]] * len(LEDGER_COLUMNS)
+    return _ledger_arrays(dict(zip(LEDGER_COLUMNS, columns)))
+
+
+def ledger_summary(ledger: dict) -> dict:
+    closed = ledger["exit_reason"] != _OPEN
+    pnl = ledger["pnl"][closed]
+    return {
+        "trades": int(closed.sum()),
+        "open_positions": int((~closed).sum()),
+        "win_rate_pct": round(float((pnl > 0).mean() * 100), 2) if len(pnl) else 0,
+        "total_commission": round(float(ledger["commission"].sum()), 2),
+        "total_slippage": round(float(ledger["slippage"].sum()), 2),
+    }
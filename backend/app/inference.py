@@ -0,0 +1,126 @@
+# app/inference.py
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from .artifacts import get_artifact_manager
+from .lru import LRUCache
+
+# --- Configuration ---
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "256"))
+ENSEMBLE_MEMBERS = ("RandomForest", "GradientBoosting")
+
+# THIS IS A CRITICAL PLACEHOLDER
+# You must replace this with the *exact* same feature engineering steps used in your training notebook.
+FEATURE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume'] # Placeholder - REPLACE ME
+# The tree ensembles cast their input to float32 before scoring, so features
+# are stacked in float32 up front: same predictions at half the memory
+FEATURE_DTYPE = np.float32
+
+# Tree prediction releases the GIL, so ensemble members can score concurrently
+_executor = ThreadPoolExecutor(max_workers=len(ENSEMBLE_MEMBERS), thread_name_prefix="ml-predict")
+
+
+def build_features(data: pd.DataFrame) -> pd.DataFrame:
+    return data[FEATURE_COLUMNS].dropna()
+
+
+def frame_hash(features: pd.DataFrame) -> str:
+    """Content hash of a feature frame (index, column names and values), read straight from the column buffers."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(features.index).to_numpy().data)
+    for name in features.columns:
+        values = np.ascontiguousarray(features[name].to_numpy())
+        digest.update(f"{name}:{values.dtype.str}".encode())
+        digest.update(values.data)
+    return digest.hexdigest()
+
+
+# --- Prediction Cache ---
+
+# Prediction arrays keyed by (model set, model, feature-frame hash)
+prediction_cache = LRUCache(PREDICTION_CACHE_SIZE)
+
+
+# --- Scoring ---
+
+def _members(model_name: str) -> tuple:
+    return ENSEMBLE_MEMBERS if model_name == "Ensemble" else (model_name,)
+
+
+def _stack(frames: dict, keys: list) -> pd.DataFrame:
+    """
+    Row-stacks the feature frames of `keys` into one column-major float32
+    block, written column by column so no float64 copy of the rows is made
+    and models can read it without converting it again.
+    """
+    columns = frames[keys[0]].columns
+    block = np.empty((sum(len(frames[key]) for key in keys), len(columns)), dtype=FEATURE_DTYPE, order='F')
+    row = 0
+    for key in keys:
+        frame = frames[key]
+        for j, name in enumerate(columns):
+            block[row:row + len(frame), j] = frame[name].to_numpy()
+        row += len(frame)
+    return pd.DataFrame(block, columns=columns, copy=False)
+
+
+def _score_member(model_set_name: str, member: str, model, frames: dict, hashes: dict,
+                  cached: dict, pending: list, stacked) -> dict:
+    """
+    Predicts every frame for one model: cached frames are taken from
+    `cached` and the `pending` ones from a single `predict` call on their
+    stacked rows.
+    """
+    results = {key: cached[member, key] for key in frames if key not in pending}
+
+    if pending:
+        predictions = np.asarray(model.predict(stacked), dtype=np.float64)
+        bounds = np.cumsum([len(frames[key]) for key in pending])[:-1]
+        for key, chunk in zip(pending, np.split(predictions, bounds)):
+            prediction_cache.put((model_set_name, member, hashes[key]), chunk)
+            results[key] = chunk
+    return results
+
+
+def predict_many(model_set_name: str, model_name: str, frames: dict) -> dict | None:
+    """
+    Scores several feature frames (e.g. one per ticker) with one stacked
+    `predict` per model. "Ensemble" averages RandomForest and GradientBoosting,
+    which are scored concurrently on the same stacked frame. Returns
+    {key: predictions}, or None if the model set or model is unavailable.
+    """
+    artifacts = get_artifact_manager().get(model_set_name)
+    members = _members(model_name)
+    if artifacts is None or not all(m in artifacts for m in members):
+        return None
+
+    frames = {key: f for key, f in frames.items() if not f.empty}
+    hashes = {key: frame_hash(f) for key, f in frames.items()}
+    if not frames:
+        return {}
+
+    # A frame any member has not cached is rescored by all of them, so the rows are stacked only once
+    cached = {(m, key): prediction_cache.get((model_set_name, m, hashes[key])) for m in members for key in frames}
+    pending = [key for key in frames if any(cached[m, key] is None for m in members)]
+    stacked = _stack(frames, pending) if pending else None
+
+    if len(members) == 1:
+        member_results = [_score_member(model_set_name, members[0], artifacts[members[0]], frames, hashes, cached, pending, stacked)]
+    else:
+        futures = [_executor.submit(_score_member, model_set_name, m, artifacts[m], frames, hashes, cached, pending, stacked) for m in members]
+        member_results = [f.result() for f in futures]
+    del stacked
+
+    return {key: sum(r[key] for r in member_results) / len(member_results) for key in frames}
+
+
+def predict(model_set_name: str, model_name: str, features: pd.DataFrame) -> np.ndarray | None:
+    """Single-frame convenience wrapper around `predict_many`."""
+    results = predict_many(model_set_name, model_name, {None: features})
+    if results is None:
+        return None
+    return results.get(None, np.empty(0))
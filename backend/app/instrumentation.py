@@ -0,0 +1,294 @@
+# app/instrumentation.py
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# --- Configuration ---
+# "memory://" keeps metrics in-process (tests, single-process runs); otherwise
+# workers and the API share them through Redis.
+METRICS_URL = os.getenv("METRICS_URL", "redis://localhost:6379/4")
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "1") not in ("0", "false", "False")
+METRICS_KEY = "backtest-metrics"
+
+PROFILE_MODES = ("cprofile", "sampling")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "40"))
+SAMPLING_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLING_INTERVAL_MS", "5")) / 1000
+
+# Progress stages reported by the runners, and the pipeline stage that ends
+# when each one is reached. Unlisted stages are recorded under their own name.
+PIPELINE_STAGES = {
+    "data_fetched": "fetch",
+    "signals_computed": "signals",
+    "predictions_ready": "ml_inference",
+    "simulating": "simulation",
+    "simulated": "simulation",
+    "metrics_ready": "metrics",
+    "returned": "serialization",
+    "stored": "store",
+}
+
+# Lifecycle events that do not close a pipeline stage
+UNTIMED_STAGES = {"queued", "started", "completed", "failed"}
+
+WALL_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (falls back to the peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# --- Stage Timing ---
+
+class StageRecorder:
+    """
+    Measures wall time, CPU time, row counts and RSS growth between the
+    progress events of one job, and the processes a stage fanned out to.
+    `wrap` returns a progress callback that records each stage and then
+    forwards the event unchanged.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.stages = {}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._rss = _rss_bytes()
+
+    def mark(self, event_stage: str, rows: int | None = None, processes: int | None = None):
+        wall, cpu, rss = time.perf_counter(), time.process_time(), _rss_bytes()
+        name = PIPELINE_STAGES.get(event_stage, event_stage)
+        stage = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "rss_delta_bytes": 0})
+        stage["wall_seconds"] += wall - self._wall
+        stage["cpu_seconds"] += cpu - self._cpu
+        stage["rss_delta_bytes"] += rss - self._rss
+        if rows:
+            stage["rows"] = max(stage["rows"], int(rows))
+        if processes:
+            stage["processes"] = max(stage.get("processes", 0), int(processes))
+        self._wall, self._cpu, self._rss = wall, cpu, rss
+
+    def wrap(self, progress):
+        def instrumented(stage: str, percent: float | None = None, **details):
+            if stage not in UNTIMED_STAGES:
+                self.mark(stage, details.get("bars") or details.get("combinations_done"), details.get("processes"))
+            progress(stage, percent, **details)
+        return instrumented
+
+    def summary(self) -> list:
+        return [
+            {"stage": name, **{k: round(v, 6) if isinstance(v, float) else v for k, v in values.items()}}
+            for name, values in self.stages.items()
+        ]
+
+
+# --- Metrics Registries ---
+# Series are keyed by "metric|kind|stage|le" (le only for histogram buckets)
+# and rendered in the Prometheus text exposition format.
+
+class MemoryMetrics:
+    def __init__(self):
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, increments: dict):
+        with self._lock:
+            self._values.update(increments)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class RedisMetrics:
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def increment(self, increments: dict):
+        pipe = self._client.pipeline(transaction=False)
+        for field, amount in increments.items():
+            pipe.hincrbyfloat(METRICS_KEY, field, amount)
+        pipe.execute()
+
+    def snapshot(self) -> dict:
+        return {field.decode(): float(value) for field, value in self._client.hgetall(METRICS_KEY).items()}
+
+
+_metrics = None
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = MemoryMetrics() if METRICS_URL.startswith("memory://") else RedisMetrics(METRICS_URL)
+    return _metrics
+
+
+def _stage_increments(kind: str, stages: dict, status: str) -> dict:
+    increments = Counter({f"backtest_jobs_total|{kind}|{status}|": 1})
+    for name, values in stages.items():
+        prefix = f"|{kind}|{name}|"
+        wall = values["wall_seconds"]
+        increments[f"backtest_stage_wall_seconds_sum{prefix}"] += wall
+        increments[f"backtest_stage_wall_seconds_count{prefix}"] += 1
+        for le in WALL_SECONDS_BUCKETS:
+            increments[f"backtest_stage_wall_seconds_bucket{prefix}{le}"] += 1 if wall <= le else 0
+        increments[f"backtest_stage_cpu_seconds_total{prefix}"] += values["cpu_seconds"]
+        increments[f"backtest_stage_rows_total{prefix}"] += values["rows"]
+        increments[f"backtest_stage_rss_growth_bytes_total{prefix}"] += max(values["rss_delta_bytes"], 0)
+    return increments
+
+
+def record_job(recorder: StageRecorder, status: str):
+    """Adds a finished job's stage timings to the shared metrics; never raises."""
+    try:
+        get_metrics().increment(_stage_increments(recorder.kind, recorder.stages, status))
+    except Exception as e:
+        print(f"Could not record metrics: {e}")
+
+
+METRIC_HELP = {
+    "backtest_jobs_total": ("counter", "Finished jobs by kind and status."),
+    "backtest_stage_wall_seconds": ("histogram", "Wall-clock time spent in each pipeline stage."),
+    "backtest_stage_cpu_seconds_total": ("counter", "CPU time spent in each pipeline stage."),
+    "backtest_stage_rows_total": ("counter", "Rows processed by each pipeline stage."),
+    "backtest_stage_rss_growth_bytes_total": ("counter", "Resident memory growth during each pipeline stage."),
+}
+
+
+def render_prometheus(snapshot: dict) -> str:
+    series = {}
+    for field, value in sorted(snapshot.items()):
+        metric, kind, label, le = field.split("|")
+        family = metric.removesuffix("_bucket").removesuffix("_sum").removesuffix("_count")
+        if family not in METRIC_HELP:
+            family = metric
+        labels = f'kind="{kind}",status="{label}"' if metric == "backtest_jobs_total" else f'kind="{kind}",stage="{label}"'
+        series.setdefault(family, []).append((metric, labels, le, value))
+
+    lines = []
+    for family, samples in series.items():
+        metric_type, help_text = METRIC_HELP.get(family, ("untyped", ""))
+        lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {metric_type}"]
+        if metric_type == "histogram":
+            samples = _with_inf_buckets(samples)
+        for metric, labels, le, value in samples:
+            if le:
+                labels += f',le="{le}"'
+            lines.append(f"{metric}{{{labels}}} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+def _with_inf_buckets(samples: list) -> list:
+    """Orders buckets numerically and adds the `+Inf` bucket (equal to `_count`)."""
+    buckets = [s for s in samples if s[2]]
+    others = [s for s in samples if not s[2]]
+    for metric, labels, _, value in others:
+        if metric.endswith("_count"):
+            buckets.append((metric.removesuffix("_count") + "_bucket", labels, "+Inf", value))
+    return sorted(buckets, key=lambda s: (s[1], float(s[2]))) + others
+
+
+# --- Profiling ---
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler: a background thread samples the
+    profiled thread's stack every `interval` seconds and counts collapsed
+    stacks (flame-graph input) and leaf functions.
+    """
+
+    def __init__(self, interval: float = SAMPLING_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def report(self, top_n: int = PROFILE_TOP_N) -> dict:
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "mode": "sampling",
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "top_functions": [{"function": f, "samples": n} for f, n in leaves.most_common(top_n)],
+            "collapsed_stacks": [f"{stack} {count}" for stack, count in self.stacks.most_common(top_n * 5)],
+        }
+
+
+def _cprofile_report(profiler: cProfile.Profile, top_n: int = PROFILE_TOP_N) -> dict:
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return {
+        "mode": "cprofile",
+        "total_seconds": round(stats.total_tt, 6),
+        "top_functions": [
+            {
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "total_seconds": round(total_time, 6),
+                "cumulative_seconds": round(cumulative_time, 6),
+            }
+            for (filename, line, name), (primitive_calls, calls, total_time, cumulative_time, _) in rows
+        ],
+    }
+
+
+def profiled(mode: str | None, func, *args, **kwargs):
+    """
+    Calls `func(*args, **kwargs)`, optionally under a profiler. Returns
+    (result, profile report or None); with `mode=None` this is a plain call.
+    """
+    if mode is None:
+        return func(*args, **kwargs), None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args, **kwargs)
+        return result, _cprofile_report(profiler)
+    if mode == "sampling":
+        with SamplingProfiler() as sampler:
+            result = func(*args, **kwargs)
+        return result, sampler.report()
+    raise ValueError(f"Unknown profile mode: {mode}")
+
+
+def diagnostics(recorder: StageRecorder | None, profile: dict | None) -> dict:
+    """The `diagnostics` entry stored alongside a job's results."""
+    return {"stages": recorder.summary() if recorder else [], "profile": profile}
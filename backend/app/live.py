@@ -0,0 +1,222 @@
+# app/live.py
+
+import math
+from collections import deque
+
+from .engine import INITIAL_CASH
+
+# --- Incremental Indicators ---
+# O(1) per-bar updates that reproduce the pandas-ta columns used in
+# `strategies.py`. Each `update` returns the current value, or None while
+# the window is still warming up (where pandas-ta would produce NaN).
+
+class RollingMean:
+    __slots__ = ("length", "_window", "_sum", "_updates")
+
+    # Re-sum the window periodically so float drift cannot accumulate
+    RESYNC_EVERY = 10_000
+
+    def __init__(self, length: int):
+        self.length = length
+        self._window = deque(maxlen=length)
+        self._sum = 0.0
+        self._updates = 0
+
+    def update(self, value: float) -> float | None:
+        if len(self._window) == self.length:
+            self._sum -= self._window[0]
+        self._window.append(value)
+        self._sum += value
+
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self._sum = math.fsum(self._window)
+
+        if len(self._window) < self.length:
+            return None
+        return self._sum / self.length
+
+
+class RollingMeanStd:
+    """Rolling mean and population standard deviation (ddof=0) via a windowed Welford update."""
+    __slots__ = ("length", "_window", "_mean", "_m2")
+
+    def __init__(self, length: int):
+        self.length = length
+        self._window = deque(maxlen=length)
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value: float):
+        n = len(self._window)
+        if n < self.length:
+            self._window.append(value)
+            delta = value - self._mean
+            self._mean += delta / (n + 1)
+            self._m2 += delta * (value - self._mean)
+        else:
+            old = self._window[0]
+            self._window.append(value)
+            old_mean = self._mean
+            self._mean += (value - old) / self.length
+            self._m2 += (value - old) * (value - self._mean + old - old_mean)
+
+        if len(self._window) < self.length:
+            return None, None
+        return self._mean, math.sqrt(max(self._m2 / self.length, 0.0))
+
+
+class BollingerBands:
+    __slots__ = ("std_dev", "_stats")
+
+    def __init__(self, length: int = 20, std_dev: float = 2.0):
+        self.std_dev = std_dev
+        self._stats = RollingMeanStd(length)
+
+    def update(self, close: float):
+        """Returns (lower, mid, upper), or (None, None, None) during warm-up."""
+        mid, std = self._stats.update(close)
+        if mid is None:
+            return None, None, None
+        deviations = self.std_dev * std
+        return mid - deviations, mid, mid + deviations
+
+
+# --- Streaming Strategies ---
+# Bar-at-a-time equivalents of the functions in `strategies.py`.
+# `update(close)` returns (buy_signal, sell_signal) for that bar.
+
+class StreamingMomentum:
+    __slots__ = ("_fast", "_slow", "_prev")
+
+    def __init__(self, fast_ma: int = 50, slow_ma: int = 200):
+        self._fast = RollingMean(fast_ma)
+        self._slow = RollingMean(slow_ma)
+        self._prev = None
+
+    def update(self, close: float):
+        fast, slow = self._fast.update(close), self._slow.update(close)
+        if fast is None or slow is None:
+            return False, False
+
+        prev, self._prev = self._prev, (fast, slow)
+        if prev is None:
+            return False, False
+        buy = fast > slow and prev[0] <= prev[1]
+        sell = fast < slow and prev[0] >= prev[1]
+        return buy, sell
+
+
+class StreamingMeanReversion:
+    __slots__ = ("_bands", "_prev")
+
+    def __init__(self, length: int = 20, std_dev: float = 2.0):
+        self._bands = BollingerBands(length, std_dev)
+        self._prev = None
+
+    def update(self, close: float):
+        lower, _, upper = self._bands.update(close)
+        if lower is None:
+            return False, False
+
+        prev, self._prev = self._prev, (close, lower, upper)
+        if prev is None:
+            return False, False
+        buy = close < lower and prev[0] >= prev[1]
+        sell = close > upper and prev[0] <= prev[2]
+        return buy, sell
+
+
+class StreamingVolatility:
+    __slots__ = ("_bands", "_width_mean", "squeeze_threshold", "_prev")
+
+    def __init__(self, length: int = 20, std_dev: float = 2.0, squeeze_threshold: float = 1.5):
+        self._bands = BollingerBands(length, std_dev)
+        self._width_mean = RollingMean(length * 2)
+        self.squeeze_threshold = squeeze_threshold
+        self._prev = None
+
+    def update(self, close: float):
+        lower, mid, upper = self._bands.update(close)
+        if lower is None:
+            return False, False
+
+        width = (upper - lower) / mid
+        width_mean = self._width_mean.update(width)
+        squeeze_on = width_mean is not None and width < width_mean * self.squeeze_threshold
+
+        prev, self._prev = self._prev, (squeeze_on, lower, upper)
+        if prev is None:
+            return False, False
+        buy = prev[0] and close > prev[2]
+        sell = prev[0] and close < prev[1]
+        return buy, sell
+
+
+STREAMING_STRATEGIES = {
+    "TrendFollowing": StreamingMomentum,
+    "MeanReversion": StreamingMeanReversion,
+    "Volatility": StreamingVolatility,
+}
+
+
+def create_streaming_strategy(strategy_type: str, **params):
+    if strategy_type not in STREAMING_STRATEGIES:
+        raise ValueError(f"Unknown strategy type: {strategy_type}")
+    return STREAMING_STRATEGIES[strategy_type](**params)
+
+
+# --- Paper Trading ---
+
+class PaperTrader:
+    """
+    Feeds bars one at a time into a streaming strategy and trades them with
+    the same long/flat rules as `engine.simulate`. Each `on_bar` returns an
+    event describing the signal, any fill and the resulting equity.
+    """
+
+    def __init__(self, strategy_type: str, initial_cash: float = INITIAL_CASH, **params):
+        self.strategy = create_streaming_strategy(strategy_type, **params)
+        self.cash = initial_cash
+        self.shares = 0
+
+    @property
+    def position(self) -> str:
+        return "long" if self.shares > 0 else "flat"
+
+    def on_bar(self, timestamp, close: float) -> dict:
+        buy, sell = self.strategy.update(close)
+
+        action = None
+        if sell and self.shares > 0:
+            self.cash = self.shares * close
+            self.shares = 0
+            action = "sell"
+        elif buy and self.cash > 0:
+            self.shares = self.cash / close
+            self.cash = 0
+            action = "buy"
+
+        return {
+            "time": timestamp,
+            "close": close,
+            "buy_signal": buy,
+            "sell_signal": sell,
+            "action": action,
+            "position": self.position,
+            "portfolio_value": self.cash + self.shares * close,
+        }
+
+
+def run_paper_trading(strategy_type: str, bars, on_event=None, **params):
+    """
+    Replays an iterable of (timestamp, close) bars through a `PaperTrader`,
+    calling `on_event` for every bar that produced a signal or a fill.
+    Returns the trader so callers can inspect the final state.
+    """
+    trader = PaperTrader(strategy_type, **params)
+    for timestamp, close in bars:
+        event = trader.on_bar(timestamp, close)
+        if on_event is not None and (event["buy_signal"] or event["sell_signal"] or event["action"]):
+            on_event(event)
+    return trader
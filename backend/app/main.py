@@ -1,48 +1,62 @@
 # app/main.py
 
 # --- Core FastAPI and Celery Imports ---
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import anyio
 import uuid
 import json
+from typing import Literal
 
 # --- Application-Specific Imports ---
 from . import models, auth
-from .database import SessionLocal, engine
-from .tasks import run_backtest_task, celery_app
-from .models import StrategyDefinition, UserCreate, StrategyCreate # Explicitly import the Pydantic models
+from .database import engine, get_async_db
+from .tasks import run_backtest_task, run_portfolio_task, run_sweep_task, run_walk_forward_task, celery_app, queue_depths
+from .sweep import expand_parameter_grid
+from .rules import CUSTOM_STRATEGY, compile_rules
+from .portfolio import is_portfolio, resolve_tickers
+from . import dedup
+from .results import DIAGNOSTICS_KEY, shape_result
+from .events import get_event_broker, make_event, publish_progress
+from .instrumentation import get_metrics, render_prometheus
+from .market_data import get_market_data_store
+from .universe import get_universe_service
+from .models import StrategyDefinition, SweepDefinition, WalkForwardDefinition, UserCreate, StrategyCreate # Explicitly import the Pydantic models
 
 # --- Create Database Tables on Startup ---
 models.Base.metadata.create_all(bind=engine)
 
+# --- Load the Symbol Universe on Startup (later edits are reloaded on the fly) ---
+get_universe_service().load()
+
 # --- FastAPI App Initialization ---
 app = FastAPI(title="AlgoSphere Backend")
 
 # --- Database Dependency ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Request handlers use the async engine so queries never block the event loop;
+# the sync engine is reserved for Celery tasks.
+get_db = get_async_db
 
 # =============================================================================
 # AUTHENTICATION ENDPOINTS
 # =============================================================================
 
 @app.post("/api/register", tags=["Authentication"])
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if db_user:
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.User.id).where(models.User.email == user.email))
+    if result.first():
         raise HTTPException(status_code=400, detail="Email already registered")
-    auth.create_user(db=db, user=user)
+    await auth.create_user(db=db, user=user)
     return {"message": "User created successfully"}
 
 @app.post("/token", tags=["Authentication"])
-async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(db: AsyncSession = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await auth.get_user_by_username(db, form_data.username)
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -56,43 +70,205 @@ async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth
 # STRATEGY ENDPOINTS
 # =============================================================================
 @app.get("/api/strategies", tags=["Strategies"])
-async def get_strategies(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.Strategy).filter(models.Strategy.owner_id == current_user.id).all()
+async def get_strategies(db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    result = await db.execute(select(models.Strategy).where(models.Strategy.owner_id == current_user.id))
+    return result.scalars().all()
 
 @app.post("/api/strategies", tags=["Strategies"])
-async def create_strategy(strategy: StrategyCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+async def create_strategy(strategy: StrategyCreate, db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     db_strategy = models.Strategy(**strategy.dict(), owner_id=current_user.id)
     db.add(db_strategy)
-    db.commit()
-    db.refresh(db_strategy)
+    await db.commit()
+    await db.refresh(db_strategy)
     return db_strategy
 
 # =============================================================================
 # BACKTESTING ENDPOINTS
 # =============================================================================
 
+async def _get_result(db: AsyncSession, job_id: str):
+    result = await db.execute(select(models.BacktestResult).where(models.BacktestResult.job_id == job_id))
+    return result.scalars().first()
+
+
+async def _stored_status(db: AsyncSession, job_id: str) -> tuple | None:
+    """(status, error) of a job's stored report, without loading the report; None if nothing is stored yet."""
+    report = models.BacktestResult.result_data
+    result = await db.execute(select(report["status"].as_string(), report["error"].as_string())
+                              .where(models.BacktestResult.job_id == job_id))
+    return result.first()
+
+
+async def _job_failed(db: AsyncSession, job_id: str) -> bool:
+    stored = await _stored_status(db, job_id)
+    return stored is not None and stored[0] == "FAILURE"
+
+
+async def _claim_job(db: AsyncSession, dedup_key: str, tickers: list, interval: str) -> tuple:
+    """
+    Runs the (blocking, Redis-backed) dedup claim in a worker thread. A job
+    counts as failed once Celery reports it failed or revoked (e.g. its worker
+    was killed), or once its stored result is a failure; the latter check hops
+    back onto the event loop to query the async session.
+    """
+    def is_failed(existing: str) -> bool:
+        if celery_app.AsyncResult(existing).state in ("FAILURE", "REVOKED"):
+            return True
+        return anyio.from_thread.run(_job_failed, db, existing)
+    return await run_in_threadpool(dedup.claim_job, dedup_key, str(uuid.uuid4()), tickers, is_failed, interval)
+
+
+async def _check_data_range(tickers: list, start_date: str, end_date: str, interval: str):
+    """Rejects runs on bars the market data source cannot serve (e.g. intraday bars beyond Yahoo's lookback)."""
+    def check():
+        store = get_market_data_store()
+        for ticker in tickers:
+            store.check_range(ticker, start_date, end_date, interval)
+    try:
+        await run_in_threadpool(check)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _deduplicated_response(db: AsyncSession, job_id: str) -> dict:
+    result = await db.execute(select(models.BacktestResult.id).where(models.BacktestResult.job_id == job_id))
+    completed = result.first() is not None
+    message = "Backtest results already available" if completed else "Identical backtest already running"
+    return {"message": message, "job_id": job_id, "deduplicated": True}
+
+
 @app.post("/api/backtest", tags=["Backtesting"])
 async def start_backtest(
     strategy: StrategyDefinition,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    profile: Literal["cprofile", "sampling"] | None = Query(default=None, description="Store a profile of the run with its results"),
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user)
 ):
-    job_id = str(uuid.uuid4())
+    strategy_json = strategy.dict()
+    if not strategy.ticker and not is_portfolio(strategy_json):
+        raise HTTPException(status_code=400, detail="Provide a ticker, a list of tickers or a universe file.")
+    if strategy.strategyType == CUSTOM_STRATEGY:
+        try:
+            compile_rules(strategy.rules)  # Rejects invalid rules up front; the plan is cached by rule hash
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        tickers = resolve_tickers(strategy_json) if is_portfolio(strategy_json) else [strategy.ticker]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await _check_data_range(tickers, strategy.start_date, strategy.end_date, strategy.interval)
+
+    # Identical requests coalesce onto one job (see dedup.py); profiled runs only share with each other
+    dedup_key = dedup.job_key(f"backtest:{profile}" if profile else "backtest", strategy_json, strategy.ticker, strategy.start_date, strategy.end_date)
+    job_id, is_new = await _claim_job(db, dedup_key, tickers, strategy.interval)
+    if not is_new:
+        return await _deduplicated_response(db, job_id)
     
-    run_backtest_task.delay(
+    publish_progress(job_id, "queued", 0)
+    # The Celery task id is the job id, so /status can look the task up
+    task_kwargs = dict(
         job_id=job_id,
-        strategy_json=strategy.dict(),
-        ticker=strategy.ticker,
-        start_date="2020-01-01",
-        end_date="2023-12-31",
-        owner_id=current_user.id
+        strategy_json=strategy_json,
+        start_date=strategy.start_date,
+        end_date=strategy.end_date,
+        owner_id=current_user.id,
+        dedup_key=dedup_key,
+        profile=profile
     )
+    if is_portfolio(strategy_json):
+        run_portfolio_task.apply_async(kwargs=task_kwargs, task_id=job_id)  # Routed to the heavy queue
+    else:
+        run_backtest_task.apply_async(kwargs={**task_kwargs, "ticker": strategy.ticker}, task_id=job_id)
     
     return {"message": "Backtest started", "job_id": job_id}
 
 
+@app.post("/api/backtest/sweep", tags=["Backtesting"])
+async def start_sweep(
+    sweep: SweepDefinition,
+    profile: Literal["cprofile", "sampling"] | None = Query(default=None, description="Store a profile of the run with its results"),
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user)
+):
+    if not sweep.ticker:
+        raise HTTPException(status_code=400, detail="Parameter sweeps run on a single ticker.")
+    if sweep.execution is not None:
+        raise HTTPException(status_code=400, detail="Parameter sweeps use frictionless execution; run single backtests to apply execution settings.")
+    try:
+        n_combinations = len(expand_parameter_grid(sweep.strategyType, sweep.dict()["parameters"]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await _check_data_range([sweep.ticker], sweep.start_date, sweep.end_date, sweep.interval)
+
+    sweep_json = sweep.dict()
+    dedup_key = dedup.job_key(f"sweep:{profile}" if profile else "sweep", sweep_json, sweep.ticker, sweep.start_date, sweep.end_date)
+    job_id, is_new = await _claim_job(db, dedup_key, [sweep.ticker], sweep.interval)
+    if not is_new:
+        return {**await _deduplicated_response(db, job_id), "combinations": n_combinations}
+
+    publish_progress(job_id, "queued", 0)
+    run_sweep_task.apply_async(kwargs=dict(
+            job_id=job_id,
+            sweep_json=sweep_json,
+            ticker=sweep.ticker,
+            start_date=sweep.start_date,
+            end_date=sweep.end_date,
+            owner_id=current_user.id,
+            dedup_key=dedup_key,
+            profile=profile
+        ), task_id=job_id)
+
+    return {"message": "Sweep started", "job_id": job_id, "combinations": n_combinations}
+
+
+@app.post("/api/backtest/walk-forward", tags=["Backtesting"])
+async def start_walk_forward(
+    walk_forward: WalkForwardDefinition,
+    profile: Literal["cprofile", "sampling"] | None = Query(default=None, description="Store a profile of the run with its results"),
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user)
+):
+    if not walk_forward.ticker:
+        raise HTTPException(status_code=400, detail="Walk-forward runs on a single ticker.")
+    if walk_forward.execution is not None:
+        raise HTTPException(status_code=400, detail="Walk-forward uses frictionless execution; run single backtests to apply execution settings.")
+    try:
+        n_combinations = len(expand_parameter_grid(walk_forward.strategyType, walk_forward.dict()["parameters"]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await _check_data_range([walk_forward.ticker], walk_forward.start_date, walk_forward.end_date, walk_forward.interval)
+
+    wf_json = walk_forward.dict()
+    dedup_key = dedup.job_key(f"walk-forward:{profile}" if profile else "walk-forward", wf_json, walk_forward.ticker,
+                              walk_forward.start_date, walk_forward.end_date)
+    job_id, is_new = await _claim_job(db, dedup_key, [walk_forward.ticker], walk_forward.interval)
+    if not is_new:
+        return {**await _deduplicated_response(db, job_id), "folds": walk_forward.folds}
+
+    publish_progress(job_id, "queued", 0)
+    run_walk_forward_task.apply_async(kwargs=dict(
+            job_id=job_id,
+            wf_json=wf_json,
+            ticker=walk_forward.ticker,
+            start_date=walk_forward.start_date,
+            end_date=walk_forward.end_date,
+            owner_id=current_user.id,
+            dedup_key=dedup_key,
+            profile=profile
+        ), task_id=job_id)
+
+    return {"message": "Walk-forward started", "job_id": job_id, "folds": walk_forward.folds, "combinations": n_combinations}
+
+
 @app.get("/api/backtest/status/{job_id}", tags=["Backtesting"])
-async def get_backtest_status(job_id: str):
+async def get_backtest_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    # The stored report outlives the Celery state (whose expiry is set separately), e.g. for reused jobs
+    stored = await _stored_status(db, job_id)
+    if stored is not None:
+        status, error = stored
+        return {"status": "FAILURE", "info": error} if status == "FAILURE" else {"status": "SUCCESS"}
     task = celery_app.AsyncResult(job_id)
     if task.state == 'PENDING' or task.state == 'STARTED':
         return {"status": "RUNNING"}
@@ -101,14 +277,121 @@ async def get_backtest_status(job_id: str):
     return {"status": "FAILURE", "info": str(task.info)}
 
 
+async def _stored_final_event(db: AsyncSession, job_id: str) -> dict | None:
+    """
+    The final progress event of a job whose report is already stored. Its
+    live events may have expired, since dedup reuses finished jobs for much
+    longer than events are kept.
+    """
+    stored = await _stored_status(db, job_id)
+    await db.rollback()  # Hands the connection back to the pool for the length of the stream
+    if stored is None:
+        return None
+    status, error = stored
+    return make_event(job_id, "failed", None, error=error) if status == "FAILURE" else make_event(job_id, "completed", 100)
+
+
+async def _progress_events(job_id: str, final: dict | None):
+    if final is not None:
+        yield final
+        return
+    async for event in get_event_broker().subscribe(job_id):
+        yield event
+
+
+@app.get("/api/backtest/events/{job_id}", tags=["Backtesting"])
+async def stream_backtest_events(job_id: str, db: AsyncSession = Depends(get_db)):
+    """Server-Sent Events stream of a job's progress; closes after the final event or when idle."""
+    final = await _stored_final_event(db, job_id)
+
+    async def event_stream():
+        async for event in _progress_events(job_id, final):
+            yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.websocket("/ws/backtest/{job_id}")
+async def backtest_events_websocket(websocket: WebSocket, job_id: str, db: AsyncSession = Depends(get_db)):
+    """WebSocket variant of the progress stream."""
+    await websocket.accept()
+    try:
+        async for event in _progress_events(job_id, await _stored_final_event(db, job_id)):
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
 @app.get("/api/backtest/results/{job_id}", tags=["Backtesting"])
-async def get_backtest_results(job_id: str, db: Session = Depends(get_db)):
-    result_from_db = db.query(models.BacktestResult).filter(models.BacktestResult.job_id == job_id).first()
+async def get_backtest_results(
+    job_id: str,
+    start: str | None = Query(default=None, description="Only return points at or after this date/time"),
+    end: str | None = Query(default=None, description="Only return points at or before this date/time"),
+    max_points: int | None = Query(default=None, ge=3, le=100000, description="Downsample each series to at most this many points"),
+    fmt: Literal["records", "columnar"] = Query(default="records", alias="format"),
+    db: AsyncSession = Depends(get_db)
+):
+    result_from_db = await _get_result(db, job_id)
     
     if not result_from_db:
         return {"error": "Results not found or backtest is still running."}
     
-    return result_from_db.result_data
+    try:
+        return shape_result(result_from_db.result_data, start, end, max_points, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/backtest/{job_id}/profile", tags=["Backtesting"])
+async def get_backtest_profile(job_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Per-stage timings of a finished job, plus its profile if one was
+    requested. The store stage is exported as metrics and task events only.
+    """
+    result_from_db = await _get_result(db, job_id)
+    if not result_from_db:
+        raise HTTPException(status_code=404, detail="Results not found or backtest is still running.")
+
+    result_data = result_from_db.result_data if isinstance(result_from_db.result_data, dict) else {}
+    diagnostics = result_data.get(DIAGNOSTICS_KEY) or {"stages": [], "profile": None}
+    return {"job_id": job_id, **diagnostics}
+
+
+# =============================================================================
+# SYMBOL UNIVERSE
+# =============================================================================
+
+@app.get("/api/stocks", tags=["UI Data"])
+async def get_stocks(
+    response: Response,
+    q: str | None = Query(default=None, max_length=64, description="Symbol or company name; prefixes and typos match"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=5000),
+    fuzzy: bool = Query(default=True, description="Also return approximate (trigram) matches"),
+):
+    """One page of matching symbols; the total number of matches is in the X-Total-Count header."""
+    total, stocks = get_universe_service().search(q, offset, limit, fuzzy)
+    response.headers["X-Total-Count"] = str(total)
+    return stocks
+
+
+# =============================================================================
+# MONITORING
+# =============================================================================
+
+@app.get("/metrics", tags=["Monitoring"], response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Pipeline stage metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(render_prometheus(get_metrics().snapshot()), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/queues", tags=["Monitoring"])
+async def get_queue_depths():
+    """Jobs waiting in each Celery queue, e.g. for sizing workers under load (see benchmarks/loadtest.py)."""
+    try:
+        return {"queues": await run_in_threadpool(queue_depths)}
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Broker unavailable: {e}")
 
 # =============================================================================
 # MOCK DATA ENDPOINTS (For UI Components)
@@ -122,7 +405,7 @@ async def get_market_overview():
     ]
 
 @app.get("/api/dashboard-stats", tags=["UI Data"])
-async def get_dashboard_stats(current_user: models.User = Depends(auth.get_current_user)):
+async def get_dashboard_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
     return {
         "portfolioValue": 102800,
         "todayPnl": 2800,
@@ -0,0 +1,411 @@
+# app/market_data.py
+
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from .timeframes import finer_intervals, normalize_interval, resample_bars
+
+# --- Configuration ---
+# "yfinance" (live), "synthetic" (deterministic bars, see replay.py) or
+# "csv:<dir>" (recorded `<ticker>.csv` files). Replayed bars get their own
+# cache directory so they never mix with downloaded ones.
+MARKET_DATA_SOURCE = os.getenv("MARKET_DATA_SOURCE", "yfinance")
+CACHE_DIR = os.getenv("MARKET_DATA_CACHE_DIR",
+                      "./market_data_cache" if MARKET_DATA_SOURCE == "yfinance" else "./market_data_cache_replay")
+CACHE_MAX_BYTES = int(float(os.getenv("MARKET_DATA_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Longest bar-free stretch at the edge of a fetched range that a market
+# closure explains (weekends and holidays; a coarse bar is stamped at the
+# start of its week or month). A range counts as covered up to its bounds
+# only when the returned bars come this close to them.
+EDGE_GAPS = {"1wk": pd.Timedelta(days=10), "1mo": pd.Timedelta(days=35)}
+DEFAULT_EDGE_GAP = pd.Timedelta(days=5)
+
+# Yahoo serves intraday bars only from the recent past and caps the span of
+# one request: interval -> (how far back, longest request).
+YFINANCE_INTRADAY_LIMITS = {
+    "1m": (pd.Timedelta(days=30), pd.Timedelta(days=7)),
+    "5m": (pd.Timedelta(days=60), pd.Timedelta(days=60)),
+    "15m": (pd.Timedelta(days=60), pd.Timedelta(days=60)),
+    "30m": (pd.Timedelta(days=60), pd.Timedelta(days=60)),
+    "1h": (pd.Timedelta(days=730), pd.Timedelta(days=730)),
+}
+# Kept clear of the lookback boundary, which moves while a request is in flight
+YFINANCE_LOOKBACK_MARGIN = pd.Timedelta(days=1)
+
+
+def empty_bars() -> pd.DataFrame:
+    return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name='Date'), dtype=float)
+
+
+# --- Data Sources ---
+# A source only has to implement `fetch(ticker, start, end, interval)` and
+# return an OHLCV DataFrame indexed by timestamp (end is exclusive).
+
+def _naive(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_convert(None) if ts.tzinfo is not None else ts
+
+
+class YFinanceSource:
+    """
+    Downloads bars from Yahoo Finance. Intraday ranges are clamped to the
+    lookback Yahoo serves and downloaded in requests of at most its span
+    (see YFINANCE_INTRADAY_LIMITS).
+    """
+
+    def check_range(self, start: pd.Timestamp, end: pd.Timestamp, interval: str):
+        """Raises ValueError if Yahoo does not serve `interval` bars as far back as `start`."""
+        limits = YFINANCE_INTRADAY_LIMITS.get(normalize_interval(interval))
+        if limits is None:
+            return
+        lookback = limits[0]
+        if _naive(start) < pd.Timestamp.now("UTC").tz_convert(None) - lookback:
+            raise ValueError(f"{interval} bars are only available for the last {lookback.days} days; "
+                             f"start the run later or use a coarser interval.")
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.DataFrame:
+        import yfinance as yf
+        limits = YFINANCE_INTRADAY_LIMITS.get(normalize_interval(interval))
+        if limits is None:
+            return normalize_bars(yf.download(ticker, start=start, end=end, interval=interval, progress=False))
+
+        lookback, span = limits
+        start = max(_naive(start), pd.Timestamp.now("UTC").tz_convert(None) - lookback + YFINANCE_LOOKBACK_MARGIN)
+        end = _naive(end)
+        frames = []
+        while start < end:
+            chunk_end = min(start + span, end)
+            data = yf.download(ticker, start=start, end=chunk_end, interval=interval, progress=False)
+            if not data.empty:
+                frames.append(normalize_bars(data))
+            start = chunk_end
+        return normalize_bars(pd.concat(frames)) if frames else empty_bars()
+
+
+class CSVSource:
+    """
+    Serves bars from local `<ticker>.csv` files (e.g. test fixtures).
+    Each file needs a date column followed by OHLCV columns.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.DataFrame:
+        path = os.path.join(self.directory, f"{ticker}.csv")
+        if not os.path.exists(path):
+            return empty_bars()
+        data = normalize_bars(pd.read_csv(path, index_col=0, parse_dates=True))
+        return slice_bars(data, start, end)
+
+
+def make_source(spec: str = MARKET_DATA_SOURCE):
+    """The data source named by a MARKET_DATA_SOURCE value."""
+    if spec == "yfinance":
+        return YFinanceSource()
+    if spec == "synthetic":
+        from .replay import SyntheticSource
+        return SyntheticSource()
+    if spec.startswith("csv:"):
+        return CSVSource(spec[len("csv:"):])
+    raise ValueError(f"Unknown MARKET_DATA_SOURCE '{spec}'; use yfinance, synthetic or csv:<dir>.")
+
+
+def normalize_bars(data: pd.DataFrame) -> pd.DataFrame:
+    """Flattens yfinance's (field, ticker) columns and sorts by timestamp."""
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.copy()
+        data.columns = data.columns.get_level_values(0)
+    data = data[~data.index.duplicated(keep='last')].sort_index()
+    data.index.name = 'Date'
+    return data
+
+
+def slice_bars(data: pd.DataFrame, start, end) -> pd.DataFrame:
+    """Returns the rows in [start, end) without copying."""
+    start, end = _align_tz(pd.Timestamp(start), data.index), _align_tz(pd.Timestamp(end), data.index)
+    lo = data.index.searchsorted(start, side='left')
+    hi = data.index.searchsorted(end, side='left')
+    return data.iloc[lo:hi]
+
+
+def _align_tz(ts: pd.Timestamp, index: pd.Index) -> pd.Timestamp:
+    tz = getattr(index, 'tz', None)
+    if tz is not None and ts.tzinfo is None:
+        return ts.tz_localize(tz)
+    if tz is None and ts.tzinfo is not None:
+        return ts.tz_convert(None)
+    return ts
+
+
+# --- Market Data Store ---
+
+class MarketDataStore:
+    """
+    Local columnar cache of OHLCV bars keyed by (ticker, interval).
+
+    Bars are persisted as uncompressed Arrow IPC files and memory-mapped on
+    read. A JSON sidecar records the date range the source has returned bars
+    for so far, so only the missing head/tail ranges are fetched. A fetch
+    that returns nothing (yfinance's answer to errors and rate limits too)
+    is not recorded, so the range is fetched again next time.
+    Least recently used files are evicted once the cache exceeds `max_bytes`.
+    Coarser intervals are built from cached finer bars (see `timeframes.py`).
+    """
+
+    def __init__(self, source=None, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.source = source or make_source()
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.resampled = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # --- Public API ---
+    def get_bars(self, ticker: str, start_date, end_date, interval: str = "1d") -> pd.DataFrame:
+        """
+        Bars of `ticker` in [start_date, end_date). A range not cached at
+        `interval` but cached at a finer interval that builds it (e.g. "1h"
+        from "5m", "1d" from "1m") is resampled from those bars instead of
+        being fetched.
+        """
+        interval = normalize_interval(interval)
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        with self._lock:
+            meta = self._read_meta(ticker, interval)
+            missing = self._missing_ranges(meta, start, end)
+            source = None if not missing else self._resample_source(ticker, interval, start, end)
+
+            if not missing:
+                self.hits += 1
+                data = self._read_bars(ticker, interval)
+            elif source is not None:
+                self.hits += 1
+                self.resampled += 1
+                data = self._read_bars(ticker, source)
+            else:
+                self.misses += 1
+                data = self._refresh(ticker, interval, meta, missing)
+
+        if source is not None:
+            return resample_bars(slice_bars(data, start, end), interval)
+        return slice_bars(data, start, end)
+
+    def check_range(self, ticker: str, start_date, end_date, interval: str = "1d"):
+        """
+        Raises ValueError if the source cannot serve the part of
+        [start_date, end_date) that `get_bars` would have to fetch.
+        """
+        check = getattr(self.source, "check_range", None)
+        if check is None:
+            return
+        interval = normalize_interval(interval)
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        with self._lock:
+            missing = self._missing_ranges(self._read_meta(ticker, interval), start, end)
+            if missing and self._resample_source(ticker, interval, start, end) is not None:
+                missing = []
+        for range_start, range_end in missing:
+            check(range_start, range_end, interval)
+
+    def data_version(self, ticker: str, interval: str = "1d") -> float | None:
+        """
+        Timestamp of the last write for (ticker, interval) or for the finer
+        intervals it can be resampled from, or None if none is cached.
+        """
+        interval = normalize_interval(interval)
+        metas = [self._read_meta(ticker, i) for i in (interval, *finer_intervals(interval))]
+        versions = [meta["updated_at"] for meta in metas if meta]
+        return max(versions) if versions else None
+
+    def warm(self, tickers: list | None = None, interval: str = "1d", max_bytes: int | None = None) -> int:
+        """
+        Reads cached bar files (those of `tickers`, or all, most recently used
+        first) into the OS page cache, up to `max_bytes`. Never fetches.
+        Returns the number of files read.
+        """
+        if tickers is None:
+            paths = [path for path, _, _ in sorted(self._cached_files(), key=lambda f: -f[1]) if path.endswith(".arrow")]
+        else:
+            paths = [self._paths(ticker, interval)[0] for ticker in tickers]
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        warmed = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                if size > budget:
+                    break
+                feather.read_table(path, memory_map=False)
+            except (FileNotFoundError, pa.ArrowInvalid):
+                continue
+            budget -= size
+            warmed += 1
+        return warmed
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "resampled": self.resampled,
+            "evictions": self.evictions,
+            "size_bytes": sum(size for _, _, size in self._cached_files()),
+            "max_bytes": self.max_bytes,
+        }
+
+    # --- Internals ---
+    def _resample_source(self, ticker: str, interval: str, start: pd.Timestamp, end: pd.Timestamp) -> str | None:
+        """The coarsest cached interval that covers [start, end) and builds `interval`, if any."""
+        for source in finer_intervals(interval):
+            if not self._missing_ranges(self._read_meta(ticker, source), start, end):
+                return source
+        return None
+
+    def _paths(self, ticker: str, interval: str):
+        base = os.path.join(self.cache_dir, interval, ticker.replace("/", "_"))
+        return f"{base}.arrow", f"{base}.json"
+
+    def _read_meta(self, ticker: str, interval: str) -> dict | None:
+        _, meta_path = self._paths(ticker, interval)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _missing_ranges(self, meta: dict | None, start: pd.Timestamp, end: pd.Timestamp) -> list:
+        if meta is None:
+            return [(start, end)]
+        covered_start, covered_end = pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"])
+        missing = []
+        if start < covered_start:
+            missing.append((start, covered_start))
+        if end > covered_end:
+            missing.append((covered_end, end))
+        return missing
+
+    def _read_bars(self, ticker: str, interval: str) -> pd.DataFrame:
+        data_path, _ = self._paths(ticker, interval)
+        try:
+            table = feather.read_table(data_path, memory_map=True)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return empty_bars()
+        os.utime(data_path)  # Marks the file as recently used for eviction
+        return table.to_pandas(split_blocks=True).set_index('Date')
+
+    def _refresh(self, ticker: str, interval: str, meta: dict | None, missing: list) -> pd.DataFrame:
+        frames = [self._read_bars(ticker, interval)] if meta else []
+        covered = (pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"])) if meta else None
+        extended = False
+        for range_start, range_end in missing:
+            print(f"Fetching {ticker} ({interval}) bars from {range_start.date()} to {range_end.date()}...")
+            fetched = self.source.fetch(ticker, range_start, range_end, interval)
+            if fetched.empty:
+                continue
+            frames.append(fetched)
+            span = _returned_span(fetched.index, range_start, range_end, interval)
+            # Coverage stays one contiguous range; bars beyond a gap are kept but fetched again
+            if covered is None or (span[0] <= covered[1] and span[1] >= covered[0]):
+                covered = span if covered is None else (min(covered[0], span[0]), max(covered[1], span[1]))
+                extended = True
+
+        frames = [frame for frame in frames if not frame.empty]
+        data = normalize_bars(pd.concat(frames)) if frames else empty_bars()
+        if not extended:
+            return data
+
+        # Never mark today as covered, so the still-forming bar is refetched later
+        covered_end = min(covered[1], pd.Timestamp.now().normalize())
+        self._write(ticker, interval, data, covered[0], max(covered_end, covered[0]))
+        return data
+
+    def _write(self, ticker: str, interval: str, data: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp):
+        data_path, meta_path = self._paths(ticker, interval)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+        if not data.empty:
+            frame = data.reset_index()
+            tmp_path = f"{data_path}.{os.getpid()}.tmp"
+            feather.write_feather(frame, tmp_path, compression='uncompressed')
+            os.replace(tmp_path, data_path)
+
+        meta = {"start": start.isoformat(), "end": end.isoformat(), "updated_at": time.time(), "rows": len(data)}
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+        self._evict(keep=data_path)
+
+    def _cached_files(self):
+        """
+        Yields (path, last_used, size) for every cached bar file, and for every
+        sidecar left without one (its range would otherwise read as covered).
+        """
+        for root, _, files in os.walk(self.cache_dir):
+            names = set(files)
+            for name in files:
+                orphaned = name.endswith(".json") and f"{name[:-len('.json')]}.arrow" not in names
+                if name.endswith(".arrow") or orphaned:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def _evict(self, keep: str):
+        files = sorted(self._cached_files(), key=lambda f: f[1])
+        total = sum(size for _, _, size in files)
+        for path, _, size in files:
+            if path.endswith(".json"):  # Orphaned sidecars go regardless of the size budget
+                os.remove(path)
+                total -= size
+                continue
+            if total <= self.max_bytes or path == keep:
+                continue
+            os.remove(path)
+            meta_path = path[:-len(".arrow")] + ".json"
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            total -= size
+            self.evictions += 1
+
+
+def _returned_span(index: pd.DatetimeIndex, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> tuple:
+    """
+    The part of [start, end) the returned bars in `index` vouch for: the
+    requested bounds where the bars reach within the edge gap of them,
+    otherwise the first and last bar (in exchange-local time, like requests).
+    """
+    first, last = (ts.tz_localize(None) if ts.tzinfo is not None else ts for ts in (index[0], index[-1]))
+    gap = EDGE_GAPS.get(interval, DEFAULT_EDGE_GAP)
+    return (start if first - start <= gap else first), (end if end - last <= gap else last)
+
+
+# --- Shared Store ---
+_store = None
+
+
+def get_market_data_store() -> MarketDataStore:
+    global _store
+    if _store is None:
+        _store = MarketDataStore()
+    return _store
+
+
+def set_market_data_store(store: MarketDataStore):
+    """Swaps the process-wide store, e.g. for one backed by a `CSVSource`."""
+    global _store
+    _store = store
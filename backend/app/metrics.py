@@ -0,0 +1,235 @@
+# app/metrics.py
+
+import os
+
+import numpy as np
+import pandas as pd
+from .execution import EXIT_REASONS
+from .results import ROLLING_DTYPE, encode_arrays
+from .timeframes import elapsed_days, periods_per_year
+
+# --- Configuration ---
+# Rolling statistics cover about three months of bars unless a window (in
+# bars) is set, and are stored at no more than ROLLING_MAX_POINTS points.
+ROLLING_WINDOW_BARS = int(os.getenv("METRICS_ROLLING_WINDOW", "0"))
+ROLLING_MAX_POINTS = int(os.getenv("METRICS_ROLLING_MAX_POINTS", "2000"))
+
+RATIO_METRICS = ("sharpe_ratio", "sortino_ratio", "calmar_ratio", "alpha_pct", "beta")
+OPEN_EXIT = next(code for code, reason in EXIT_REASONS.items() if reason == "open")
+
+
+# --- Equity Metrics ---
+# Every statistic is derived from one matrix of bar returns and one running
+# peak per column, so a (bars, curves) matrix of thousands of sweep
+# combinations is evaluated with a handful of 2-D array operations, and a
+# single backtest is just the one-column case.
+
+def equity_metrics(equity: np.ndarray, index: pd.DatetimeIndex, start: np.ndarray | None = None,
+                   benchmark: np.ndarray | None = None) -> dict:
+    """
+    Metrics of each column of a (bars, curves) equity matrix. `start` holds
+    the first valid bar of each column (its indicator warm-up), so every
+    column is measured over the same rows a single backtest of it would see.
+    `benchmark` (prices over the same bars, e.g. the traded close) adds alpha
+    and beta against buying and holding it. Returns unrounded arrays.
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.ndim == 1:
+        equity = equity[:, None]
+    n, k = equity.shape
+    start = np.zeros(k, dtype=np.int64) if start is None else np.asarray(start, dtype=np.int64)
+    cols, rows = np.arange(k), np.arange(n, dtype=np.int32 if n < 2**31 else np.int64)
+    first = equity[start, cols]
+    last = equity[-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_return_pct = np.where(first != 0, (last / first - 1) * 100, 0.0)
+        days = np.asarray(elapsed_days(index[start], index[-1]), dtype=np.float64)
+        annualized_return_pct = np.where(
+            days > 0, ((1 + total_return_pct / 100) ** (365.0 / np.where(days > 0, days, 1)) - 1) * 100, 0.0
+        )
+
+        # Bar returns before each column's start are masked out. The (bars,
+        # curves) temporaries are built in place and dropped as soon as they
+        # are used, so the one-column case stays close to the size of its curve.
+        before_start = rows[1:, None] <= start[None, :]
+        count = n - 1 - np.minimum(start, n - 1)
+        # Fewer than two returns have no spread (and no drawdown worth a duration)
+        spread = count >= 2
+        returns = np.divide(equity[1:], equity[:-1])
+        returns -= 1
+        np.copyto(returns, 0.0, where=before_start)
+        mean = returns.sum(axis=0) / np.maximum(count, 1)
+        centered = returns - mean
+        np.copyto(centered, 0.0, where=before_start)
+        std = np.where(spread, np.sqrt(np.einsum('ij,ij->j', centered, centered) / np.maximum(count - 1, 1)), 0.0)
+        np.minimum(returns, 0.0, out=returns)
+        downside = np.sqrt(np.einsum('ij,ij->j', returns, returns) / np.maximum(count, 1))
+        del returns
+        # Annualized by the bar frequency over each column's own rows
+        bars_per_year = periods_per_year(index, start)
+        annualization = np.sqrt(bars_per_year)
+
+        if benchmark is not None:
+            benchmark = np.asarray(benchmark, dtype=np.float64)
+            bench = np.nan_to_num(benchmark[1:] / benchmark[:-1] - 1)[:, None]
+            bench_mean = np.where(before_start, 0.0, bench).sum(axis=0) / np.maximum(count, 1)
+            bench_centered = np.where(before_start, 0.0, bench - bench_mean)
+            beta = np.einsum('ij,ij->j', centered, bench_centered) / np.einsum('ij,ij->j', bench_centered, bench_centered)
+            del bench_centered
+        del centered, before_start
+
+        # Equity is flat at the initial cash before `start`, so the running max is unaffected
+        peak = np.maximum.accumulate(equity, axis=0)
+        at_peak = equity >= peak
+        np.divide(equity, peak, out=peak)
+        max_drawdown_pct = (peak.min(axis=0) - 1) * 100
+        del peak
+        # Bars since the latest peak; the longest such stretch is the longest drawdown
+        last_peak = np.where(at_peak, rows[:, None], rows.dtype.type(0))
+        del at_peak
+        np.maximum.accumulate(last_peak, axis=0, out=last_peak)
+        deepest = np.argmax(rows[:, None] - last_peak, axis=0)
+        max_drawdown_days = np.where(spread, np.asarray(
+            elapsed_days(index[last_peak[deepest, cols]], index[deepest]), dtype=np.float64), 0.0)
+        del last_peak
+
+        metrics = {
+            "total_return_pct": total_return_pct,
+            "annualized_return_pct": annualized_return_pct,
+            "sharpe_ratio": np.where(std > 0, mean / std * annualization, 0.0),
+            "max_drawdown_pct": max_drawdown_pct,
+            "sortino_ratio": np.where(downside > 0, mean / downside * annualization, 0.0),
+            "calmar_ratio": np.where(max_drawdown_pct < 0, annualized_return_pct / -max_drawdown_pct, 0.0),
+            "volatility_pct": std * annualization * 100,
+            "max_drawdown_days": max_drawdown_days,
+        }
+        if benchmark is not None:
+            metrics["beta"] = beta
+            metrics["alpha_pct"] = (mean - beta * bench_mean) * bars_per_year * 100
+
+    for name in RATIO_METRICS:
+        if name in metrics:
+            metrics[name] = np.nan_to_num(metrics[name], posinf=0.0, neginf=0.0)
+    return metrics
+
+
+def calculate_performance_metrics_batch(equity: np.ndarray, index: pd.DatetimeIndex, start: np.ndarray,
+                                        benchmark: np.ndarray | None = None) -> dict:
+    """Vectorized `calculate_performance_metrics` for a (bars, combinations) equity matrix (see `equity_metrics`)."""
+    return equity_metrics(equity, index, start, benchmark)
+
+
+def calculate_performance_metrics(equity_curve: pd.Series, benchmark: np.ndarray | None = None) -> dict:
+    """Calculates key and extended performance metrics from an equity curve (rounded)."""
+    if equity_curve.empty or equity_curve.iloc[0] == 0:
+        return {
+            "total_return_pct": 0,
+            "annualized_return_pct": 0,
+            "sharpe_ratio": 0,
+            "max_drawdown_pct": 0
+        }
+    metrics = equity_metrics(equity_curve.to_numpy(), equity_curve.index, benchmark=benchmark)
+    return {name: round(float(values[0]), 2) for name, values in metrics.items()}
+
+
+def format_key_metrics(metrics: dict, final_value: float) -> list:
+    return [
+        {"label": "Final Portfolio Value", "value": f"₹{final_value:,.2f}"},
+        {"label": "Total Return", "value": f"{metrics['total_return_pct']}%", "positive": bool(metrics['total_return_pct'] > 0)},
+        {"label": "Annualized Return", "value": f"{metrics['annualized_return_pct']}%"},
+        {"label": "Sharpe Ratio", "value": f"{metrics['sharpe_ratio']}"},
+        {"label": "Max Drawdown", "value": f"{metrics['max_drawdown_pct']}%", "positive": bool(metrics['max_drawdown_pct'] > -15)},
+    ]
+
+
+# --- Trade Metrics ---
+
+def trade_metrics(ledger: dict, equity: np.ndarray, index: pd.DatetimeIndex) -> dict:
+    """
+    Win rate, profit factor, exposure (share of bar returns spent in a
+    position) and annual turnover (traded notional over average equity)
+    from a trade ledger (see `execution.LEDGER_COLUMNS`); open positions
+    count towards exposure and turnover but not towards the trade statistics.
+    """
+    closed = ledger["exit_reason"] != OPEN_EXIT
+    pnl = ledger["pnl"][closed]
+    entry_value = ledger["quantity"] * ledger["entry_price"]
+    gross_profit, gross_loss = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+
+    notional = entry_value.sum() + (ledger["quantity"] * ledger["exit_price"])[closed].sum()
+    years = elapsed_days(index[0], index[-1]) / 365.25 if len(index) > 1 else 0
+    turnover = notional / np.mean(equity) / (years if years > 0 else 1)
+    in_market = (ledger["exit_bar"] - ledger["entry_bar"]).sum()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            "win_rate_pct": round(float((pnl > 0).mean() * 100), 2) if len(pnl) else 0,
+            "profit_factor": round(float(gross_profit / gross_loss), 2) if gross_loss > 0 else 0,
+            "avg_trade_return_pct": round(float(np.mean(pnl / entry_value[closed]) * 100), 2) if len(pnl) else 0,
+            "exposure_pct": round(float(in_market / max(len(equity) - 1, 1) * 100), 2),
+            "turnover": round(float(turnover), 2),
+        }
+
+
+# --- Rolling Metrics ---
+
+def rolling_window(index: pd.DatetimeIndex) -> int:
+    """Bars per rolling window: METRICS_ROLLING_WINDOW, or about three months at the bar frequency."""
+    return ROLLING_WINDOW_BARS or max(2, int(round(periods_per_year(index) / 4)))
+
+
+def rolling_metrics(equity: np.ndarray, index: pd.DatetimeIndex, window: int | None = None,
+                    max_points: int = ROLLING_MAX_POINTS):
+    """
+    Rolling Sharpe ratio and volatility over `window` bars plus the
+    drawdown, from running sums of the bar returns (O(bars) for any window).
+    Returns (bar positions, {name: float array}) sampled down to at most
+    `max_points` points, or None if the curve is shorter than one window.
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    window = window or rolling_window(index)
+    n = len(equity)
+    if n <= window:
+        return None
+
+    # Row i of the window arrays ends on bar `window + i`
+    step = -(-(n - window) // max_points)
+    positions = np.arange(window, n, step)
+    if positions[-1] != n - 1:
+        positions = np.append(positions, n - 1)
+    rows = positions - window
+
+    # Only the sampled windows are needed, so each running sum is read at
+    # their bounds and its buffer reused: two curve-length arrays at most
+    returns = np.divide(equity[1:], equity[:-1])
+    returns -= 1
+    running = np.empty(n)
+    running[0] = 0.0
+    np.cumsum(returns, out=running[1:])
+    window_sum = running[positions] - running[rows]
+    np.square(returns, out=returns)
+    np.cumsum(returns, out=running[1:])
+    window_squares = running[positions] - running[rows]
+    del returns, running
+    mean = window_sum / window
+    std = np.sqrt(np.maximum(window_squares - window_sum * mean, 0.0) / (window - 1))
+    annualization = np.sqrt(periods_per_year(index))
+
+    peak = np.maximum.accumulate(equity)[positions]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 1e-12, mean / std * annualization, 0.0)
+    return positions, {
+        "rolling_sharpe": sharpe,
+        "rolling_volatility_pct": std * annualization * 100,
+        "drawdown_pct": (equity[positions] - peak) / peak * 100,
+    }
+
+
+def encode_rolling_metrics(equity: np.ndarray, index: pd.DatetimeIndex) -> dict | None:
+    """`rolling_metrics` of a curve as packed columns for a result (see results.py), or None if it is too short."""
+    rolling = rolling_metrics(equity, index)
+    if rolling is None:
+        return None
+    positions, columns = rolling
+    return encode_arrays(index[positions], columns, 'date', dtype=ROLLING_DTYPE)
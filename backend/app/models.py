@@ -4,13 +4,56 @@ from sqlalchemy import Column, Integer, String, ForeignKey, JSON
 from .database import Base
 
 # --- Pydantic Model for API Data ---
+class ExecutionSettings(BaseModel):
+    commission_bps: float = Field(default=0.0, ge=0, example=5)
+    commission_per_trade: float = Field(default=0.0, ge=0, example=20)
+    slippage_bps: float = Field(default=0.0, ge=0, example=2)
+    slippage_model: Literal["fixed", "volatility"] = Field(default="fixed")
+    slippage_vol_multiplier: float = Field(default=0.0, ge=0, description="Multiple of the rolling return volatility added to each fill (volatility model)")
+    slippage_window: int = Field(default=20, ge=2, le=1000)
+    fill: Literal["close", "next_open"] = Field(default="close", example="next_open")
+    sizing: Literal["fractional", "integer"] = Field(default="fractional", example="integer")
+    position_pct: float = Field(default=1.0, gt=0, le=1, description="Fraction of equity committed per entry")
+    stop_loss_pct: float | None = Field(default=None, gt=0, lt=100, example=5)
+    take_profit_pct: float | None = Field(default=None, gt=0, example=10)
+    allow_short: bool = Field(default=False)
+
 class StrategyDefinition(BaseModel):
     strategyName: str = Field(..., example="My Volatility Breakout Strategy")
-    ticker: str = Field(..., example="TSLA")
-    strategyType: Literal["TrendFollowing", "MeanReversion", "Volatility"] = Field(..., example="Volatility")
+    ticker: str | None = Field(default=None, example="TSLA")
+    tickers: List[str] | None = Field(default=None, example=["RELIANCE.NS", "TCS.NS", "INFY.NS"])
+    universe: str | None = Field(default=None, example="data.csv")
+    allocation: Dict[str, float] | None = Field(default=None, example={"RELIANCE.NS": 0.5, "TCS.NS": 0.3, "INFY.NS": 0.2})
+    strategyType: Literal["TrendFollowing", "MeanReversion", "Volatility", "Custom"] = Field(..., example="Volatility")
     ml_model_set: Literal["SetA", "SetB"] | None = Field(default=None, example="SetA")
     ml_model: Literal["RandomForest", "GradientBoosting", "Ensemble"] | None = Field(default=None, example="Ensemble")
-    rules: List[Dict[str, Any]] = Field(default_factory=list)
+    rules: List[Dict[str, Any]] = Field(default_factory=list, description="Rules of a Custom strategy (see app/rules.py)",
+                                        example=[{"action": "buy", "conditions": [{"left": {"indicator": "sma", "length": 50}, "op": "cross-above", "right": {"indicator": "sma", "length": 200}}]},
+                                                 {"action": "sell", "conditions": [{"left": "rsi", "op": "greater-than", "right": 70}]}])
+    execution: ExecutionSettings | None = Field(default=None, description="Costs, fills, sizing and exits; omitted means frictionless all-in/all-out at the close")
+    interval: Literal["1m", "5m", "15m", "30m", "1h", "1d", "1wk", "1mo"] = Field(default="1d", example="1h", description="Bar interval; coarser bars are resampled from cached finer ones")
+    start_date: str = Field(default="2020-01-01", example="2020-01-01", description="Date or ISO timestamp (intraday)")
+    end_date: str = Field(default="2023-12-31", example="2023-12-31")
+
+class ParameterRange(BaseModel):
+    values: List[float] | None = Field(default=None, example=[10, 20, 50])
+    start: float | None = Field(default=None, example=10)
+    stop: float | None = Field(default=None, example=100)
+    step: float | None = Field(default=None, example=10)
+
+RankBy = Literal["sharpe_ratio", "sortino_ratio", "calmar_ratio", "alpha_pct", "total_return_pct", "annualized_return_pct", "max_drawdown_pct"]
+
+class SweepDefinition(StrategyDefinition):
+    parameters: Dict[str, ParameterRange] = Field(..., example={"fast_ma": {"start": 10, "stop": 100, "step": 10}, "slow_ma": {"values": [150, 200, 250]}})
+    rank_by: RankBy = Field(default="sharpe_ratio")
+    top_n: int = Field(default=50, ge=1, le=1000)
+
+class WalkForwardDefinition(StrategyDefinition):
+    folds: int = Field(default=5, ge=1, le=50)
+    mode: Literal["rolling", "anchored"] = Field(default="rolling")
+    train_ratio: float = Field(default=3.0, gt=0, le=20, description="Training window length in test windows (rolling mode)")
+    parameters: Dict[str, ParameterRange] = Field(default_factory=dict, example={"fast_ma": {"values": [20, 50]}, "slow_ma": {"values": [100, 200]}})
+    rank_by: RankBy = Field(default="sharpe_ratio")
 
 class UserCreate(BaseModel):
     username: str
@@ -0,0 +1,261 @@
+# app/portfolio.py
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import billiard
+import numpy as np
+import pandas as pd
+from . import engine
+from .backtester import (execution_config, get_ml_predictions_many, ml_confirmation, no_checkpoint, no_progress,
+                         strategy_signals)
+from .barstore import BarStore
+from .execution import ledger_summary, simulate_execution
+from .inference import FEATURE_COLUMNS
+from .market_data import get_market_data_store
+from .metrics import calculate_performance_metrics, encode_rolling_metrics, format_key_metrics, trade_metrics
+from .results import RESULT_FORMAT, ROLLING_KEY, encode_columns
+from .rules import CUSTOM_STRATEGY
+from .signals import SIGNAL_BUILDERS
+from .timeframes import normalize_interval
+from .universe import read_universe
+
+# --- Configuration ---
+MAX_WORKERS = int(os.getenv("PORTFOLIO_MAX_WORKERS", os.cpu_count() or 1))
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def is_portfolio(strategy_json: dict) -> bool:
+    return bool(strategy_json.get("tickers") or strategy_json.get("universe"))
+
+
+def load_universe(name: str) -> list:
+    """Reads the symbols of a universe CSV in UNIVERSE_DIR (e.g. `data.csv`)."""
+    return read_universe(name)["Symbol"].tolist()
+
+
+def resolve_tickers(strategy_json: dict) -> list:
+    tickers = list(strategy_json.get("tickers") or [])
+    if strategy_json.get("universe"):
+        tickers += load_universe(strategy_json["universe"])
+    return list(dict.fromkeys(t.strip() for t in tickers if t.strip()))
+
+
+def resolve_weights(tickers: list, allocation: dict | None) -> np.ndarray:
+    """Equal weight by default; a custom allocation is normalized to sum to 1."""
+    if not allocation:
+        return np.full(len(tickers), 1.0 / len(tickers))
+    weights = np.array([float(allocation.get(t, 0.0)) for t in tickers])
+    if (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError("Allocation weights must be non-negative and not all zero.")
+    return weights / weights.sum()
+
+
+# --- Shared-Memory Price Arrays ---
+# All tickers' OHLCV bars are packed into one (rows, 5) float64 block plus a
+# matching int64 timestamp block. Workers attach to the blocks once and build
+# each ticker's frame from a slice, so prices are never pickled per task.
+
+class SharedPriceArrays:
+    def __init__(self, frames: dict):
+        self.offsets = {}
+        total = sum(len(f) for f in frames.values())
+        self._prices = shared_memory.SharedMemory(create=True, size=max(total * len(PRICE_COLUMNS) * 8, 1))
+        self._dates = shared_memory.SharedMemory(create=True, size=max(total * 8, 1))
+        prices = np.ndarray((total, len(PRICE_COLUMNS)), dtype=np.float64, buffer=self._prices.buf)
+        dates = np.ndarray((total,), dtype=np.int64, buffer=self._dates.buf)
+
+        row = 0
+        for ticker, frame in frames.items():
+            prices[row:row + len(frame)] = frame[PRICE_COLUMNS].to_numpy(dtype=np.float64)
+            dates[row:row + len(frame)] = frame.index.as_unit('ns').asi8
+            self.offsets[ticker] = (row, row + len(frame))
+            row += len(frame)
+        self.shape = (total, len(PRICE_COLUMNS))
+        self.tz = str(next(iter(frames.values())).index.tz or "") or None
+
+    @property
+    def handle(self):
+        return self._prices.name, self._dates.name, self.shape, self.tz
+
+    def close(self):
+        for block in (self._prices, self._dates):
+            block.close()
+            block.unlink()
+
+
+_worker_arrays = None
+
+
+def _attach_block(name: str, forked: bool) -> shared_memory.SharedMemory:
+    """
+    Maps a shared block the parent owns. Attaching registers the block with
+    the resource tracker, which unlinks what it tracks when its process
+    exits: a forked worker shares the parent's tracker (the block is
+    registered there already), but a spawned worker's own tracker would
+    unlink the block under the parent, so the registration is withdrawn.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    if not forked:
+        resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def _attach_worker(prices_name: str, dates_name: str, shape: tuple, tz: str | None, forked: bool):
+    """Process-pool initializer: maps the shared price blocks into the worker."""
+    global _worker_arrays
+    prices_block = _attach_block(prices_name, forked)
+    dates_block = _attach_block(dates_name, forked)
+    _worker_arrays = (
+        prices_block, dates_block,
+        np.ndarray(shape, dtype=np.float64, buffer=prices_block.buf),
+        np.ndarray((shape[0],), dtype=np.int64, buffer=dates_block.buf),
+        tz,
+    )
+
+
+def _frame_signals(ticker: str, frame: pd.DataFrame, strategy: dict):
+    """Runs the strategy on one ticker and returns the surviving rows (positions, or a slice) and signals."""
+    valid = BarStore.from_frame(frame).dropna()
+    buy, sell, start = strategy_signals(valid, strategy)
+    rows = slice(start, None) if len(valid) == len(frame) else frame.index.get_indexer(valid.index[start:])
+    return ticker, rows, buy[start:], sell[start:]
+
+
+def _ticker_signals(ticker: str, start: int, stop: int, strategy: dict):
+    """Worker task: runs the strategy on one ticker's slice of the shared arrays; returns the worker's pid too."""
+    _, _, prices, dates, tz = _worker_arrays
+    index = pd.DatetimeIndex(dates[start:stop], tz="UTC" if tz else None, name='Date')
+    if tz:
+        index = index.tz_convert(tz)
+    frame = pd.DataFrame(prices[start:stop], index=index, columns=PRICE_COLUMNS)
+    return os.getpid(), _frame_signals(ticker, frame, strategy)
+
+
+def _generate_signals(frames: dict, strategy: dict) -> tuple:
+    """
+    Fans per-ticker signal generation out over a process pool; `strategy`
+    holds the strategy type (and rules). Returns the signals and the number
+    of processes that computed them. Pool processes are started through billiard (Celery's
+    multiprocessing fork), which unlike the standard library allows it from
+    the daemonic children of Celery's prefork pool, where portfolio jobs run.
+    """
+    if MAX_WORKERS <= 1 or len(frames) < 2:
+        return [_frame_signals(ticker, frame[PRICE_COLUMNS], strategy) for ticker, frame in frames.items()], 1
+
+    arrays = SharedPriceArrays(frames)
+    try:
+        jobs = [(ticker, *arrays.offsets[ticker], strategy) for ticker in frames]
+        workers = min(MAX_WORKERS, len(jobs))
+        context = billiard.get_context()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_attach_worker,
+                                 initargs=(*arrays.handle, context.get_start_method() == "fork")) as pool:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            results = list(pool.map(_ticker_signals, *zip(*jobs), chunksize=chunksize))
+        return [signals for _, signals in results], len({pid for pid, _ in results})
+    finally:
+        arrays.close()
+
+
+# --- Portfolio Simulation ---
+
+def run_portfolio_simulation(strategy_json: dict, start_date: str, end_date: str, progress=no_progress, checkpoint=no_checkpoint):
+    strategy_type = strategy_json.get("strategyType")
+    ml_model_set = strategy_json.get("ml_model_set")
+    ml_model_name = strategy_json.get("ml_model")
+    if strategy_type not in SIGNAL_BUILDERS and strategy_type != CUSTOM_STRATEGY:
+        raise ValueError(f"Unknown strategy type: {strategy_type}")
+    execution = execution_config(strategy_json)
+
+    tickers = resolve_tickers(strategy_json)
+    if not tickers:
+        raise ValueError("Portfolio backtest needs at least one ticker.")
+    print(f"Running {strategy_type} portfolio backtest over {len(tickers)} tickers...")
+
+    # 1. Fetch data (served from the local market data cache where possible)
+    store = get_market_data_store()
+    interval = normalize_interval(strategy_json.get("interval"))
+    frames = {}
+    for ticker in tickers:
+        data = store.get_bars(ticker, start_date, end_date, interval)
+        if data.empty or not all(col in data.columns for col in PRICE_COLUMNS):
+            print(f"Skipping {ticker}: no data fetched.")
+            continue
+        frames[ticker] = data
+    if not frames:
+        raise ValueError("No data fetched.")
+    tickers = list(frames)
+    weights = resolve_weights(tickers, strategy_json.get("allocation"))
+    progress("data_fetched", 20, tickers=len(tickers))
+
+    # 2. Per-ticker signals across the process pool
+    signals, processes = _generate_signals(frames, {"strategyType": strategy_type, "rules": strategy_json.get("rules")})
+    progress("signals_computed", 50, processes=processes)
+
+    # 3. ML confirmation and simulation per ticker, each as its own sleeve
+    sleeves = {}
+    constituents = []
+    signal_bars = {}
+    for ticker, rows, buy, sell in signals:
+        bars = BarStore.from_frame(frames[ticker], PRICE_COLUMNS).take(rows)
+        bars.add('buy_signal', buy)
+        bars.add('sell_signal', sell)
+        signal_bars[ticker] = bars
+
+    # All tickers are scored together in one stacked predict call per model
+    ml_preds = {}
+    if ml_model_set and ml_model_name:
+        print(f"Generating predictions with {ml_model_name} from {ml_model_set} for {len(signal_bars)} tickers...")
+        features = {ticker: bars.frame(FEATURE_COLUMNS) for ticker, bars in signal_bars.items()}
+        ml_preds = get_ml_predictions_many(ml_model_set, ml_model_name, features)
+        progress("predictions_ready", 65)
+
+    for (ticker, bars), weight in zip(signal_bars.items(), weights):
+        if not len(bars):
+            continue
+        if ml_model_set and ml_model_name:
+            bars['buy_signal'][:] &= ml_confirmation(ml_preds[ticker], bars.index)
+        values, ledger = simulate_execution(bars['Open'], bars['High'], bars['Low'], bars['Close'],
+                                            bars['buy_signal'], bars['sell_signal'], execution)
+        equity = pd.Series(values, index=bars.index.rename('date'))
+        sleeves[ticker] = equity * weight
+        metrics = calculate_performance_metrics(equity, benchmark=bars['Close'])
+        metrics.update(trade_metrics(ledger, values, bars.index))
+        constituents.append({"ticker": ticker, "weight": round(float(weight), 4), **metrics,
+                             "tradeSummary": ledger_summary(ledger)})
+        checkpoint(lambda n=len(constituents): {"strategyType": strategy_type, "tickersSimulated": n,
+                                                "tickersTotal": len(signal_bars), "constituents": constituents[:n]})
+
+    if not sleeves:
+        raise ValueError("Not enough data to simulate any ticker.")
+
+    # 4. Combine: each sleeve is held as cash before its first bar and carried forward after its last
+    sleeve_frame = pd.concat(sleeves, axis=1).sort_index().ffill()
+    idle_cash = pd.Series({t: engine.INITIAL_CASH * w for t, w in zip(tickers, weights)})
+    sleeve_frame = sleeve_frame.fillna(idle_cash[sleeve_frame.columns])
+    unallocated = engine.INITIAL_CASH * weights[[t not in sleeves for t in tickers]].sum()
+    equity_df = (sleeve_frame.sum(axis=1) + unallocated).rename('portfolio_value').to_frame()
+    equity_df.index.name = 'date'
+
+    progress("simulated", 85, bars=len(equity_df))
+    metrics = calculate_performance_metrics(equity_df['portfolio_value'])
+    progress("metrics_ready", 95, metrics=metrics)
+
+    results = {
+        "format": RESULT_FORMAT,
+        "keyMetrics": format_key_metrics(metrics, equity_df['portfolio_value'].iloc[-1]),
+        "metrics": metrics,
+        "performanceData": encode_columns(equity_df, 'date'),
+        "execution": execution.to_json(),
+        "constituents": constituents,
+    }
+    rolling = encode_rolling_metrics(equity_df['portfolio_value'].to_numpy(), equity_df.index)
+    if rolling is not None:
+        results[ROLLING_KEY] = rolling
+    print("Portfolio simulation finished.")
+    return results
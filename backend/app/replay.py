@@ -0,0 +1,131 @@
+# app/replay.py
+
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .market_data import OHLCV_COLUMNS, empty_bars, slice_bars
+from .timeframes import INTRADAY_WIDTHS, MINUTE_NS, normalize_interval, resample_bars
+
+# --- Configuration ---
+# Replay mode runs the stack without yfinance or trained models, e.g. for
+# load tests: MARKET_DATA_SOURCE=synthetic serves the bars below for any
+# ticker, MARKET_DATA_SOURCE=csv:<dir> replays recorded `<ticker>.csv` files,
+# and MODEL_SOURCE=stand-in scores every model set with `StandInModel`.
+REPLAY_EPOCH = pd.Timestamp(os.getenv("REPLAY_EPOCH", "1990-01-01"))
+REPLAY_TIMEZONE = os.getenv("REPLAY_TIMEZONE", "Asia/Kolkata")
+REPLAY_SESSION = os.getenv("REPLAY_SESSION", "09:15-15:30")  # Exchange-local open-close of intraday bars
+
+DAILY_DRIFT = 0.0003
+DAILY_VOLATILITY = 0.015
+
+
+def _session_minutes() -> tuple:
+    """(offset of the open from midnight in ns, minutes per session)."""
+    open_, close = (pd.Timedelta(f"{t.strip()}:00") for t in REPLAY_SESSION.split("-"))
+    return open_.value, int((close - open_) / pd.Timedelta(minutes=1))
+
+
+def _local_date(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return (ts.tz_convert(REPLAY_TIMEZONE).tz_localize(None) if ts.tzinfo is not None else ts).normalize()
+
+
+# --- Synthetic Market Data ---
+# Every value is a pure function of (ticker, bar), never of the requested
+# window, so bars fetched piecemeal by the market data cache line up with
+# bars fetched in one go. Daily bars follow a seeded random walk over the
+# business days since REPLAY_EPOCH; each component (returns, ranges, volume)
+# has its own generator, so a longer walk extends a shorter one. Intraday
+# bars bridge each day's open to its close at one-minute resolution and are
+# resampled to the requested interval, so every interval tells the same story.
+
+class SyntheticSource:
+    """Deterministic OHLCV bars for any ticker and interval (see above)."""
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.DataFrame:
+        interval = normalize_interval(interval)
+        seed = zlib.crc32(ticker.encode())
+        # Bars are generated on exchange-local dates (a day either side covers any time zone) and sliced exactly
+        first, last = (_local_date(ts) for ts in (start, end))
+        daily = self.daily_bars(seed, last + pd.Timedelta(days=2))
+        if daily.empty:
+            return empty_bars()
+        if interval in INTRADAY_WIDTHS:
+            data = self.intraday_bars(seed, daily.loc[first - pd.Timedelta(days=1):last + pd.Timedelta(days=1)], interval)
+        elif interval == "1d":
+            data = daily
+        else:
+            data = resample_bars(daily, interval)
+        return slice_bars(data, start, end)
+
+    @staticmethod
+    def daily_bars(seed: int, end: pd.Timestamp) -> pd.DataFrame:
+        days = np.arange(REPLAY_EPOCH.date(), pd.Timestamp(end).date(), dtype='datetime64[D]')
+        index = pd.DatetimeIndex(days[np.is_busday(days)].astype('datetime64[ns]'), name='Date')
+        n = len(index)
+        if n == 0:
+            return empty_bars()
+        regimes, returns, gaps, ranges, volumes = (np.random.default_rng([seed, k]) for k in range(5))
+
+        volatility = DAILY_VOLATILITY * np.exp(0.3 * regimes.normal(size=n))
+        close = (50 + seed % 950) * np.exp(np.cumsum(DAILY_DRIFT + volatility * returns.normal(size=n)))
+        open_ = np.empty(n)
+        open_[0] = close[0]
+        open_[1:] = close[:-1] * np.exp(0.2 * volatility[1:] * gaps.normal(size=n - 1))
+        spread = np.abs(ranges.normal(size=(n, 2))) * (volatility * close / 2)[:, None]
+        high = np.maximum(open_, close) + spread[:, 0]
+        low = np.minimum(open_, close) - spread[:, 1]
+        volume = volumes.integers(100_000, 5_000_000, n).astype(np.float64)
+        return pd.DataFrame(dict(zip(OHLCV_COLUMNS, (open_, high, low, close, volume))), index=index)
+
+    @staticmethod
+    def intraday_bars(seed: int, days: pd.DataFrame, interval: str) -> pd.DataFrame:
+        if days.empty:
+            return empty_bars()
+        open_offset, m = _session_minutes()
+        steps = np.arange(1, m + 1) / m
+
+        columns = [[] for _ in OHLCV_COLUMNS]
+        for day, (day_open, day_close, volume) in zip(days.index, days[['Open', 'Close', 'Volume']].to_numpy()):
+            rng = np.random.default_rng([seed, 5, day.toordinal()])
+            walk = np.cumsum(rng.normal(size=m))
+            bridge = (walk - steps * walk[-1]) * DAILY_VOLATILITY / np.sqrt(m)
+            close = day_open * np.exp(steps * np.log(day_close / day_open) + bridge)
+            open_ = np.concatenate(([day_open], close[:-1]))
+            spread = np.abs(rng.normal(size=(2, m))) * DAILY_VOLATILITY / np.sqrt(m) * close / 2
+            shares = rng.dirichlet(np.ones(m)) * volume
+            for column, values in zip(columns, (open_, np.maximum(open_, close) + spread[0],
+                                                np.minimum(open_, close) - spread[1], close, np.round(shares))):
+                column.append(values)
+
+        stamps = (days.index.asi8 * (np.timedelta64(1, days.index.unit) // np.timedelta64(1, 'ns')))[:, None] \
+            + open_offset + np.arange(m) * MINUTE_NS
+        index = pd.DatetimeIndex(stamps.ravel().astype('datetime64[ns]'), name='Date').tz_localize(REPLAY_TIMEZONE)
+        data = pd.DataFrame({name: np.concatenate(values) for name, values in zip(OHLCV_COLUMNS, columns)}, index=index)
+        return data if interval == "1m" else resample_bars(data, interval)
+
+
+# --- Stand-in Models ---
+
+class StandInModel:
+    """
+    Deterministic replacement for a trained classifier: a fixed random
+    projection of the feature row, thresholded into 0/1 predictions. Like
+    the tree ensembles it stands in for, it scores a float32 copy of the
+    features.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+
+    def predict(self, features) -> np.ndarray:
+        values = np.asarray(features, dtype=np.float32)
+        weights = np.random.default_rng(self.seed).normal(size=values.shape[1]).astype(np.float32)
+        return (np.modf(np.abs(values @ weights))[0] > 0.5).astype(np.int64)
+
+
+def stand_in_artifacts() -> dict:
+    return {"RandomForest": StandInModel(seed=1), "GradientBoosting": StandInModel(seed=2)}
@@ -0,0 +1,273 @@
+# app/results.py
+
+import base64
+import zlib
+
+import numpy as np
+import pandas as pd
+from .execution import EXIT_REASONS, SIDES
+
+# --- Compact Result Format ---
+# Time series in `BacktestResult.result_data` are stored as parallel columns
+# ({"date": <epoch ms>, "portfolio_value": <values>}) instead of a list of
+# per-row dicts. Each column is its raw little-endian array, base64-encoded
+# ({"dtype": "<f8", "data": "..."}), so no Python object is built per row.
+# Time columns are stored as zlib-compressed steps between timestamps, and
+# candlesticks (display-only) as float32. The results endpoint decodes,
+# slices and downsamples them on read.
+
+RESULT_FORMAT = "columnar-v2"
+SERIES_TIME_COLUMNS = {"performanceData": "date", "candlestickData": "Date", "rollingMetrics": "date"}
+# Column that guides LTTB downsampling of a line series
+SERIES_SHAPE_COLUMNS = {"performanceData": "portfolio_value", "rollingMetrics": "rolling_sharpe"}
+CANDLE_DTYPE = np.float32
+# Rolling Sharpe, volatility and drawdown (see metrics.py) are display-only, like candlesticks
+ROLLING_KEY = "rollingMetrics"
+ROLLING_DTYPE = np.float32
+FLOAT32_DIGITS = 7  # Significant decimal digits a float32 reliably carries
+# Stored with the result but served by the profile endpoint instead
+DIAGNOSTICS_KEY = "diagnostics"
+
+# Trade ledgers (see execution.py) are packed the same way, one row per trade
+TRADES_KEY = "trades"
+TRADE_TIME_COLUMNS = ("entryTime", "exitTime")
+TRADE_COLUMNS = {
+    "side": "side", "quantity": "quantity", "entryPrice": "entry_price", "exitPrice": "exit_price",
+    "commission": "commission", "slippage": "slippage", "pnl": "pnl", "exitReason": "exit_reason",
+}
+
+
+def pack_array(values: np.ndarray, dtype=np.float64, delta: bool = False) -> dict:
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    if not delta:
+        return {"dtype": values.dtype.str, "data": base64.b64encode(values.data).decode('ascii')}
+    # Sorted timestamps have (nearly) constant steps, which compress to almost nothing
+    steps = np.diff(values, prepend=values.dtype.type(0))
+    return {"dtype": values.dtype.str, "encoding": "delta-zlib", "data": base64.b64encode(zlib.compress(steps.data, 1)).decode('ascii')}
+
+
+def unpack_array(column: dict) -> np.ndarray:
+    raw = base64.b64decode(column["data"])
+    if column.get("encoding") == "delta-zlib":
+        return np.cumsum(np.frombuffer(zlib.decompress(raw), dtype=column["dtype"]))
+    return np.frombuffer(raw, dtype=column["dtype"])
+
+
+def encode_arrays(index: pd.DatetimeIndex, columns: dict, time_column: str, dtype=np.float64) -> dict:
+    """Encodes 1-D arrays sharing a date index as packed columns of `dtype`."""
+    index = index.tz_convert('UTC') if index.tz is not None else index
+    encoded = {time_column: pack_array(index.as_unit('ms').asi8, np.int64, delta=True)}
+    for name, values in columns.items():
+        encoded[name] = pack_array(values, dtype)
+    return encoded
+
+
+def encode_trades(index: pd.DatetimeIndex, ledger: dict) -> dict:
+    """Packs a trade ledger, turning its bar positions into epoch-ms entry/exit times."""
+    index = index.tz_convert('UTC') if index.tz is not None else index
+    times = index.as_unit('ms').asi8
+    encoded = {
+        "entryTime": pack_array(times[ledger["entry_bar"]], np.int64),
+        "exitTime": pack_array(times[ledger["exit_bar"]], np.int64),
+    }
+    for column, name in TRADE_COLUMNS.items():
+        encoded[column] = pack_array(ledger[name], ledger[name].dtype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return_pct = np.nan_to_num(ledger["pnl"] / (ledger["entry_price"] * ledger["quantity"]) * 100)
+    encoded["returnPct"] = pack_array(return_pct)
+    return encoded
+
+
+def encode_columns(frame: pd.DataFrame, time_column: str) -> dict:
+    """Encodes a time-indexed frame as packed columns."""
+    return encode_arrays(frame.index, {name: frame[name].to_numpy() for name in frame.columns}, time_column)
+
+
+def _to_arrays(series_data, time_column: str) -> dict:
+    """
+    Columns as NumPy arrays. Also reads the earlier layouts: plain JSON
+    arrays ("columnar-v1") and lists of per-row records.
+    """
+    if isinstance(series_data, list):
+        frame = pd.DataFrame.from_records(series_data)
+        if frame.empty:
+            return {time_column: np.empty(0, dtype=np.int64)}
+        times = pd.to_datetime(frame.pop(time_column), utc=True)
+        arrays = {time_column: times.dt.as_unit('ms').astype('int64').to_numpy()}
+        arrays.update({name: frame[name].to_numpy(dtype=np.float64) for name in frame.columns})
+        return arrays
+    arrays = {}
+    for name, values in series_data.items():
+        if not isinstance(values, dict):
+            arrays[name] = np.asarray(values, dtype=np.int64 if name == time_column else np.float64)
+            continue
+        values = unpack_array(values)
+        if name == time_column:
+            arrays[name] = values.astype(np.int64, copy=False)
+        else:
+            arrays[name] = values if values.dtype == np.float32 else values.astype(np.float64, copy=False)
+    arrays.setdefault(time_column, np.empty(0, dtype=np.int64))
+    return arrays
+
+
+def _to_epoch_ms(value: str | None) -> int | None:
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return ts.value // 1_000_000
+
+
+# --- Downsampling ---
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: picks `n_out` points that preserve the
+    visual shape of a line chart. Always keeps the first and last points.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+
+        bucket_x, bucket_y = x[lo:hi], y[lo:hi]
+        area = np.abs((x[previous] - avg_x) * (bucket_y - y[previous]) - (x[previous] - bucket_x) * (avg_y - y[previous]))
+        previous = lo + int(np.nanargmax(area)) if np.isfinite(area).any() else lo
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_ohlc(arrays: dict, time_column: str, n_out: int) -> dict:
+    """Aggregates candlesticks into `n_out` buckets (first open, max high, min low, last close, summed volume)."""
+    n = len(arrays[time_column])
+    if n_out >= n:
+        return arrays
+    starts = np.linspace(0, n, n_out, endpoint=False).astype(np.int64)
+    out = {time_column: arrays[time_column][starts]}
+    for name, values in arrays.items():
+        if name == time_column:
+            continue
+        if name == 'High':
+            out[name] = np.fmax.reduceat(values, starts)
+        elif name == 'Low':
+            out[name] = np.fmin.reduceat(values, starts)
+        elif name == 'Volume':
+            out[name] = np.add.reduceat(np.nan_to_num(values), starts)
+        elif name == 'Open':
+            out[name] = values[starts]
+        else:
+            out[name] = values[np.append(starts[1:], n) - 1]
+    return out
+
+
+# --- Rendering ---
+
+def _float32_display(values: np.ndarray) -> np.ndarray:
+    """
+    Widens a float32 column, rounded to the digits float32 actually carries
+    (so 101.37 renders as 101.37 rather than 101.37000274658203).
+    """
+    values = values.astype(np.float64)
+    magnitude = np.abs(values[np.isfinite(values)])
+    if not magnitude.size or magnitude.max() == 0:
+        return values
+    digits = int(np.floor(np.log10(magnitude.max()))) + 1
+    return np.round(values, max(FLOAT32_DIGITS - digits, 0))
+
+
+def _render(arrays: dict, time_column: str, fmt: str):
+    columns = {}
+    for name, values in arrays.items():
+        if name == time_column:
+            continue
+        if values.dtype == np.float32:
+            values = _float32_display(values)
+        columns[name] = [None if v != v else v for v in values.tolist()]
+
+    if fmt == "columnar":
+        return {time_column: arrays[time_column].tolist(), **columns}
+
+    times = pd.to_datetime(arrays[time_column], unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ').tolist()
+    names = list(columns)
+    return [dict(zip([time_column, *names], row)) for row in zip(times, *columns.values())]
+
+
+def _render_trades(trades: dict, fmt: str):
+    columns = {}
+    for name, values in trades.items():
+        if name in TRADE_TIME_COLUMNS:
+            if fmt == "columnar":
+                columns[name] = values.tolist()
+            else:
+                columns[name] = pd.to_datetime(values, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ').tolist()
+        elif name == "side":
+            columns[name] = [SIDES[v] for v in values.tolist()]
+        elif name == "exitReason":
+            columns[name] = [EXIT_REASONS[v] for v in values.tolist()]
+        else:
+            columns[name] = np.round(values, 6).tolist()
+
+    if fmt == "columnar":
+        return columns
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def shape_result(result_data: dict, start: str | None = None, end: str | None = None,
+                 max_points: int | None = None, fmt: str = "records") -> dict:
+    """
+    Applies range slicing, server-side downsampling and the requested output
+    format to a stored result. Non-series fields are returned unchanged.
+    """
+    if not isinstance(result_data, dict):
+        return result_data
+    if result_data.get("status") == "FAILURE":
+        return {k: v for k, v in result_data.items() if k != DIAGNOSTICS_KEY}
+
+    start_ms, end_ms = _to_epoch_ms(start), _to_epoch_ms(end)
+    shaped = {k: v for k, v in result_data.items() if k not in SERIES_TIME_COLUMNS and k not in ("format", DIAGNOSTICS_KEY, TRADES_KEY)}
+
+    for key, time_column in SERIES_TIME_COLUMNS.items():
+        if key not in result_data:
+            continue
+        arrays = _to_arrays(result_data[key], time_column)
+        times = arrays[time_column]
+
+        lo = np.searchsorted(times, start_ms, side='left') if start_ms is not None else 0
+        hi = np.searchsorted(times, end_ms, side='right') if end_ms is not None else len(times)
+        arrays = {name: values[lo:hi] for name, values in arrays.items()}
+
+        if max_points and len(arrays[time_column]) > max_points:
+            if key == "candlestickData":
+                arrays = downsample_ohlc(arrays, time_column, max_points)
+            else:
+                keep = lttb_indices(arrays[time_column], arrays[SERIES_SHAPE_COLUMNS[key]], max_points)
+                arrays = {name: values[keep] for name, values in arrays.items()}
+
+        shaped[key] = _render(arrays, time_column, fmt)
+        shaped.setdefault("pointCounts", {})[key] = len(arrays[time_column])
+
+    # Trades are filtered by entry time but never downsampled
+    if TRADES_KEY in result_data:
+        trades = {name: unpack_array(column) for name, column in result_data[TRADES_KEY].items()}
+        keep = np.ones(len(trades["entryTime"]), dtype=bool)
+        if start_ms is not None:
+            keep &= trades["entryTime"] >= start_ms
+        if end_ms is not None:
+            keep &= trades["entryTime"] <= end_ms
+        shaped[TRADES_KEY] = _render_trades({name: values[keep] for name, values in trades.items()}, fmt)
+        shaped.setdefault("pointCounts", {})[TRADES_KEY] = int(keep.sum())
+
+    shaped["format"] = fmt
+    return shaped
@@ -0,0 +1,337 @@
+# app/rules.py
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from .lru import LRUCache
+from .signals import _previous
+
+# --- Configuration ---
+RULE_PLAN_CACHE_SIZE = int(os.getenv("RULE_PLAN_CACHE_SIZE", "256"))
+CUSTOM_STRATEGY = "Custom"
+
+# --- Rule Schema ---
+# A rule-based strategy is a list of rules, each an action and its conditions:
+#
+#   {"action": "buy", "logic": "and", "conditions": [
+#       {"left": {"indicator": "sma", "length": 50}, "op": "cross-above", "right": {"indicator": "sma", "length": 200}},
+#       {"left": "rsi", "op": "less-than", "right": 70}]}
+#
+# `logic` ("and" by default) joins a rule's conditions, conditions nest as
+# {"all": [...]} or {"any": [...]}, and several rules for the same action
+# are OR-ed. Operands are numbers, indicator names using their default
+# parameters, or {"indicator": name, **params}; an indicator's `source` may
+# itself be an operand. "stop-loss" and "take-profit" rules carry a percent
+# `value` and set the execution model's protective exits.
+
+ACTIONS = ("buy", "sell", "stop-loss", "take-profit")
+COMPARATORS = ("greater-than", "less-than", "cross-above", "cross-below")
+PRICE_FIELDS = {"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+INDICATOR_DEFAULTS = {
+    "sma": {"length": 20, "source": "close"},
+    "ema": {"length": 20, "source": "close"},
+    "rsi": {"length": 14, "source": "close"},
+    "macd": {"fast": 12, "slow": 26, "signal": 9, "output": "macd", "source": "close"},
+    "bb": {"length": 20, "std_dev": 2.0, "band": "middle", "source": "close"},
+}
+INDICATOR_ALIASES = {"bbands": "bb", "bollinger": "bb", "price": "close"}
+OUTPUTS = {"macd": ("macd", "signal", "histogram"), "bb": ("lower", "middle", "upper", "width")}
+EXIT_ACTIONS = {"stop-loss": "stop_loss_pct", "take-profit": "take_profit_pct"}
+
+
+# --- Expression DAG ---
+# Every node is an (op, inputs, params) tuple and is interned on that tuple,
+# so an indicator (or comparison) used by several rules -- or implied by
+# several indicators, such as the SMA shared by a Bollinger Band and an SMA
+# rule -- is computed once. Nodes are numbered in creation order, which is
+# already a topological order.
+
+@dataclass(frozen=True)
+class RulePlan:
+    rule_hash: str
+    nodes: tuple  # ((op, inputs, params), ...) in evaluation order
+    buy: int
+    sell: int
+    exits: dict = field(default_factory=dict)  # ExecutionConfig fields set by exit rules
+    last_use: tuple = ()  # Node after which each node's value can be released
+
+    @property
+    def columns(self) -> list:
+        """Bar columns the plan reads."""
+        return sorted({params[0] for op, _, params in self.nodes if op == "column"})
+
+    @property
+    def indicators(self) -> int:
+        return sum(op in INDICATOR_OPS for op, _, _ in self.nodes)
+
+
+class _Builder:
+    def __init__(self):
+        self.nodes = []
+        self._ids = {}
+
+    def node(self, op: str, inputs: tuple = (), params: tuple = ()) -> int:
+        if op in ("and", "or"):
+            inputs = tuple(sorted(set(inputs)))  # Commutative: one node per set of operands
+            if len(inputs) == 1:
+                return inputs[0]
+        key = (op, inputs, params)
+        if key not in self._ids:
+            self._ids[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self._ids[key]
+
+    def constant(self, value) -> int:
+        return self.node("const", params=(float(value),))
+
+
+def _normalize(name, kind: str, path: str) -> str:
+    if not isinstance(name, str):
+        raise ValueError(f"{path}: {kind} must be a string, got {name!r}.")
+    return name.strip().lower().replace("_", "-")
+
+
+def _operand(builder: _Builder, spec, path: str) -> int:
+    if isinstance(spec, bool):
+        raise ValueError(f"{path}: expected a number or an indicator, got {spec!r}.")
+    if isinstance(spec, (int, float)):
+        return builder.constant(spec)
+    if isinstance(spec, str):
+        spec = {"indicator": spec}
+    if not isinstance(spec, dict) or "indicator" not in spec:
+        raise ValueError(f"{path}: expected a number or an indicator, got {spec!r}.")
+
+    name = _normalize(spec["indicator"], "indicator", path).replace("-", "")
+    name = INDICATOR_ALIASES.get(name, name)
+    if name in PRICE_FIELDS:
+        return builder.node("column", params=(PRICE_FIELDS[name],))
+    if name not in INDICATOR_DEFAULTS:
+        raise ValueError(f"{path}: unknown indicator '{spec['indicator']}'.")
+
+    defaults = INDICATOR_DEFAULTS[name]
+    unknown = set(spec) - set(defaults) - {"indicator"}
+    if unknown:
+        raise ValueError(f"{path}: unknown parameters {sorted(unknown)} for {name}.")
+    params = {**defaults, **{k: v for k, v in spec.items() if k != "indicator"}}
+    source = _operand(builder, params["source"], f"{path}.source")
+
+    def length(key):
+        value = params[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value) or value < 1:
+            raise ValueError(f"{path}: {key} must be a positive integer, got {value!r}.")
+        return int(value)
+
+    if name in ("sma", "ema", "rsi"):
+        return builder.node(name, (source,), (length("length"),))
+
+    output = params["output" if name == "macd" else "band"]
+    if output not in OUTPUTS[name]:
+        raise ValueError(f"{path}: {name} output must be one of {list(OUTPUTS[name])}, got {output!r}.")
+    if name == "macd":
+        fast, slow = sorted((length("fast"), length("slow")))  # pandas-ta swaps them the same way
+        line = builder.node("sub", (builder.node("ema", (source,), (fast,)), builder.node("ema", (source,), (slow,))))
+        if output == "macd":
+            return line
+        signal = builder.node("ema", (line,), (length("signal"),))
+        return signal if output == "signal" else builder.node("sub", (line, signal))
+
+    window = length("length")
+    std_dev = params["std_dev"]
+    if isinstance(std_dev, bool) or not isinstance(std_dev, (int, float)) or std_dev <= 0:
+        raise ValueError(f"{path}: std_dev must be a positive number, got {std_dev!r}.")
+    mid = builder.node("sma", (source,), (window,))
+    if output == "middle":
+        return mid
+    deviations = builder.node("mul", (builder.constant(std_dev), builder.node("stdev", (source,), (window,))))
+    lower, upper = builder.node("sub", (mid, deviations)), builder.node("add", (mid, deviations))
+    if output == "width":
+        return builder.node("div", (builder.node("sub", (upper, lower)), mid))
+    return lower if output == "lower" else upper
+
+
+def _condition(builder: _Builder, spec, path: str) -> int:
+    if not isinstance(spec, dict):
+        raise ValueError(f"{path}: a condition must be an object, got {spec!r}.")
+    for group, op in (("all", "and"), ("any", "or")):
+        if group in spec:
+            children = spec[group]
+            if not isinstance(children, list) or not children:
+                raise ValueError(f"{path}.{group}: expected a non-empty list of conditions.")
+            return builder.node(op, tuple(_condition(builder, c, f"{path}.{group}[{i}]") for i, c in enumerate(children)))
+
+    missing = {"left", "op", "right"} - set(spec)
+    if missing:
+        raise ValueError(f"{path}: missing {sorted(missing)}.")
+    comparator = _normalize(spec["op"], "op", path)
+    if comparator not in COMPARATORS:
+        raise ValueError(f"{path}: unknown operator '{spec['op']}'; expected one of {list(COMPARATORS)}.")
+    left, right = _operand(builder, spec["left"], f"{path}.left"), _operand(builder, spec["right"], f"{path}.right")
+
+    if comparator == "greater-than":
+        return builder.node("gt", (left, right))
+    if comparator == "less-than":
+        return builder.node("lt", (left, right))
+    # Crossovers match the built-in strategies: on the side now, and not on it (or level) on the previous bar
+    previous = builder.node("prev", (left,)), builder.node("prev", (right,))
+    if comparator == "cross-above":
+        return builder.node("and", (builder.node("gt", (left, right)), builder.node("le", previous)))
+    return builder.node("and", (builder.node("lt", (left, right)), builder.node("ge", previous)))
+
+
+def _plan(rules: list, rule_hash: str) -> RulePlan:
+    if not isinstance(rules, list) or not rules:
+        raise ValueError("A Custom strategy needs a non-empty list of rules.")
+    builder = _Builder()
+    signals = {"buy": [], "sell": []}
+    exits = {}
+    for i, rule in enumerate(rules):
+        path = f"rules[{i}]"
+        if not isinstance(rule, dict):
+            raise ValueError(f"{path}: a rule must be an object, got {rule!r}.")
+        action = _normalize(rule.get("action"), "action", path)
+        if action not in ACTIONS:
+            raise ValueError(f"{path}: unknown action '{rule.get('action')}'; expected one of {list(ACTIONS)}.")
+        if action in EXIT_ACTIONS:
+            value = rule.get("value")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < 100:
+                raise ValueError(f"{path}: {action} needs a percent value between 0 and 100, got {value!r}.")
+            exits[EXIT_ACTIONS[action]] = float(value)
+            continue
+
+        logic = _normalize(rule.get("logic", "and"), "logic", path)
+        if logic not in ("and", "or"):
+            raise ValueError(f"{path}: logic must be 'and' or 'or', got {rule.get('logic')!r}.")
+        conditions = rule.get("conditions")
+        if not isinstance(conditions, list) or not conditions:
+            raise ValueError(f"{path}: expected a non-empty list of conditions.")
+        terms = tuple(_condition(builder, c, f"{path}.conditions[{j}]") for j, c in enumerate(conditions))
+        signals[action].append(builder.node(logic, terms))
+
+    if not signals["buy"]:
+        raise ValueError("A Custom strategy needs at least one buy rule.")
+    buy = builder.node("or", tuple(signals["buy"]))
+    sell = builder.node("or", tuple(signals["sell"])) if signals["sell"] else builder.node("never")
+
+    last_use = list(range(len(builder.nodes)))
+    for i, (_, inputs, _) in enumerate(builder.nodes):
+        for j in inputs:
+            last_use[j] = i
+    for output in (buy, sell):
+        last_use[output] = len(builder.nodes)
+    return RulePlan(rule_hash, tuple(builder.nodes), buy, sell, exits, tuple(last_use))
+
+
+# --- Plan Cache ---
+
+def rule_hash(rules: list) -> str:
+    """Hash of the rules' canonical JSON; equal rule sets share one compiled plan."""
+    canonical = json.dumps(rules, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+# Compiled rule plans keyed by rule hash
+plan_cache = LRUCache(RULE_PLAN_CACHE_SIZE)
+
+
+def compile_rules(rules: list) -> RulePlan:
+    """Parses and plans `rules`, or returns the cached plan of an identical rule set. Raises ValueError on invalid rules."""
+    key = rule_hash(rules)
+    plan = plan_cache.get(key)
+    if plan is None:
+        plan = _plan(rules, key)
+        plan_cache.put(key, plan)
+    return plan
+
+
+# --- Evaluation ---
+# Indicators follow the pandas-ta definitions used by `strategies.py`
+# (SMA, EMA seeded with the SMA of its first window, Wilder-smoothed RSI,
+# Bollinger Bands over the population standard deviation).
+
+def _sma(values: np.ndarray, length: int) -> np.ndarray:
+    return pd.Series(values).rolling(length, min_periods=length).mean().to_numpy()
+
+
+def _stdev(values: np.ndarray, length: int) -> np.ndarray:
+    return pd.Series(values).rolling(length, min_periods=length).std(ddof=0).to_numpy()
+
+
+def _ema(values: np.ndarray, length: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    first = int(valid[0]) if len(valid) else len(values)
+    if len(values) - first < length:
+        return result
+    seeded = values[first + length - 1:].copy()
+    seeded[0] = values[first:first + length].mean()
+    result[first + length - 1:] = pd.Series(seeded).ewm(span=length, adjust=False).mean().to_numpy()
+    return result
+
+
+def _rsi(values: np.ndarray, length: int) -> np.ndarray:
+    change = pd.Series(values).diff()
+    gains, losses = change.clip(lower=0), change.clip(upper=0).abs()
+    average_gain = gains.ewm(alpha=1.0 / length, min_periods=length).mean()
+    average_loss = losses.ewm(alpha=1.0 / length, min_periods=length).mean()
+    return (100 * average_gain / (average_gain + average_loss)).to_numpy()
+
+
+INDICATOR_OPS = {"sma": _sma, "stdev": _stdev, "ema": _ema, "rsi": _rsi}
+ARITHMETIC_OPS = {"add": np.add, "sub": np.subtract, "mul": np.multiply, "div": np.divide}
+COMPARISON_OPS = {"gt": np.greater, "lt": np.less, "ge": np.greater_equal, "le": np.less_equal}
+
+
+def evaluate(plan: RulePlan, bars):
+    """
+    Runs a plan over a BarStore (or any mapping of column name to array).
+    Returns (buy, sell, start) like `signals.compute_signals`: 1-D boolean
+    arrays over all bars and the first bar every indicator is valid on.
+    Intermediate arrays are released as soon as their last consumer ran.
+    """
+    n = len(bars[plan.columns[0]]) if plan.columns else len(bars)
+    values = [None] * len(plan.nodes)
+    start = 0
+    for i, (op, inputs, params) in enumerate(plan.nodes):
+        args = [values[j] for j in inputs]
+        if op == "column":
+            result = np.asarray(bars[params[0]], dtype=np.float64)
+        elif op == "const":
+            result = params[0]
+        elif op == "never":
+            result = np.zeros(n, dtype=bool)
+        elif op in INDICATOR_OPS:
+            if np.ndim(args[0]) == 0:
+                raise ValueError("Indicators need a price or indicator source, not a constant.")
+            result = INDICATOR_OPS[op](args[0], *params)
+            valid = np.flatnonzero(~np.isnan(result))
+            start = max(start, int(valid[0]) if len(valid) else n)
+        elif op in ARITHMETIC_OPS:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result = ARITHMETIC_OPS[op](*args)
+        elif op in COMPARISON_OPS:
+            result = np.broadcast_to(COMPARISON_OPS[op](*args), (n,))
+        elif op == "prev":
+            result = _previous(args[0]) if np.ndim(args[0]) else args[0]
+        elif op == "and":
+            result = np.logical_and.reduce(args)
+        elif op == "or":
+            result = np.logical_or.reduce(args)
+        else:
+            raise ValueError(f"Unknown plan operation: {op}")
+        values[i] = result
+        for j in inputs:
+            if plan.last_use[j] == i:
+                values[j] = None
+
+    buy = np.array(values[plan.buy], dtype=bool)
+    sell = np.array(values[plan.sell], dtype=bool)
+    return buy, sell, start
+
+
+def compute_rule_signals(bars, rules: list):
+    """Compiles (or fetches the cached plan for) `rules` and evaluates it over `bars`."""
+    return evaluate(compile_rules(rules), bars)
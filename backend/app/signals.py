@@ -0,0 +1,140 @@
+# app/signals.py
+
+import numpy as np
+import pandas as pd
+
+# --- Strategy Parameters ---
+# Defaults mirror the keyword defaults of the functions in `strategies.py`.
+STRATEGY_DEFAULTS = {
+    "TrendFollowing": {"fast_ma": 50, "slow_ma": 200},
+    "MeanReversion": {"length": 20, "std_dev": 2.0},
+    "Volatility": {"length": 20, "std_dev": 2.0, "squeeze_threshold": 1.5},
+}
+
+
+# --- Shared Indicators ---
+
+class IndicatorCache:
+    """
+    Computes each rolling indicator once per distinct parameter value, so
+    e.g. every SMA length is shared across all fast/slow combinations.
+    Values match the pandas-ta columns used by `strategies.py`.
+    """
+
+    def __init__(self, close: pd.Series):
+        self.close = close
+        self._cache = {}
+
+    def _get(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def sma(self, length: int) -> np.ndarray:
+        return self._get(("sma", length), lambda: self.close.rolling(length, min_periods=length).mean().to_numpy())
+
+    def stdev(self, length: int) -> np.ndarray:
+        # pandas-ta's bbands uses the population standard deviation (ddof=0)
+        return self._get(("stdev", length), lambda: self.close.rolling(length, min_periods=length).std(ddof=0).to_numpy())
+
+    def bbands(self, length: int, std_dev: float):
+        def compute():
+            mid, deviations = self.sma(length), std_dev * self.stdev(length)
+            return mid - deviations, mid, mid + deviations
+        return self._get(("bbands", length, std_dev), compute)
+
+    def band_width(self, length: int, std_dev: float):
+        """Bollinger Band width and its rolling mean over `length * 2` bars."""
+        def compute():
+            lower, mid, upper = self.bbands(length, std_dev)
+            width = (upper - lower) / mid
+            width_mean = pd.Series(width).rolling(window=length * 2).mean().to_numpy()
+            return width, width_mean
+        return self._get(("band_width", length, std_dev), compute)
+
+
+def _previous(matrix: np.ndarray) -> np.ndarray:
+    """Row-wise `shift(1)` of a (bars, combinations) matrix."""
+    shifted = np.empty_like(matrix)
+    shifted[0] = np.nan if matrix.dtype.kind == 'f' else False
+    shifted[1:] = matrix[:-1]
+    return shifted
+
+
+def _stack(arrays: list) -> np.ndarray:
+    """(bars, len(arrays)) matrix; a single array becomes a column view instead of a copy."""
+    return arrays[0][:, None] if len(arrays) == 1 else np.column_stack(arrays)
+
+
+# --- Signal Matrices ---
+# Each builder returns (buy, sell, start) for a chunk of combinations, where
+# `start` is the first bar on which that combination's indicators are valid
+# (the row a single backtest would start from after `dropna`).
+
+def _momentum_signals(cache: IndicatorCache, combos: list):
+    fast = _stack([cache.sma(c["fast_ma"]) for c in combos])
+    slow = _stack([cache.sma(c["slow_ma"]) for c in combos])
+    fast_prev, slow_prev = _previous(fast), _previous(slow)
+
+    buy = (fast > slow) & (fast_prev <= slow_prev)
+    sell = (fast < slow) & (fast_prev >= slow_prev)
+    start = np.array([max(c["fast_ma"], c["slow_ma"]) - 1 for c in combos])
+    return buy, sell, start
+
+
+def _mean_reversion_signals(cache: IndicatorCache, combos: list):
+    bands = [cache.bbands(c["length"], c["std_dev"]) for c in combos]
+    lower = _stack([b[0] for b in bands])
+    upper = _stack([b[2] for b in bands])
+    close = cache.close.to_numpy()[:, None]
+    close_prev = _previous(close)
+
+    buy = (close < lower) & (close_prev >= _previous(lower))
+    sell = (close > upper) & (close_prev <= _previous(upper))
+    start = np.array([c["length"] - 1 for c in combos])
+    return buy, sell, start
+
+
+def _volatility_signals(cache: IndicatorCache, combos: list):
+    bands = [cache.bbands(c["length"], c["std_dev"]) for c in combos]
+    widths = [cache.band_width(c["length"], c["std_dev"]) for c in combos]
+    lower = _stack([b[0] for b in bands])
+    upper = _stack([b[2] for b in bands])
+    width = _stack([w[0] for w in widths])
+    width_mean = _stack([w[1] for w in widths])
+    threshold = np.array([c["squeeze_threshold"] for c in combos])
+    close = cache.close.to_numpy()[:, None]
+
+    squeeze_prev = _previous(width < width_mean * threshold)
+    buy = squeeze_prev & (close > _previous(upper))
+    sell = squeeze_prev & (close < _previous(lower))
+    start = np.array([c["length"] - 1 for c in combos])
+    return buy, sell, start
+
+
+SIGNAL_BUILDERS = {
+    "TrendFollowing": _momentum_signals,
+    "MeanReversion": _mean_reversion_signals,
+    "Volatility": _volatility_signals,
+}
+
+
+def warmup_bars(strategy_type: str, combo: dict) -> int:
+    """Bars a combination needs before its indicators produce a value."""
+    if strategy_type == "TrendFollowing":
+        return max(combo["fast_ma"], combo["slow_ma"])
+    return combo["length"]
+
+
+def compute_signals(close: pd.Series, strategy_type: str, **params):
+    """
+    Signals of a single backtest as 1-D boolean arrays over the whole of
+    `close`, plus the first bar its indicators are valid on. Rows from
+    `start` on equal the `buy_signal`/`sell_signal` columns of the matching
+    `strategies.py` function; the indicators are dropped on return.
+    """
+    if strategy_type not in SIGNAL_BUILDERS:
+        raise ValueError(f"Unknown strategy type: {strategy_type}")
+    combo = {**STRATEGY_DEFAULTS[strategy_type], **params}
+    buy, sell, start = SIGNAL_BUILDERS[strategy_type](IndicatorCache(close), [combo])
+    return buy[:, 0], sell[:, 0], int(start[0])
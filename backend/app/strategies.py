@@ -77,4 +77,4 @@ def volatility_strategy(data: pd.DataFrame, length: int = 20, std_dev: float = 2
     df['buy_signal'] = squeeze_on.shift(1) & buy_breakout
     df['sell_signal'] = squeeze_on.shift(1) & sell_breakout
     
-    return df
\ No newline at end of file
+    return df
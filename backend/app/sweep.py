@@ -0,0 +1,134 @@
+# app/sweep.py
+
+import itertools
+import numpy as np
+from . import engine
+from .backtester import get_ml_predictions, no_checkpoint, no_progress
+from .market_data import get_market_data_store
+from .metrics import calculate_performance_metrics_batch
+from .signals import SIGNAL_BUILDERS, STRATEGY_DEFAULTS, IndicatorCache, warmup_bars
+from .timeframes import normalize_interval
+
+# --- Sweepable Parameters ---
+# Every strategy parameter can be swept; unswept ones keep their default.
+SWEEP_PARAMETERS = STRATEGY_DEFAULTS
+INTEGER_PARAMETERS = {"fast_ma", "slow_ma", "length"}
+
+MAX_COMBINATIONS = 100_000
+CHUNK_SIZE = 512  # Combinations simulated per (bars x combinations) matrix
+
+
+def expand_parameter_grid(strategy_type: str, parameters: dict) -> list:
+    """
+    Expands `{name: {"values": [...]} | {"start", "stop", "step"}}` into the
+    list of parameter combinations. `stop` is inclusive; parameters that are
+    not swept keep their strategy default.
+    """
+    if strategy_type not in SWEEP_PARAMETERS:
+        raise ValueError(f"Unknown strategy type: {strategy_type}")
+    defaults = SWEEP_PARAMETERS[strategy_type]
+
+    unknown = set(parameters) - set(defaults)
+    if unknown:
+        raise ValueError(f"Parameters {sorted(unknown)} are not sweepable for {strategy_type}.")
+
+    axes = {}
+    for name, default in defaults.items():
+        spec = parameters.get(name)
+        if spec is None:
+            values = [default]
+        elif spec.get("values"):
+            values = list(spec["values"])
+        elif spec.get("start") is not None and spec.get("stop") is not None:
+            step = spec.get("step") or 1
+            values = np.arange(spec["start"], spec["stop"] + step / 2, step).tolist()
+        else:
+            raise ValueError(f"Parameter '{name}' needs either 'values' or 'start'/'stop'.")
+        if name in INTEGER_PARAMETERS:
+            values = [int(round(v)) for v in values]
+        else:
+            values = [round(float(v), 6) for v in values]
+        axes[name] = list(dict.fromkeys(values))
+
+    n_combinations = int(np.prod([len(v) for v in axes.values()]))
+    if n_combinations > MAX_COMBINATIONS:
+        raise ValueError(f"Sweep has {n_combinations} combinations; the limit is {MAX_COMBINATIONS}.")
+
+    names = list(axes)
+    return [dict(zip(names, combo)) for combo in itertools.product(*axes.values())]
+
+
+# --- Sweep Runner ---
+
+def _ranked_table(combos: list, metric_chunks: list, rank_by: str, top_n: int) -> list:
+    """The `top_n` rows of `combos` by `rank_by`; `metric_chunks` hold the metrics of consecutive chunks of them."""
+    metrics = {name: np.concatenate([m[name] for m in metric_chunks]) for name in metric_chunks[0]}
+    order = np.argsort(-metrics[rank_by], kind='stable')[:top_n]
+    table = []
+    for rank, i in enumerate(order, start=1):
+        row = {"rank": rank, **combos[i]}
+        row.update({name: round(float(values[i]), 2) for name, values in metrics.items()})
+        table.append(row)
+    return table
+
+
+def run_sweep(sweep_json: dict, ticker: str, start_date: str, end_date: str, progress=no_progress, checkpoint=no_checkpoint):
+    strategy_type = sweep_json.get("strategyType")
+    ml_model_set = sweep_json.get("ml_model_set")
+    ml_model_name = sweep_json.get("ml_model")
+    rank_by = sweep_json.get("rank_by", "sharpe_ratio")
+    top_n = sweep_json.get("top_n", 50)
+
+    combos = expand_parameter_grid(strategy_type, sweep_json.get("parameters") or {})
+    print(f"Sweeping {len(combos)} {strategy_type} combinations on {ticker}...")
+
+    # 1. Fetch data once for the whole grid
+    data = get_market_data_store().get_bars(ticker, start_date, end_date, normalize_interval(sweep_json.get("interval")))
+    data = data.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    if data.empty: raise ValueError("No data fetched.")
+    progress("data_fetched", 10, bars=len(data), combinations=len(combos))
+    cache = IndicatorCache(data['Close'])
+    close = data['Close'].to_numpy(dtype=np.float64)
+
+    # 2. ML confirmation does not depend on the swept parameters, so score once
+    ml_confirmation = None
+    if ml_model_set and ml_model_name:
+        print(f"Generating predictions with {ml_model_name} from {ml_model_set}...")
+        ml_preds = get_ml_predictions(ml_model_set, ml_model_name, data).reindex(data.index).fillna(0)
+        ml_confirmation = (ml_preds.to_numpy() > 0.5)[:, None]
+
+    # 3. Evaluate the grid in (bars x combinations) chunks
+    build_signals = SIGNAL_BUILDERS[strategy_type]
+    combos = [c for c in combos if warmup_bars(strategy_type, c) <= len(data)]
+    if not combos:
+        raise ValueError("Not enough data for any parameter combination.")
+
+    metric_chunks = []
+    for offset in range(0, len(combos), CHUNK_SIZE):
+        chunk = combos[offset:offset + CHUNK_SIZE]
+        buy, sell, start = build_signals(cache, chunk)
+        if ml_confirmation is not None:
+            buy &= ml_confirmation
+        equity = engine.simulate_matrix(close, buy, sell)
+        metric_chunks.append(calculate_performance_metrics_batch(equity, data.index, start, benchmark=close))
+        done = offset + len(chunk)
+        progress("simulating", round(10 + 85 * done / len(combos), 1), combinations_done=done)
+        # Ranked only if the job is cut short by its time limit
+        checkpoint(lambda done=done, chunks=list(metric_chunks): {
+            "strategyType": strategy_type, "ticker": ticker, "rankBy": rank_by,
+            "combinationsEvaluated": done, "combinationsTotal": len(combos),
+            "results": _ranked_table(combos[:done], chunks, rank_by, top_n),
+        })
+
+    # 4. Rank and format
+    table = _ranked_table(combos, metric_chunks, rank_by, top_n)
+
+    print("Sweep finished.")
+    return {
+        "strategyType": strategy_type,
+        "ticker": ticker,
+        "rankBy": rank_by,
+        "combinationsEvaluated": len(combos),
+        "results": table,
+    }
+
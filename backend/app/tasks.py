@@ -1,63 +1,316 @@
-from celery import Celery
+from celery import Celery, signals
+from billiard.exceptions import WorkerLostError
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded
+from amqp.exceptions import ChannelError
+from kombu import Queue
 import json
+import os
 
 # --- Application-Specific Imports ---
 from .backtester import run_simulation
+from .portfolio import resolve_tickers, run_portfolio_simulation
+from .sweep import run_sweep
+from .walkforward import run_walk_forward
 # --- NEW: Import your database session and models ---
-from .database import SessionLocal
+from .database import SessionLocal, engine as db_engine
 from . import models
+from .events import progress_reporter
+from . import dedup
+from .artifacts import get_artifact_manager
+from .market_data import get_market_data_store
+from .results import DIAGNOSTICS_KEY
+from .instrumentation import INSTRUMENTATION_ENABLED, StageRecorder, diagnostics, profiled, record_job
 
 # --- Celery Configuration ---
-# This setup remains the same. It tells Celery to use Redis as a message broker.
+# Redis carries the messages and task states; the reports themselves go to the
+# database, so a task's Celery result is only its small status dict.
+# CELERY_BROKER_URL="memory://" runs broker and result backend in-process, for
+# integration tests without Redis: start a worker in the same process with
+# `celery.contrib.testing.worker.start_worker(celery_app)`, or set
+# CELERY_TASK_ALWAYS_EAGER=1 to run each task inside the `.delay()` call.
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND") or (
+    "cache+memory://" if CELERY_BROKER_URL.startswith("memory://") else "redis://localhost:6379/1")
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "0") not in ("0", "false", "False")
+RESULT_EXPIRES_SECONDS = int(os.getenv("CELERY_RESULT_EXPIRES", "86400"))
+
+# Short single-ticker backtests and heavy jobs (portfolios, sweeps,
+# walk-forward) have their own queues, so a worker pool can be dedicated to
+# each (`celery -A app.tasks worker -Q backtests`) and a burst of sweeps never
+# delays interactive backtests.
+BACKTEST_QUEUE = os.getenv("CELERY_BACKTEST_QUEUE", "backtests")
+HEAVY_QUEUE = os.getenv("CELERY_HEAVY_QUEUE", "heavy")
+
+# Seconds. At the soft limit a job stores what it has finished so far (see
+# `PartialResults`); the hard limit kills the worker process. Limits are
+# enforced by the prefork pool only.
+BACKTEST_SOFT_TIME_LIMIT = int(os.getenv("BACKTEST_SOFT_TIME_LIMIT", "120"))
+BACKTEST_TIME_LIMIT = int(os.getenv("BACKTEST_TIME_LIMIT", "180"))
+HEAVY_SOFT_TIME_LIMIT = int(os.getenv("HEAVY_SOFT_TIME_LIMIT", "1800"))
+HEAVY_TIME_LIMIT = int(os.getenv("HEAVY_TIME_LIMIT", "1980"))
+
+# Worker warm-up: model sets ("*" = every available set, up to the resident
+# limit) and cached tickers ("*" = every cached file) read before tasks are accepted.
+WORKER_PRELOAD_MODEL_SETS = os.getenv("WORKER_PRELOAD_MODEL_SETS", "*")
+WORKER_WARM_TICKERS = os.getenv("WORKER_WARM_TICKERS", "*")
+WORKER_WARM_MAX_BYTES = int(float(os.getenv("WORKER_WARM_MAX_MB", "256")) * 1024 * 1024)
+
 celery_app = Celery(
     "tasks",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/1"
+    broker=CELERY_BROKER_URL,
+    backend=CELERY_RESULT_BACKEND
 )
 
+celery_app.conf.update(
+    task_queues=(Queue(BACKTEST_QUEUE), Queue(HEAVY_QUEUE)),
+    task_default_queue=BACKTEST_QUEUE,
+    task_routes={
+        "run_backtest_task": {"queue": BACKTEST_QUEUE},
+        "run_portfolio_task": {"queue": HEAVY_QUEUE},
+        "run_sweep_task": {"queue": HEAVY_QUEUE},
+        "run_walk_forward_task": {"queue": HEAVY_QUEUE},
+    },
+    # Long CPU-bound tasks: a process reserves one message at a time and
+    # acknowledges it when done, so a job lost with its whole worker node is
+    # redelivered instead of dropped, and queued jobs never wait behind a busy
+    # process. A job whose own process dies (a crash, the hard time limit) is
+    # failed rather than requeued, since it would most likely kill the next
+    # process too; see `record_lost_job`.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    # Unacknowledged Redis messages are redelivered after this timeout, so it has to outlast the longest job.
+    # The in-memory broker is polled; the default of once a second would leave in-process workers idle.
+    broker_transport_options={"visibility_timeout": max(3600, 2 * HEAVY_TIME_LIMIT),
+                              **({"polling_interval": 0.01} if CELERY_BROKER_URL.startswith("memory://") else {})},
+    task_track_started=True,
+    result_expires=RESULT_EXPIRES_SECONDS,
+    task_always_eager=CELERY_TASK_ALWAYS_EAGER,
+    # Eager tasks only report their state (to /status) if it is stored like a worker's
+    task_store_eager_result=CELERY_TASK_ALWAYS_EAGER,
+)
+
+
+# --- Worker Warm-Up ---
+
+def _names(setting: str) -> list | None:
+    """None for "*", else the comma-separated names in `setting`."""
+    return None if setting.strip() == "*" else [name.strip() for name in setting.split(",") if name.strip()]
+
+
+@signals.worker_init.connect
+def warm_worker(**kwargs):
+    """
+    Runs in the main worker process before the pool starts: artifacts loaded
+    here are shared copy-on-write by every prefork child, and the cached bar
+    files are read into the OS page cache the children map them from.
+    """
+    manager = get_artifact_manager()
+    set_names = _names(WORKER_PRELOAD_MODEL_SETS)
+    if set_names is None:
+        set_names = [name for name in manager.model_sets if manager.is_available(name)][:manager.max_resident]
+    set_names = [name for name in set_names if manager.is_available(name)]
+    try:
+        if set_names:
+            manager.preload(set_names)
+    except Exception as e:
+        print(f"Could not preload model artifacts: {e}")
+
+    tickers = _names(WORKER_WARM_TICKERS)
+    if tickers != []:
+        warmed = get_market_data_store().warm(tickers, max_bytes=WORKER_WARM_MAX_BYTES)
+        print(f"Worker warm-up: {warmed} cached bar files read.")
+
+
+@signals.worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Each prefork child drops the database connections inherited from the parent, leaving them to it."""
+    db_engine.dispose(close=False)
+
+
+@signals.task_failure.connect
+def record_lost_job(sender=None, task_id=None, exception=None, kwargs=None, **extra):
+    """
+    Runs in the main worker process when a job's process died (hard time
+    limit, crash, OOM kill) before `_run_job` could record the failure:
+    stores the FAILURE report and releases the job's dedup claim.
+    """
+    if not isinstance(exception, (WorkerLostError, TimeLimitExceeded)) or not kwargs or "job_id" not in kwargs:
+        return
+    job_id = kwargs["job_id"]
+    if isinstance(exception, TimeLimitExceeded):
+        error = f"Job exceeded its {sender.time_limit}s time limit and was stopped."
+    else:
+        error = f"The worker process running the job was lost: {exception}"
+    print(f"Job {job_id} failed. Error: {error}")
+    db = SessionLocal()
+    try:
+        if db.query(models.BacktestResult.id).filter(models.BacktestResult.job_id == job_id).first() is None:
+            db.add(models.BacktestResult(job_id=job_id, owner_id=kwargs["owner_id"],
+                                         result_data={"status": "FAILURE", "error": error}))
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Could not record the failure of job {job_id}: {e}")
+    finally:
+        db.close()
+    if kwargs.get("dedup_key"):
+        dedup.release_job(kwargs["dedup_key"], job_id)
+    progress_reporter(job_id)("failed", None, error=error, partial=False)
+
+
+# --- Queue Depth ---
 
-# --- Celery Background Task Definition ---
-@celery_app.task(name="run_backtest_task")
-def run_backtest_task(job_id: str, strategy_json: dict, ticker: str, start_date: str, end_date: str, owner_id: int):
+def queue_depths() -> dict:
+    """Messages waiting in each queue, not counting tasks a worker has already taken."""
+    depths = {}
+    with celery_app.connection_for_read() as connection:
+        channel = connection.default_channel
+        for queue in (BACKTEST_QUEUE, HEAVY_QUEUE):
+            try:
+                depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+            except ChannelError:
+                depths[queue] = 0  # Redis drops an emptied queue's list
+    return depths
+
+
+# --- Partial Results ---
+
+class PartialResults:
     """
-    The Celery worker executes this function when a backtest job is dispatched.
-    It runs the simulation and stores the final report in the PostgreSQL database.
+    `checkpoint` callback for the heavy runners: keeps the builder of the
+    latest partial report and only calls it if the job is cut short.
     """
-    print(f"Celery worker received job {job_id} for user {owner_id}.")
 
-    # NEW: Create an independent database session for this background task.
+    def __init__(self):
+        self._build = None
+
+    def __call__(self, build):
+        self._build = build
+
+    def report(self) -> dict | None:
+        return self._build() if self._build else None
+
+
+def _finish_instrumentation(task, job_id: str, recorder: StageRecorder | None, status: str):
+    """Exports a job's stage timings as metrics and as a Celery task event."""
+    if recorder is None:
+        return
+    record_job(recorder, status)
+    if task.request.is_eager:
+        return  # Task events only exist for jobs executed by a worker
+    try:
+        task.send_event("task-stage-timings", retry=False, job_id=job_id, kind=recorder.kind, status=status, stages=recorder.summary())
+    except Exception as e:
+        print(f"Could not send stage timings for job {job_id}: {e}")
+
+
+def _run_job(task, kind: str, runner, runner_args: tuple, job_id: str, owner_id: int, tickers: list, interval: str | None,
+             dedup_key: str | None, profile: str | None, checkpoint: PartialResults | None = None):
+    """
+    Shared body of the job tasks: runs `runner`, stores its report in the
+    database and publishes the outcome. `runner` gets `checkpoint` as well,
+    and a job stopped by its soft time limit stores the last partial report.
+    `profile` ("cprofile" or "sampling") stores a profile of the run with the result.
+    """
+    print(f"Celery worker received {kind} {job_id} for user {owner_id}.")
+    progress = progress_reporter(job_id)
+    progress("started", 0)
+    recorder = StageRecorder(kind) if INSTRUMENTATION_ENABLED else None
+    if recorder:
+        progress = recorder.wrap(progress)
+    runner_kwargs = {"progress": progress} if checkpoint is None else {"progress": progress, "checkpoint": checkpoint}
+
+    # Create an independent database session for this background task.
     db = SessionLocal()
+    stored = False
 
     try:
-        # 1. Execute the potentially long-running simulation (this is unchanged).
-        results = run_simulation(strategy_json, ticker, start_date, end_date)
-
-        # 2. NEW: Save the final report to the PostgreSQL database.
-        # This replaces the old `results_db.set(...)` line.
-        db_result = models.BacktestResult(
-            job_id=job_id,
-            owner_id=owner_id,  # Links the result to the user who ran it
-            result_data=results   # Stores the entire JSON report
-        )
-        db.add(db_result)
+        # 1. Execute the potentially long-running simulation, keeping identical requests attached to it.
+        with dedup.keep_claimed(dedup_key, job_id):
+            results, profile_report = profiled(profile, runner, *runner_args, **runner_kwargs)
+        if recorder:
+            recorder.mark("returned")
+        if recorder or profile_report:
+            results[DIAGNOSTICS_KEY] = diagnostics(recorder, profile_report)
+
+        # 2. Save the final report to the database. The store stage ends with the commit, so its
+        # timing only reaches the metrics and the task event, never the stored diagnostics.
+        db.add(models.BacktestResult(job_id=job_id, owner_id=owner_id, result_data=results))
         db.commit()
+        stored = True
+        if recorder:
+            recorder.mark("stored")
 
-        print(f"Job {job_id} completed successfully and results saved to database.")
+        print(f"{kind.capitalize()} {job_id} completed successfully and results saved to database.")
+        if dedup_key:
+            dedup.mark_completed(dedup_key, job_id, tickers, interval or "1d")
+        _finish_instrumentation(task, job_id, recorder, "success")
+        progress("completed", 100)
         return {"status": "SUCCESS", "job_id": job_id}
 
     except Exception as e:
-        print(f"Job {job_id} failed. Error: {e}")
+        timed_out = isinstance(e, SoftTimeLimitExceeded)
+        error = f"{kind.capitalize()} exceeded its {task.soft_time_limit}s time limit." if timed_out else str(e)
+        print(f"{kind.capitalize()} {job_id} failed. Error: {error}")
         # If an error occurs, roll back any partial database changes.
         db.rollback()
 
-        # You can optionally save the error to the database for debugging.
-        error_report = {"status": "FAILURE", "error": str(e)}
-        db_result = models.BacktestResult(job_id=job_id, owner_id=owner_id, result_data=error_report)
-        db.add(db_result)
-        db.commit()
+        error_report = {"status": "FAILURE", "error": error}
+        partial = checkpoint.report() if timed_out and checkpoint is not None else None
+        if partial:
+            error_report["partialResults"] = partial
+        if recorder:
+            error_report[DIAGNOSTICS_KEY] = diagnostics(recorder, None)
+        if not stored:  # A report committed before the error stays; job ids are unique
+            db.add(models.BacktestResult(job_id=job_id, owner_id=owner_id, result_data=error_report))
+            db.commit()
+        if dedup_key:
+            dedup.release_job(dedup_key, job_id)
+        _finish_instrumentation(task, job_id, recorder, "failure")
+        progress("failed", None, error=error, partial=bool(partial))
 
         # Raising the exception ensures Celery marks the task as 'FAILURE'.
         raise e
     finally:
-        # 3. NEW: It's crucial to always close the database session.
+        # It's crucial to always close the database session.
         db.close()
+
+
+# --- Celery Background Task Definitions ---
+
+@celery_app.task(name="run_backtest_task", bind=True, soft_time_limit=BACKTEST_SOFT_TIME_LIMIT, time_limit=BACKTEST_TIME_LIMIT)
+def run_backtest_task(self, job_id: str, strategy_json: dict, ticker: str, start_date: str, end_date: str, owner_id: int,
+                      dedup_key: str | None = None, profile: str | None = None):
+    """
+    The Celery worker executes this function when a single-ticker backtest is
+    dispatched. It runs the simulation and stores the final report in the database.
+    """
+    return _run_job(self, "backtest", run_simulation, (strategy_json, ticker, start_date, end_date),
+                    job_id, owner_id, [ticker], strategy_json.get("interval"), dedup_key, profile)
+
+
+@celery_app.task(name="run_portfolio_task", bind=True, soft_time_limit=HEAVY_SOFT_TIME_LIMIT, time_limit=HEAVY_TIME_LIMIT)
+def run_portfolio_task(self, job_id: str, strategy_json: dict, start_date: str, end_date: str, owner_id: int,
+                       dedup_key: str | None = None, profile: str | None = None):
+    """Portfolio backtests run on the heavy queue; a timed-out run keeps the constituents simulated so far."""
+    return _run_job(self, "backtest", run_portfolio_simulation, (strategy_json, start_date, end_date),
+                    job_id, owner_id, resolve_tickers(strategy_json), strategy_json.get("interval"), dedup_key, profile, PartialResults())
+
+
+@celery_app.task(name="run_sweep_task", bind=True, soft_time_limit=HEAVY_SOFT_TIME_LIMIT, time_limit=HEAVY_TIME_LIMIT)
+def run_sweep_task(self, job_id: str, sweep_json: dict, ticker: str, start_date: str, end_date: str, owner_id: int,
+                   dedup_key: str | None = None, profile: str | None = None):
+    """
+    Evaluates a whole parameter grid in one task and stores the ranked
+    metrics table in the database; a timed-out sweep ranks the combinations evaluated so far.
+    """
+    return _run_job(self, "sweep", run_sweep, (sweep_json, ticker, start_date, end_date),
+                    job_id, owner_id, [ticker], sweep_json.get("interval"), dedup_key, profile, PartialResults())
+
+
+@celery_app.task(name="run_walk_forward_task", bind=True, soft_time_limit=HEAVY_SOFT_TIME_LIMIT, time_limit=HEAVY_TIME_LIMIT)
+def run_walk_forward_task(self, job_id: str, wf_json: dict, ticker: str, start_date: str, end_date: str, owner_id: int,
+                          dedup_key: str | None = None, profile: str | None = None):
+    """Runs a walk-forward analysis and stores per-fold and stitched out-of-sample metrics."""
+    return _run_job(self, "walk-forward", run_walk_forward, (wf_json, ticker, start_date, end_date),
+                    job_id, owner_id, [ticker], wf_json.get("interval"), dedup_key, profile, PartialResults())
@@ -0,0 +1,146 @@
+# app/timeframes.py
+
+import numpy as np
+import pandas as pd
+
+# --- Intervals ---
+# Bar intervals accepted end to end, finest first. Intraday intervals have a
+# fixed width; daily and coarser ones follow the calendar. Names follow
+# yfinance ("60m" is accepted as an alias of "1h").
+MINUTE_NS = 60 * 10**9
+DAY_NS = 24 * 60 * MINUTE_NS
+INTRADAY_WIDTHS = {"1m": MINUTE_NS, "5m": 5 * MINUTE_NS, "15m": 15 * MINUTE_NS, "30m": 30 * MINUTE_NS, "1h": 60 * MINUTE_NS}
+INTERVALS = (*INTRADAY_WIDTHS, "1d", "1wk", "1mo")
+INTERVAL_ALIASES = {"60m": "1h"}
+DEFAULT_INTERVAL = "1d"
+
+TRADING_DAYS_PER_YEAR = 252
+YEAR_NS = 365.25 * DAY_NS
+
+
+def normalize_interval(interval: str | None) -> str:
+    interval = INTERVAL_ALIASES.get(interval, interval) or DEFAULT_INTERVAL
+    if interval not in INTERVALS:
+        raise ValueError(f"Unsupported interval '{interval}'; choose one of {', '.join(INTERVALS)}.")
+    return interval
+
+
+def can_resample(source: str, target: str) -> bool:
+    """Whether `target` bars can be built from `source` bars (weeks straddle months, so "1wk" only builds itself)."""
+    if source == target:
+        return True
+    if source in INTRADAY_WIDTHS:
+        return target not in INTRADAY_WIDTHS or INTRADAY_WIDTHS[target] % INTRADAY_WIDTHS[source] == 0
+    return source == "1d" and target in ("1wk", "1mo")
+
+
+def finer_intervals(interval: str) -> list:
+    """Intervals `interval` can be resampled from, coarsest (fewest rows) first."""
+    interval = normalize_interval(interval)
+    return [source for source in reversed(INTERVALS[:INTERVALS.index(interval)]) if can_resample(source, interval)]
+
+
+# --- Resampling ---
+# Bars are bucketed by their exchange-local wall-clock time in one pass over
+# the int64 timestamps, and every bucket is reduced with `np.ufunc.reduceat`,
+# so resampling millions of minute bars never leaves numpy. Intraday buckets
+# are anchored at each day's first bar (the session open), matching how
+# exchanges and yfinance label hourly bars (e.g. 09:30, 10:30, ...).
+
+def _as_ns(index: pd.DatetimeIndex) -> np.ndarray:
+    """int64 nanoseconds of `index` (scaling is much cheaper than `as_unit` on long indexes)."""
+    return index.asi8 * (np.timedelta64(1, index.unit) // np.timedelta64(1, 'ns'))
+
+
+def _wall_ns(index: pd.DatetimeIndex) -> np.ndarray:
+    """Local wall-clock timestamps (ns) of `index`."""
+    return _as_ns(index.tz_localize(None) if index.tz is not None else index)
+
+
+def _bucket_labels(wall: np.ndarray, interval: str) -> np.ndarray:
+    """Wall-clock start of the `interval` bucket each (sorted) timestamp falls into."""
+    if interval in INTRADAY_WIDTHS:
+        width = INTRADAY_WIDTHS[interval]
+        day_starts = np.flatnonzero(np.diff(wall // DAY_NS, prepend=np.iinfo(np.int64).min))
+        session_open = np.repeat(wall[day_starts], np.diff(np.append(day_starts, len(wall))))
+        return session_open + (wall - session_open) // width * width
+    days = wall // DAY_NS
+    if interval == "1d":
+        return days * DAY_NS
+    if interval == "1wk":
+        return (days - (days + 3) % 7) * DAY_NS  # Mondays (1970-01-01 was a Thursday)
+    months = wall.astype('datetime64[ns]').astype('datetime64[M]')
+    return months.astype('datetime64[ns]').astype(np.int64)
+
+
+def resample_bars(data: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    Builds `interval` OHLCV bars from finer, time-sorted `data`: first open,
+    highest high, lowest low, last close and summed volume per bucket.
+    Buckets cut by the start or end of `data` hold only the bars inside it.
+    Rows missing a price are dropped first.
+    """
+    interval = normalize_interval(interval)
+    prices = [col for col in ('Open', 'High', 'Low', 'Close') if col in data.columns]
+    data = data.dropna(subset=prices)
+    if data.empty:
+        return data
+
+    wall = _wall_ns(data.index)
+    labels = _bucket_labels(wall, interval)
+    starts = np.flatnonzero(np.diff(labels, prepend=labels[0] - 1))
+    ends = np.append(starts[1:], len(labels)) - 1
+
+    columns = {}
+    for name in data.columns:
+        values = data[name].to_numpy()
+        if name == 'Open':
+            columns[name] = values[starts]
+        elif name == 'High':
+            columns[name] = np.maximum.reduceat(values, starts)
+        elif name == 'Low':
+            columns[name] = np.minimum.reduceat(values, starts)
+        elif name == 'Volume':
+            columns[name] = np.add.reduceat(np.nan_to_num(values.astype(np.float64)), starts)
+        else:
+            columns[name] = values[ends]
+
+    # A bucket's label keeps the UTC offset of its first bar, so no wall time has to be re-localized
+    utc = _as_ns(data.index)[starts] - (wall[starts] - labels[starts])
+    index = pd.DatetimeIndex(utc.astype('datetime64[ns]'), name=data.index.name)
+    if data.index.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(data.index.tz)
+    return pd.DataFrame(columns, index=index)
+
+
+# --- Bar Frequency ---
+
+def periods_per_year(index: pd.DatetimeIndex, starts=None):
+    """
+    Bars per year for annualizing per-bar statistics, from the spacing of
+    `index`: 252 for daily bars, 252 x the bars per trading day seen for
+    intraday bars, and calendar-based for weekly or coarser bars. With
+    `starts`, returns an array with the value for each `index[start:]`,
+    computed in one pass.
+    """
+    n = len(index)
+    if starts is not None:
+        starts = np.asarray(starts, dtype=np.int64)
+    if n < 3:
+        return float(TRADING_DAYS_PER_YEAR) if starts is None else np.full(len(starts), float(TRADING_DAYS_PER_YEAR))
+
+    wall = _wall_ns(index)
+    step = np.median(np.diff(wall))
+    if step < DAY_NS:
+        new_day = np.diff(wall // DAY_NS) != 0
+        if starts is None:
+            return TRADING_DAYS_PER_YEAR * n / (np.count_nonzero(new_day) + 1)
+        days_after = np.concatenate(([0], np.cumsum(new_day)))
+        return TRADING_DAYS_PER_YEAR * (n - starts) / (days_after[-1] - days_after[np.minimum(starts, n - 1)] + 1)
+    value = float(TRADING_DAYS_PER_YEAR) if step <= 4 * DAY_NS else YEAR_NS / step
+    return value if starts is None else np.full(len(starts), value)
+
+
+def elapsed_days(start, end) -> float:
+    """Calendar days (fractional, so intraday spans count) between timestamps."""
+    return (end - start) / pd.Timedelta(days=1)
@@ -0,0 +1,248 @@
+# app/universe.py
+
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+# Universe files are CSVs in UNIVERSE_DIR with a symbol column (TICKER or
+# Symbol), an optional name column (NAME or Company Name) and an optional
+# EXCHANGE column. UNIVERSE_FILES lists the ones served by /api/stocks
+# (e.g. "nse.csv,bse.csv,us.csv"); a symbol listed twice keeps its first row.
+UNIVERSE_DIR = os.getenv("UNIVERSE_DIR", "..")  # data.csv lives in the project root
+UNIVERSE_FILES = [f.strip() for f in os.getenv("UNIVERSE_FILES", "data.csv").split(",") if f.strip()]
+# Files are re-checked (one stat each) at most this often; edits are picked up without a restart
+UNIVERSE_RELOAD_SECONDS = float(os.getenv("UNIVERSE_RELOAD_SECONDS", "5"))
+# Share of the query's trigrams an entry must contain to count as a fuzzy match
+FUZZY_MIN_SCORE = float(os.getenv("UNIVERSE_FUZZY_MIN_SCORE", "0.5"))
+
+SYMBOL_COLUMNS = ("TICKER", "SYMBOL")
+NAME_COLUMNS = ("NAME", "COMPANY NAME")
+EXCHANGE_COLUMNS = ("EXCHANGE",)
+
+_WORD = re.compile(r"[A-Z0-9&.\-]+")
+
+
+def universe_path(name: str) -> str:
+    """Path of a universe file in UNIVERSE_DIR; only plain `.csv` file names are accepted."""
+    if os.path.basename(name) != name or not name.endswith(".csv"):
+        raise ValueError(f"Invalid universe file: {name}")
+    path = os.path.join(UNIVERSE_DIR, name)
+    if not os.path.exists(path):
+        raise ValueError(f"Universe file not found: {name}")
+    return path
+
+
+def _column(universe: pd.DataFrame, candidates: tuple):
+    upper = {col.upper(): col for col in universe.columns}
+    return next((upper[c] for c in candidates if c in upper), None)
+
+
+def read_universe(name: str) -> pd.DataFrame:
+    """
+    Reads a universe file into Symbol / Company Name / Exchange columns
+    (whitespace stripped, blank and repeated symbols dropped).
+    """
+    universe = pd.read_csv(universe_path(name), dtype=str, skipinitialspace=True)
+    universe.columns = universe.columns.str.strip()
+    symbol = _column(universe, SYMBOL_COLUMNS)
+    if symbol is None:
+        raise ValueError(f"Universe file {name} has no TICKER or Symbol column.")
+    name_col, exchange_col = _column(universe, NAME_COLUMNS), _column(universe, EXCHANGE_COLUMNS)
+
+    frame = pd.DataFrame({
+        "Symbol": universe[symbol].str.strip(),
+        "Company Name": universe[name_col].str.strip() if name_col else "",
+        "Exchange": universe[exchange_col].str.strip() if exchange_col else "",
+    }).fillna("")
+    frame = frame[frame["Symbol"] != ""]
+    return frame.drop_duplicates("Symbol").reset_index(drop=True)
+
+
+# --- Symbol Index ---
+# Built once per universe version and never mutated, so searches need no
+# locks. Prefix lookups are binary searches over sorted upper-case keys (the
+# symbols and every word of the names); fuzzy lookups count shared trigrams
+# through per-trigram posting arrays with one `np.bincount`.
+
+def _trigrams(text: str) -> set:
+    grams = set()
+    for word in _WORD.findall(text.upper()):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SymbolIndex:
+    def __init__(self, universe: pd.DataFrame):
+        self.symbols = universe["Symbol"].to_numpy(dtype=object)
+        self.names = universe["Company Name"].to_numpy(dtype=object)
+        self.exchanges = universe["Exchange"].to_numpy(dtype=object)
+        self.has_exchange = bool((universe["Exchange"] != "").any())
+        n = len(universe)
+
+        # Default listing order: symbols alphabetically
+        keys = np.array([s.upper() for s in self.symbols], dtype=str) if n else np.array([], dtype=str)
+        self.order = np.argsort(keys, kind="stable").astype(np.int32)
+        self.symbol_keys = keys[self.order]
+        self.symbol_lengths = np.char.str_len(keys).astype(np.int32) if n else np.array([], dtype=np.int32)
+
+        words, owners = [], []
+        for i, name in enumerate(self.names):
+            for word in set(_WORD.findall(name.upper())):
+                words.append(word)
+                owners.append(i)
+        words = np.array(words, dtype=str) if words else np.array([], dtype=str)
+        word_order = np.argsort(words, kind="stable")
+        self.word_keys = words[word_order]
+        self.word_owners = np.asarray(owners, dtype=np.int32)[word_order] if owners else np.array([], dtype=np.int32)
+
+        postings = {}
+        self.gram_counts = np.zeros(n, dtype=np.int32)
+        for i in range(n):
+            grams = _trigrams(f"{self.symbols[i]} {self.names[i]}")
+            self.gram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @staticmethod
+    def _prefix_range(keys: np.ndarray, prefix: str) -> slice:
+        lo = np.searchsorted(keys, prefix, side="left")
+        hi = np.searchsorted(keys, prefix + "\U0010ffff", side="left")
+        return slice(lo, hi)
+
+    def _by_name(self, words: list) -> np.ndarray:
+        """Entries whose name has a word starting with each query word, shortest names first."""
+        ids = np.array([], dtype=np.int32) if not words else None
+        for word in words:
+            owners = np.unique(self.word_owners[self._prefix_range(self.word_keys, word)])
+            ids = owners if ids is None else np.intersect1d(ids, owners, assume_unique=True)
+        return ids[np.argsort(self.gram_counts[ids], kind="stable")]
+
+    def _fuzzy(self, query: str) -> np.ndarray:
+        """Entries containing enough of the trigrams of `query`, best (then shortest) first."""
+        query_grams = _trigrams(query)
+        grams = [self.postings[g] for g in query_grams if g in self.postings]
+        if not grams:
+            return np.array([], dtype=np.int32)
+        hits = np.bincount(np.concatenate(grams), minlength=len(self))
+        candidates = np.flatnonzero(hits >= FUZZY_MIN_SCORE * len(query_grams))
+        return candidates[np.lexsort((self.gram_counts[candidates], -hits[candidates]))]
+
+    def search(self, query: str | None = None, fuzzy: bool = True) -> np.ndarray:
+        """
+        Row ids matching `query`, ranked: exact symbol, symbol prefix, name
+        word prefix, then (if `fuzzy`) trigram matches for typos and infixes.
+        Without a query, every symbol in alphabetical order.
+        """
+        query = (query or "").strip().upper()
+        if not query:
+            return self.order
+        by_symbol = self.order[self._prefix_range(self.symbol_keys, query)]
+        # Shorter symbols first, so the exact match leads its prefix range
+        by_symbol = by_symbol[np.argsort(self.symbol_lengths[by_symbol], kind="stable")]
+        ranked = [by_symbol, self._by_name(_WORD.findall(query))]
+        if fuzzy:
+            ranked.append(self._fuzzy(query))
+        ids = np.concatenate(ranked)
+        _, first = np.unique(ids, return_index=True)
+        return ids[np.sort(first)]
+
+    def rows(self, ids: np.ndarray) -> list:
+        columns = {"Symbol": self.symbols, "Company Name": self.names}
+        if self.has_exchange:
+            columns["Exchange"] = self.exchanges
+        return [{key: values[i] for key, values in columns.items()} for i in ids]
+
+
+# --- Universe Service ---
+# Holds the index of UNIVERSE_FILES. When a file's modification time or size
+# changes, a background thread builds a new index and swaps it in; searches
+# keep using the previous one meanwhile, and a broken edit keeps it for good.
+
+class UniverseService:
+    def __init__(self, files: list = None):
+        self.files = list(files or UNIVERSE_FILES)
+        self.index = None
+        self.version = None
+        self.reloads = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reloading = False
+
+    def _file_version(self) -> tuple:
+        stats = []
+        for name in self.files:
+            try:
+                stat = os.stat(universe_path(name))
+                stats.append((name, stat.st_mtime_ns, stat.st_size))
+            except (OSError, ValueError):
+                stats.append((name, None, None))
+        return tuple(stats)
+
+    def load(self) -> SymbolIndex:
+        """(Re)builds the index now. Unreadable files are skipped on the first load and fail a reload."""
+        with self._lock:
+            version = self._file_version()
+            frames = []
+            for name in self.files:
+                try:
+                    frames.append(read_universe(name))
+                except ValueError as e:
+                    if self.index is not None:
+                        raise
+                    print(f"Skipping universe file {name}: {e}")
+            universe = pd.concat(frames, ignore_index=True).drop_duplicates("Symbol") if frames else \
+                pd.DataFrame({"Symbol": [], "Company Name": [], "Exchange": []}, dtype=object)
+            started = time.perf_counter()
+            self.index = SymbolIndex(universe.reset_index(drop=True))
+            self.version = version
+            self.reloads += 1
+            self._checked_at = time.monotonic()
+            print(f"Loaded {len(self.index)} symbols from {', '.join(self.files)} "
+                  f"in {(time.perf_counter() - started) * 1000:.1f}ms.")
+            return self.index
+
+    def _reload(self):
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Universe reload failed, keeping the previous symbols: {e}")
+        finally:
+            self._reloading = False
+
+    def get(self) -> SymbolIndex:
+        """The current index; starts a background rebuild if a universe file changed since the last check."""
+        if self.index is None:
+            return self.load()
+        if not self._reloading and time.monotonic() - self._checked_at >= UNIVERSE_RELOAD_SECONDS:
+            self._checked_at = time.monotonic()
+            if self._file_version() != self.version:
+                self._reloading = True
+                threading.Thread(target=self._reload, name="universe-reload", daemon=True).start()
+        return self.index
+
+    def search(self, query: str | None = None, offset: int = 0, limit: int | None = None, fuzzy: bool = True) -> tuple:
+        """(total matches, one page of {Symbol, Company Name[, Exchange]} rows)."""
+        index = self.get()
+        ids = index.search(query, fuzzy)
+        page = ids[offset:] if limit is None else ids[offset:offset + limit]
+        return len(ids), index.rows(page)
+
+
+_service = None
+
+
+def get_universe_service() -> UniverseService:
+    global _service
+    if _service is None:
+        _service = UniverseService()
+    return _service
@@ -0,0 +1,196 @@
+# app/walkforward.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from . import engine
+from .backtester import get_ml_predictions, no_checkpoint, no_progress
+from .market_data import get_market_data_store
+from .metrics import calculate_performance_metrics, calculate_performance_metrics_batch, format_key_metrics
+from .results import RESULT_FORMAT, encode_columns
+from .signals import SIGNAL_BUILDERS, IndicatorCache, warmup_bars
+from .sweep import CHUNK_SIZE, expand_parameter_grid
+from .timeframes import normalize_interval
+
+# --- Configuration ---
+MAX_WORKERS = int(os.getenv("WALK_FORWARD_MAX_WORKERS", str(min(8, os.cpu_count() or 1))))
+FOLD_MODES = ("rolling", "anchored")
+
+
+def fold_windows(n_bars: int, folds: int, mode: str = "rolling", train_ratio: float = 3.0) -> list:
+    """
+    Splits `n_bars` into `folds` consecutive (train_start, test_start, test_end)
+    windows. Test windows are equally long and end on the last bar; training
+    windows are `train_ratio` test windows long ("rolling") or grow from the
+    first bar ("anchored").
+    """
+    if mode not in FOLD_MODES:
+        raise ValueError(f"Unknown walk-forward mode: {mode}")
+    test_len = int(n_bars // (train_ratio + folds))
+    train_len = int(round(test_len * train_ratio))
+    if test_len < 2 or train_len < 2:
+        raise ValueError(f"Not enough data for {folds} folds: only {n_bars} bars.")
+
+    first_test = n_bars - folds * test_len
+    windows = []
+    for i in range(folds):
+        test_start = first_test + i * test_len
+        train_start = 0 if mode == "anchored" else test_start - train_len
+        windows.append((train_start, test_start, test_start + test_len))
+    return windows
+
+
+# --- Fold Evaluation ---
+# Indicators and signals are computed once over the full history and each
+# fold simulates a slice of them, so a window's first bars already see
+# indicators warmed up on the data before it. Slices are views: threads share
+# the same close/signal arrays without copying.
+
+def _train_scores(close: np.ndarray, buy: np.ndarray, sell: np.ndarray, start: np.ndarray,
+                  index: pd.DatetimeIndex, window: tuple, rank_by: str):
+    """Metrics of every combination in a chunk over one training window."""
+    lo, hi = window[0], window[1]
+    local_start = np.clip(start - lo, 0, None)
+    valid = local_start < hi - lo - 1
+    equity = engine.simulate_matrix(close[lo:hi], buy[lo:hi], sell[lo:hi])
+    metrics = calculate_performance_metrics_batch(equity, index[lo:hi], np.minimum(local_start, hi - lo - 1), benchmark=close[lo:hi])
+    scores = np.where(valid, metrics[rank_by], -np.inf)
+    return scores, metrics
+
+
+def _test_equity(close: np.ndarray, buy: np.ndarray, sell: np.ndarray, index: pd.DatetimeIndex, window: tuple) -> pd.Series:
+    lo, hi = window[1], window[2]
+    equity = engine.simulate_matrix(close[lo:hi], buy[lo:hi, None], sell[lo:hi, None])[:, 0]
+    return pd.Series(equity, index=index[lo:hi])
+
+
+def stitch_equity(curves: list, initial_cash: float = engine.INITIAL_CASH) -> pd.Series:
+    """Chains out-of-sample curves so each fold starts from the previous fold's final value."""
+    stitched, scale = [], 1.0
+    for curve in curves:
+        scaled = curve * scale
+        stitched.append(scaled)
+        scale = scaled.iloc[-1] / initial_cash
+    return pd.concat(stitched)
+
+
+def _fold_window(index: pd.DatetimeIndex, fold: int, window: tuple) -> dict:
+    train_start, test_start, test_end = window
+    return {
+        "fold": fold,
+        "trainStart": index[train_start].isoformat(),
+        "trainEnd": index[test_start - 1].isoformat(),
+        "testStart": index[test_start].isoformat(),
+        "testEnd": index[test_end - 1].isoformat(),
+    }
+
+
+# --- Walk-Forward Runner ---
+
+def run_walk_forward(wf_json: dict, ticker: str, start_date: str, end_date: str, progress=no_progress, checkpoint=no_checkpoint):
+    strategy_type = wf_json.get("strategyType")
+    ml_model_set = wf_json.get("ml_model_set")
+    ml_model_name = wf_json.get("ml_model")
+    folds = wf_json.get("folds", 5)
+    mode = wf_json.get("mode", "rolling")
+    rank_by = wf_json.get("rank_by", "sharpe_ratio")
+
+    combos = expand_parameter_grid(strategy_type, wf_json.get("parameters") or {})
+
+    # 1. Fetch once; every fold works on slices of the same arrays
+    data = get_market_data_store().get_bars(ticker, start_date, end_date, normalize_interval(wf_json.get("interval")))
+    data = data.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    if data.empty: raise ValueError("No data fetched.")
+    windows = fold_windows(len(data), folds, mode, wf_json.get("train_ratio", 3.0))
+    combos = [c for c in combos if warmup_bars(strategy_type, c) < windows[0][1]]
+    if not combos:
+        raise ValueError("Not enough data for any parameter combination.")
+    print(f"Walk-forward: {len(windows)} {mode} folds x {len(combos)} combinations on {ticker}...")
+    progress("data_fetched", 10, bars=len(data), folds=len(windows), combinations=len(combos))
+
+    cache = IndicatorCache(data['Close'])
+    close = data['Close'].to_numpy(dtype=np.float64)
+    index = data.index
+    build_signals = SIGNAL_BUILDERS[strategy_type]
+
+    ml_confirmation = None
+    if ml_model_set and ml_model_name:
+        print(f"Generating predictions with {ml_model_name} from {ml_model_set}...")
+        ml_preds = get_ml_predictions(ml_model_set, ml_model_name, data).reindex(index).fillna(0)
+        ml_confirmation = (ml_preds.to_numpy() > 0.5)[:, None]
+
+    def signals_for(chunk: list):
+        buy, sell, start = build_signals(cache, chunk)
+        if ml_confirmation is not None:
+            buy &= ml_confirmation
+        return buy, sell, start
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(windows))), thread_name_prefix="walk-forward") as pool:
+        # 2. In-sample: pick each fold's best combination on its training window
+        best_score = np.full(len(windows), -np.inf)
+        best = [None] * len(windows)
+        for offset in range(0, len(combos), CHUNK_SIZE):
+            chunk = combos[offset:offset + CHUNK_SIZE]
+            buy, sell, start = signals_for(chunk)
+            fold_results = pool.map(lambda w: _train_scores(close, buy, sell, start, index, w, rank_by), windows)
+            for f, (scores, metrics) in enumerate(fold_results):
+                i = int(np.argmax(scores))
+                if scores[i] > best_score[f]:
+                    best_score[f] = scores[i]
+                    best[f] = (offset + i, {name: round(float(values[i]), 2) for name, values in metrics.items()})
+            done = offset + len(chunk)
+            progress("simulating", round(10 + 60 * done / len(combos), 1), combinations_done=done)
+            # In-sample winners so far, reported if the job is cut short by its time limit
+            checkpoint(lambda done=done, winners=list(best): {
+                "strategyType": strategy_type, "ticker": ticker, "mode": mode, "rankBy": rank_by,
+                "combinationsEvaluated": done, "combinationsTotal": len(combos),
+                "folds": [{**_fold_window(index, f, w), **({"params": combos[b[0]], "trainMetrics": b[1]} if b else {})}
+                          for f, (w, b) in enumerate(zip(windows, winners), start=1)],
+            })
+
+        # 3. Out-of-sample: run each fold's winner on its test window
+        chosen = sorted({b[0] for b in best if b is not None})
+        buy, sell, _ = signals_for([combos[i] for i in chosen])
+        column = {combo_index: j for j, combo_index in enumerate(chosen)}
+
+        def test_fold(f):
+            if best[f] is None:
+                return None
+            j = column[best[f][0]]
+            return _test_equity(close, buy[:, j], sell[:, j], index, windows[f])
+
+        curves = list(pool.map(test_fold, range(len(windows))))
+    progress("simulated", 90, bars=sum(len(c) for c in curves if c is not None))
+
+    # 4. Per-fold and stitched out-of-sample metrics
+    fold_reports = []
+    for f, (window, curve) in enumerate(zip(windows, curves), start=1):
+        report = _fold_window(index, f, window)
+        if curve is not None:
+            combo_index, train_metrics = best[f - 1]
+            report.update({"params": combos[combo_index], "trainMetrics": train_metrics,
+                           "testMetrics": calculate_performance_metrics(curve, benchmark=close[window[1]:window[2]])})
+        fold_reports.append(report)
+
+    tested = [c for c in curves if c is not None]
+    if not tested:
+        raise ValueError("No fold had a valid parameter combination.")
+    stitched = stitch_equity(tested)
+    metrics = calculate_performance_metrics(stitched)
+    progress("metrics_ready", 95, metrics=metrics)
+
+    equity_df = stitched.rename('portfolio_value').to_frame()
+    equity_df.index.name = 'date'
+    print("Walk-forward finished.")
+    return {
+        "format": RESULT_FORMAT,
+        "strategyType": strategy_type,
+        "ticker": ticker,
+        "mode": mode,
+        "rankBy": rank_by,
+        "keyMetrics": format_key_metrics(metrics, stitched.iloc[-1]),
+        "folds": fold_reports,
+        "performanceData": encode_columns(equity_df, 'date'),
+    }
@@ -0,0 +1,321 @@
+# benchmarks/loadtest.py
+"""
+Load generator for the backtesting API.
+
+Virtual users (`--concurrency`) submit backtests to /api/backtest, poll
+/api/backtest/status until each job finishes and fetch its results, while
+/api/queues is sampled for the depth of the Celery queues. The report gives
+job throughput, p50/p99 latency per endpoint and end to end, and the queue
+depth over the run, which is what worker pools are sized from.
+
+Usage (from the backend directory):
+
+    # A running deployment
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000 --concurrency 32 --requests 500
+
+    # Everything in this process and offline: replay-mode bars and models,
+    # SQLite, the in-memory broker and `--workers` in-process workers
+    python -m benchmarks.loadtest --concurrency 8 --requests 100 --workers 2
+
+    # Portfolio jobs on a prefork worker, as deployed; reports the processes
+    # each job's signal generation fanned out to
+    python -m benchmarks.loadtest --portfolio 4 --pool prefork --requests 8
+
+A deployment can be load tested offline too: start the API and workers with
+MARKET_DATA_SOURCE=synthetic and MODEL_SOURCE=stand-in (see app/replay.py).
+Every request gets its own ticker and window, so none are coalesced by job
+deduplication; `--distinct N` cycles through N request bodies instead to
+measure the deduplicated path. The in-process target shares one interpreter
+between the API, the workers and the generator, so its numbers compare
+builds rather than size deployments. With `--pool prefork` its workers run
+jobs in child processes instead, and task states go through a file result
+backend (progress events and dedup state stay in the children).
+
+Exits with status 1 when a job failed or timed out, or when a portfolio job
+of several tickers generated its signals in a single process.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import numpy as np
+
+# --- Configuration ---
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "loadtest.json")
+
+STRATEGY_TYPES = ["TrendFollowing", "MeanReversion", "Volatility"]
+ML_MODEL_SET, ML_MODEL = "SetA", "Ensemble"
+ENDPOINTS = ["submit", "status", "results", "job"]  # "job" is submit to results, end to end
+
+# Settings of the in-process target (applied before the app is imported)
+IN_PROCESS_ENVIRONMENT = {
+    "MARKET_DATA_SOURCE": "synthetic",
+    "MODEL_SOURCE": "stand-in",
+    "CELERY_BROKER_URL": "memory://",
+    "DEDUP_URL": "memory://",
+    "METRICS_URL": "memory://",
+    "EVENT_BROKER_URL": "memory://",
+    "WORKER_WARM_TICKERS": "",
+}
+
+
+# --- Requests ---
+
+def build_request(i: int, args) -> dict:
+    """The i-th backtest body; consecutive rounds over the tickers shift the window by a day."""
+    i %= args.distinct or args.requests
+    tickers = args.tickers.split(",")
+    start = datetime.date.fromisoformat(args.start) + datetime.timedelta(days=i // len(tickers))
+    end = start + datetime.timedelta(days=args.days)
+    body = {
+        "strategyName": f"loadtest-{i}",
+        "ticker": tickers[i % len(tickers)],
+        "strategyType": STRATEGY_TYPES[i % len(STRATEGY_TYPES)] if args.strategies == "mixed" else args.strategies,
+        "interval": args.interval,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+    }
+    if args.ml:
+        body.update({"ml_model_set": ML_MODEL_SET, "ml_model": ML_MODEL})
+    if args.portfolio:
+        body["tickers"] = [tickers[(i + k) % len(tickers)] for k in range(args.portfolio)]
+        del body["ticker"]
+    return body
+
+
+async def authenticate(client: httpx.AsyncClient) -> dict:
+    """Registers a throwaway user and returns its bearer header."""
+    username = f"loadtest-{uuid.uuid4().hex[:8]}"
+    password = uuid.uuid4().hex
+    response = await client.post("/api/register", json={"username": username, "email": f"{username}@loadtest.local", "password": password})
+    response.raise_for_status()
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+# --- Load Generation ---
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.completed = 0
+        self.failed = []
+        self.requests = 0
+        self.depths = []
+        self.signal_processes = []
+
+    async def call(self, endpoint: str, request):
+        started = time.perf_counter()
+        response = await request
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        self.requests += 1
+        return response
+
+
+async def run_job(client: httpx.AsyncClient, headers: dict, body: dict, recorder: Recorder, args):
+    started = time.perf_counter()
+    response = await recorder.call("submit", client.post("/api/backtest", json=body, headers=headers))
+    if response.status_code != 200:
+        recorder.failed.append({"ticker": body.get("ticker") or body.get("tickers"), "error": f"submit returned {response.status_code}: {response.text[:200]}"})
+        return
+    job_id = response.json()["job_id"]
+
+    deadline = started + args.job_timeout
+    while True:
+        status = (await recorder.call("status", client.get(f"/api/backtest/status/{job_id}"))).json()
+        if status["status"] != "RUNNING":
+            break
+        if time.perf_counter() > deadline:
+            recorder.failed.append({"job_id": job_id, "error": f"still running after {args.job_timeout}s"})
+            return
+        await asyncio.sleep(args.poll_interval)
+
+    params = {"max_points": args.max_points} if args.max_points else None
+    result = (await recorder.call("results", client.get(f"/api/backtest/results/{job_id}", params=params))).json()
+    recorder.latencies["job"].append(time.perf_counter() - started)
+    if status["status"] != "SUCCESS" or "error" in result:
+        recorder.failed.append({"job_id": job_id, "error": result.get("error") or status.get("info")})
+        return
+    recorder.completed += 1
+    if args.portfolio:
+        stages = (await client.get(f"/api/backtest/{job_id}/profile")).json()["stages"]
+        recorder.signal_processes += [stage.get("processes", 1) for stage in stages if stage["stage"] == "signals"]
+
+
+async def virtual_user(client: httpx.AsyncClient, headers: dict, counter, recorder: Recorder, args):
+    for i in counter:
+        if i >= args.requests:
+            return
+        try:
+            await run_job(client, headers, build_request(i, args), recorder, args)
+        except httpx.HTTPError as e:
+            recorder.failed.append({"request": i, "error": repr(e)})
+
+
+async def sample_queues(client: httpx.AsyncClient, recorder: Recorder, interval: float):
+    while True:
+        try:
+            response = await client.get("/api/queues")
+            if response.status_code == 200:
+                recorder.depths.append(response.json()["queues"])
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def generate_load(client: httpx.AsyncClient, args) -> dict:
+    headers = await authenticate(client)
+    recorder = Recorder()
+    counter = itertools.count()  # Shared by the virtual users; they all run on this event loop
+
+    sampler = asyncio.create_task(sample_queues(client, recorder, args.sample_interval))
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(client, headers, counter, recorder, args) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    return summarize(recorder, elapsed, args)
+
+
+# --- Targets ---
+
+async def run_against_url(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.http_timeout) as client:
+        return await generate_load(client, args)
+
+
+async def run_in_process(args) -> dict:
+    """
+    Serves the app through an in-memory ASGI transport, with `--workers`
+    single-slot Celery workers on threads of this process (like prefork
+    children, each reserves one job at a time and acknowledges it at once),
+    or with one prefork worker of `--workers` children.
+    """
+    with tempfile.TemporaryDirectory(prefix="algo-sphere-load-") as tmp_dir:
+        os.environ.update(IN_PROCESS_ENVIRONMENT)
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'loadtest.db')}"
+        os.environ["MARKET_DATA_CACHE_DIR"] = os.path.join(tmp_dir, "market_data_cache")
+        if args.pool == "prefork":
+            os.makedirs(os.path.join(tmp_dir, "celery-results"))
+            os.environ["CELERY_RESULT_BACKEND"] = f"file://{os.path.join(tmp_dir, 'celery-results')}"
+        from celery.contrib.testing.worker import start_worker
+        from app import main, tasks
+
+        transport = httpx.ASGITransport(app=main.app)
+        queues = [tasks.BACKTEST_QUEUE, tasks.HEAVY_QUEUE]
+        with contextlib.ExitStack() as workers:
+            if args.pool == "prefork":
+                workers.enter_context(start_worker(tasks.celery_app, pool="prefork", concurrency=args.workers,
+                                                   perform_ping_check=False, hostname="loadtest@localhost", queues=queues))
+            for i in range(args.workers if args.pool == "solo" else 0):
+                workers.enter_context(start_worker(tasks.celery_app, pool="solo", perform_ping_check=False,
+                                                   hostname=f"loadtest-{i}@localhost", queues=queues))
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.http_timeout) as client:
+                return await generate_load(client, args)
+
+
+# --- Report ---
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ms = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def summarize(recorder: Recorder, elapsed: float, args) -> dict:
+    depths = {}
+    for queue in sorted({name for sample in recorder.depths for name in sample}):
+        values = [sample.get(queue, 0) for sample in recorder.depths]
+        depths[queue] = {"max": max(values), "mean": round(float(np.mean(values)), 2)}
+    total = [sum(sample.values()) for sample in recorder.depths]
+    processes = recorder.signal_processes
+    return {
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "completed": recorder.completed,
+        "failed": len(recorder.failed),
+        "failures": recorder.failed[:20],
+        "seconds": round(elapsed, 3),
+        "jobs_per_second": round(recorder.completed / elapsed, 3) if elapsed > 0 else 0,
+        "requests_per_second": round(recorder.requests / elapsed, 3) if elapsed > 0 else 0,
+        "latency": {endpoint: _percentiles(recorder.latencies[endpoint]) for endpoint in ENDPOINTS},
+        "queue_depth": {"max": max(total, default=0), "mean": round(float(np.mean(total)), 2) if total else 0, "queues": depths},
+        "signal_processes": {"min": min(processes), "max": max(processes)} if processes else None,
+    }
+
+
+def print_report(report: dict):
+    print(f"{report['completed']}/{report['requests']} jobs completed ({report['failed']} failed) in {report['seconds']}s "
+          f"against {report['target']} with {report['concurrency']} users: "
+          f"{report['jobs_per_second']} jobs/s, {report['requests_per_second']} requests/s")
+    print(f"{'endpoint':<10}{'count':>8}{'p50 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    for endpoint, stats in report["latency"].items():
+        if stats["count"]:
+            print(f"{endpoint:<10}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p99_ms']:>12}{stats['max_ms']:>12}")
+    depth = report["queue_depth"]
+    per_queue = ", ".join(f"{queue} max {d['max']}" for queue, d in depth["queues"].items())
+    print(f"Queue depth: max {depth['max']}, mean {depth['mean']}" + (f" ({per_queue})" if per_queue else ""))
+    if report["signal_processes"]:
+        print(f"Portfolio signal processes per job: min {report['signal_processes']['min']}, max {report['signal_processes']['max']}")
+    for failure in report["failures"]:
+        print(f"FAILED {failure}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Drive the backtest API at a fixed concurrency and report throughput and latency.")
+    parser.add_argument("--url", default=None, help="Base URL of a running API; omit to run everything in this process.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual users, each running one job at a time.")
+    parser.add_argument("--requests", type=int, default=100, help="Backtests to run in total.")
+    parser.add_argument("--distinct", type=int, default=0, help="Distinct request bodies to cycle through (0 = all distinct).")
+    parser.add_argument("--tickers", default=",".join(f"LOAD{i:02d}" for i in range(20)),
+                        help="Comma-separated tickers (any name works with MARKET_DATA_SOURCE=synthetic).")
+    parser.add_argument("--strategies", default="mixed", help=f"One of {STRATEGY_TYPES}, or 'mixed' to rotate through them.")
+    parser.add_argument("--ml", action="store_true", help=f"Confirm signals with {ML_MODEL_SET}/{ML_MODEL}.")
+    parser.add_argument("--interval", default="1d")
+    parser.add_argument("--start", default="2015-01-01", help="Window start of the first round of requests.")
+    parser.add_argument("--days", type=int, default=3 * 365, help="Window length in calendar days.")
+    parser.add_argument("--max-points", type=int, default=500, help="max_points of the results request (0 = full series).")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Seconds between status polls of a job.")
+    parser.add_argument("--job-timeout", type=float, default=300, help="Seconds before a job counts as failed.")
+    parser.add_argument("--http-timeout", type=float, default=60)
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between queue depth samples.")
+    parser.add_argument("--portfolio", type=int, default=0, help="Tickers per job; 0 runs single-ticker backtests.")
+    parser.add_argument("--workers", type=int, default=2, help="Workers (prefork: worker processes) of the in-process target.")
+    parser.add_argument("--pool", choices=["solo", "prefork"], default="solo", help="Worker pool of the in-process target.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+    if args.strategies != "mixed" and args.strategies not in STRATEGY_TYPES:
+        parser.error(f"Unknown strategy type: {args.strategies}")
+
+    report = asyncio.run(run_against_url(args) if args.url else run_in_process(args))
+    print_report(report)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    serial = args.portfolio > 1 and report["signal_processes"] and report["signal_processes"]["min"] < 2
+    if serial:
+        print("Portfolio signals were generated serially in some jobs (is PORTFOLIO_MAX_WORKERS > 1?).")
+    return 1 if report["failed"] or serial else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
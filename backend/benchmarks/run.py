@@ -0,0 +1,289 @@
+# benchmarks/run.py
+"""
+Offline benchmark harness for the backtesting pipeline.
+
+Runs every combination of series length, strategy type, ML confirmation
+and single/multi-ticker mode against synthetic market data and stand-in
+models, times each pipeline stage, records peak memory and compares the
+results with a saved baseline.
+
+Peak memory is the most the run allocates on top of the fetched bars
+(which live in the market data cache). The pipeline's share, up to the
+returned result, is reported as a multiple of the raw OHLCV size and
+checked against `--memory-target`; JSON serialization of the result is
+measured separately.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run                         # 1k and 100k bars
+    python -m benchmarks.run --sizes 1k,100k,10m     # include the 10M-bar cases
+    python -m benchmarks.run --save-baseline         # record a new baseline
+    python -m benchmarks.run --execution '{"commission_bps": 5, "stop_loss_pct": 2}'
+
+`--execution` applies the same execution settings to every case, so a run
+compared against a frictionless baseline shows what the execution model
+costs.
+
+Exits with status 1 when a stage regressed beyond the tolerance or a case
+exceeded the memory target.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from app import inference
+from app.artifacts import get_artifact_manager
+from app.backtester import run_simulation
+from app.market_data import OHLCV_COLUMNS, MarketDataStore, set_market_data_store
+from app.portfolio import run_portfolio_simulation
+from .synthetic import SyntheticSource, stand_in_artifacts, window_for
+
+# --- Configuration ---
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+SIZES = {"1k": 1_000, "100k": 100_000, "10m": 10_000_000}
+STRATEGY_TYPES = ["TrendFollowing", "MeanReversion", "Volatility"]
+MODES = ["single", "portfolio"]
+PORTFOLIO_TICKERS = 4
+MEMORY_TARGET = 2.0  # Pipeline peak memory as a multiple of the raw OHLCV bytes
+ML_MODEL_SET, ML_MODEL = "SetA", "Ensemble"
+
+# Progress stages reported by the simulation runners, and the pipeline stage
+# that ends when each one is reached
+STAGES = {
+    "data_fetched": "fetch",
+    "signals_computed": "signals",
+    "predictions_ready": "ml_inference",
+    "simulated": "simulation",
+    "metrics_ready": "metrics",
+    "serialized": "serialization",
+}
+
+
+# --- Cases ---
+
+def build_cases(sizes: list, strategy_types: list, ml_options: list, modes: list, execution: dict | None = None) -> list:
+    cases = []
+    for size, strategy_type, ml, mode in itertools.product(sizes, strategy_types, ml_options, modes):
+        cases.append({
+            "id": f"{mode}/{strategy_type}/{'ml' if ml else 'no-ml'}/{size}",
+            "mode": mode,
+            "strategy_type": strategy_type,
+            "ml": ml,
+            "bars": SIZES[size],
+            "size": size,
+            "execution": execution,
+        })
+    return cases
+
+
+def _run_once(case: dict, memory: dict | None = None) -> dict:
+    """
+    Runs one case and returns {stage: seconds}. Under tracemalloc, pass
+    `memory` to receive the pipeline's peak before serialization starts.
+    """
+    strategy_json = {"strategyType": case["strategy_type"]}
+    if case["ml"]:
+        strategy_json.update({"ml_model_set": ML_MODEL_SET, "ml_model": ML_MODEL})
+    if case.get("execution"):
+        strategy_json["execution"] = case["execution"]
+    start_date, end_date = window_for(case["bars"])
+
+    marks = [("start", time.perf_counter())]
+
+    def progress(stage, percent=None, **details):
+        marks.append((stage, time.perf_counter()))
+
+    inference.prediction_cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case["mode"] == "portfolio":
+            strategy_json["tickers"] = [f"SYN{case['size']}-{i}" for i in range(PORTFOLIO_TICKERS)]
+            result = run_portfolio_simulation(strategy_json, start_date, end_date, progress=progress)
+        else:
+            result = run_simulation(strategy_json, f"SYN{case['size']}", start_date, end_date, progress=progress)
+        if memory is not None:
+            memory["pipeline"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        json.dumps(result)
+    marks.append(("serialized", time.perf_counter()))
+
+    stages = {}
+    for (_, previous), (stage, now) in zip(marks, marks[1:]):
+        stages[STAGES[stage]] = now - previous
+    return stages
+
+
+def run_case(case: dict, repeat: int) -> dict:
+    _run_once(case)  # Warm-up: fills the market data cache and imports lazily loaded modules
+
+    runs = [_run_once(case) for _ in range(repeat)]
+    stages = {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]}
+    totals = [sum(run.values()) for run in runs]
+
+    # Peak memory is measured in a separate traced run, since tracing slows allocation down
+    memory = {}
+    tracemalloc.start()
+    try:
+        _run_once(case, memory)
+        _, serialization_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    peak = max(memory["pipeline"], serialization_peak)
+
+    tickers = PORTFOLIO_TICKERS if case["mode"] == "portfolio" else 1
+    raw_bytes = case["bars"] * tickers * len(OHLCV_COLUMNS) * 8
+    return {
+        "bars": case["bars"],
+        "stages": {stage: round(seconds, 6) for stage, seconds in stages.items()},
+        "total": round(statistics.median(totals), 6),
+        "total_min": round(min(totals), 6),
+        "peak_memory_mb": round(peak / 2**20, 2),
+        "raw_ohlcv_mb": round(raw_bytes / 2**20, 2),
+        "pipeline_peak_mb": round(memory["pipeline"] / 2**20, 2),
+        "serialization_peak_mb": round(serialization_peak / 2**20, 2),
+        "peak_memory_ratio": round(memory["pipeline"] / raw_bytes, 2),
+    }
+
+
+# --- Baseline Comparison ---
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta: float) -> list:
+    """
+    Returns a list of regressions: stages (or totals, or peak memory) that
+    got more than `tolerance` slower than the baseline. Timing differences
+    under `min_delta` seconds are treated as noise.
+    """
+    regressions = []
+    for case_id, result in current["cases"].items():
+        reference = baseline["cases"].get(case_id)
+        if reference is None:
+            continue
+        measured = {**result["stages"], "total": result["total"]}
+        expected = {**reference["stages"], "total": reference["total"]}
+        for stage, seconds in measured.items():
+            before = expected.get(stage)
+            if before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > min_delta:
+                regressions.append({"case": case_id, "metric": stage, "baseline": before, "current": seconds})
+
+        before_mb, current_mb = reference.get("peak_memory_mb"), result["peak_memory_mb"]
+        if before_mb and current_mb > before_mb * (1 + tolerance):
+            regressions.append({"case": case_id, "metric": "peak_memory_mb", "baseline": before_mb, "current": current_mb})
+    return regressions
+
+
+def memory_over_target(current: dict, target: float) -> list:
+    """(case, ratio) for every case whose pipeline peak memory exceeds `target` times its raw OHLCV size."""
+    if not target:
+        return []
+    return [(case_id, result["peak_memory_ratio"]) for case_id, result in current["cases"].items()
+            if result["peak_memory_ratio"] > target]
+
+
+# --- Output ---
+
+def _environment() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _print_case(case_id: str, result: dict):
+    stages = "  ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in result["stages"].items())
+    print(f"{case_id:<48} total={result['total'] * 1000:.1f}ms  peak={result['peak_memory_mb']}MB ({result['peak_memory_ratio']}x raw)  {stages}")
+
+
+def _write_json(path: str, payload: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the backtesting pipeline on synthetic data.")
+    parser.add_argument("--sizes", default="1k,100k", help=f"Comma-separated series lengths from {list(SIZES)}.")
+    parser.add_argument("--strategies", default=",".join(STRATEGY_TYPES))
+    parser.add_argument("--ml", choices=["both", "on", "off"], default="both")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline path as well.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging, as a fraction.")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Timing differences below this many seconds are ignored.")
+    parser.add_argument("--memory-target", type=float, default=MEMORY_TARGET,
+                        help="Largest allowed pipeline peak memory as a multiple of the raw OHLCV size (0 disables the check).")
+    parser.add_argument("--execution", type=json.loads, default=None,
+                        help="Execution settings (JSON) applied to every case; defaults to the frictionless model.")
+    parser.add_argument("--cache-dir", default=None, help="Market data cache directory (defaults to a temporary one).")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes.split(",")
+    unknown = set(sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"Unknown sizes: {sorted(unknown)}")
+    ml_options = {"both": [False, True], "on": [True], "off": [False]}[args.ml]
+    cases = build_cases(sizes, args.strategies.split(","), ml_options, args.modes.split(","), args.execution)
+
+    # Everything runs offline: synthetic bars and stand-in models replace yfinance and the model files
+    with tempfile.TemporaryDirectory(prefix="algo-sphere-bench-") as tmp_dir:
+        set_market_data_store(MarketDataStore(SyntheticSource(), cache_dir=args.cache_dir or tmp_dir))
+        get_artifact_manager().register(ML_MODEL_SET, stand_in_artifacts())
+
+        results = {"environment": _environment(), "repeat": args.repeat, "execution": args.execution, "cases": {}}
+        for case in cases:
+            results["cases"][case["id"]] = run_case(case, args.repeat)
+            _print_case(case["id"], results["cases"][case["id"]])
+
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    _write_json(args.output, results)
+    print(f"Results written to {args.output}")
+
+    over_target = memory_over_target(results, args.memory_target)
+    for case_id, ratio in over_target:
+        print(f"MEMORY {case_id}: pipeline peak is {ratio}x the raw OHLCV size (target {args.memory_target}x)")
+
+    if args.save_baseline:
+        _write_json(args.baseline, results)
+        print(f"Baseline written to {args.baseline}")
+        return 1 if over_target else 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to record one.")
+        return 1 if over_target else 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+    for r in regressions:
+        change = (r["current"] / r["baseline"] - 1) * 100
+        print(f"REGRESSION {r['case']} {r['metric']}: {r['baseline']} -> {r['current']} (+{change:.0f}%)")
+    if not regressions:
+        print(f"No regressions against {args.baseline}.")
+    return 1 if regressions or over_target else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# benchmarks/synthetic.py
+
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from app.market_data import OHLCV_COLUMNS, empty_bars, slice_bars
+# The stand-in models live with the app's replay mode; benchmarks import them from here
+from app.replay import StandInModel, stand_in_artifacts  # noqa: F401
+
+# --- Synthetic Market Data ---
+# Bars are generated on a fixed minute grid so that even 10M-bar series fit
+# in pandas' timestamp range. Everything is seeded, so runs are reproducible.
+
+BAR_FREQUENCY = "min"
+EPOCH = pd.Timestamp("2000-01-03")
+
+
+def synthetic_bars(n_bars: int, seed: int = 0, start: pd.Timestamp = EPOCH, freq: str = BAR_FREQUENCY) -> pd.DataFrame:
+    """Geometric random-walk OHLCV bars with a little volatility clustering."""
+    rng = np.random.default_rng(seed)
+    vol = 0.001 * np.exp(np.convolve(rng.normal(0, 0.3, n_bars), np.ones(50) / 50, mode='same'))
+    log_returns = rng.normal(0, 1, n_bars) * vol
+    close = 100 * np.exp(np.cumsum(log_returns))
+    open_ = np.empty(n_bars)
+    open_[0], open_[1:] = 100, close[:-1]
+
+    spread = np.abs(rng.normal(0, 1, n_bars)) * vol * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.integers(1_000, 100_000, n_bars).astype(np.float64)
+
+    index = pd.date_range(start, periods=n_bars, freq=freq, name='Date')
+    return pd.DataFrame(dict(zip(OHLCV_COLUMNS, (open_, high, low, close, volume))), index=index)
+
+
+def window_for(n_bars: int, freq: str = BAR_FREQUENCY):
+    """(start_date, end_date) strings covering exactly `n_bars` synthetic bars."""
+    end = EPOCH + n_bars * pd.Timedelta(1, unit=freq)
+    return EPOCH.isoformat(), end.isoformat()
+
+
+class SyntheticSource:
+    """
+    Offline market data source for `MarketDataStore`: every ticker gets its
+    own deterministic random walk starting at `EPOCH` and running up to the
+    requested end. Benchmark cases use one ticker per series length, so the
+    store never stitches walks of different lengths together.
+    """
+
+    def __init__(self, freq: str = BAR_FREQUENCY):
+        self.freq = freq
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.DataFrame:
+        n_bars = int((end - EPOCH) // pd.Timedelta(1, unit=self.freq))
+        if n_bars <= 0:
+            return empty_bars()
+        data = synthetic_bars(n_bars, seed=zlib.crc32(ticker.encode()), freq=self.freq)
+        return slice_bars(data, start, end)